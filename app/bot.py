@@ -1,28 +1,124 @@
-from telebot import TeleBot
-from telebot.storage import StateMemoryStorage
+from .config import Config, load_config
+from .engine import Engine, make_engine
+from .flood import MUTED, FloodGuard
+from .router import CallbackRouter
+from .storage import init_storage, close_storage, make_state_storage
+from .handlers import admin, broadcast, start, start_nav, profile, wallet, support, catalog, order, chat, seller
+from .broadcast import BROADCASTS
+from .ingest import Ingestor, UpdateCheckpoint
+from .metrics import METRICS, serve_metrics
+from .outbound import PRIORITY_INTERACTIVE
 
-from .config import load_config
-from .handlers import start, start_nav, profile, wallet, support, catalog, order, chat, seller
+def build_bot(cfg: Config, threaded: bool | None = None) -> Engine:
+    bot = make_engine(cfg, state_storage=make_state_storage(cfg), threaded=threaded)
+
+    # register handlers
+    router = CallbackRouter()
+    admin.register(bot, cfg)
+    broadcast.register(bot, cfg)
+    start.register(bot, cfg)
+    start_nav.register(bot, router)
+    profile.register(bot, router)
+    wallet.register(bot, router)
+    support.register(bot, router)
+    catalog.register(bot, router)
+    order.register(bot, router, cfg)
+    chat.register(bot, router, cfg)
+    seller.register(bot, router)
+    router.install(bot)
+
+    def notice(chat_id: int, kind: str, seconds: float):
+        if kind == MUTED:
+            text = f"⛔ Слишком много действий. Бот не отвечает тебе {seconds:.0f} сек."
+        else:
+            text = "⏳ Слишком часто, часть сообщений не отправлена. Подожди немного."
+        bot.submit("send_message", chat_id, text)
+
+    bot.install_flood_guard(FloodGuard(
+        rate=cfg.flood_rate,
+        window=cfg.flood_window,
+        mute=cfg.flood_mute,
+        dup_window=cfg.flood_dup_window,
+        on_notice=notice,
+        # без chat_id: ответ на нажатие не ждёт bucket чата, только общий лимит
+        on_dropped_callback=lambda callback_id: bot.submit(
+            "answer_callback_query", callback_query_id=callback_id, priority=PRIORITY_INTERACTIVE),
+    ))
+    return bot
+
+def make_webhook_server(bot: Engine, cfg: Config):
+    from .webhook import WebhookServer
+
+    return WebhookServer(
+        bot.bot,
+        host=cfg.webhook_listen,
+        port=cfg.webhook_port,
+        path=cfg.webhook_path,
+        secret=cfg.webhook_secret,
+        workers=cfg.webhook_workers,
+        queue_size=cfg.webhook_queue_size,
+    )
+
+def run_webhook(bot: Engine, cfg: Config):
+    server = make_webhook_server(bot, cfg)
+    bot.bot.remove_webhook()
+    bot.bot.set_webhook(
+        url=cfg.webhook_url,
+        secret_token=cfg.webhook_secret or None,
+        max_connections=cfg.webhook_workers,
+    )
+    print(f"Bot is running (webhook on {cfg.webhook_listen}:{cfg.webhook_port}{server.webhook_path})...")
+    try:
+        server.serve_forever()
+    finally:
+        server.stop()
+
+def run_polling(bot: Engine, cfg: Config):
+    if cfg.ingest_lanes <= 0:
+        bot.run_polling(skip_pending=True)
+        return
+    ingestor = Ingestor(
+        bot.bot,
+        UpdateCheckpoint(cfg.ingest_path, flush_interval=cfg.ingest_flush_interval),
+        lanes=cfg.ingest_lanes,
+        max_age=cfg.ingest_max_age,
+    )
+    METRICS.add_collector("ingest", lambda: [
+        ("bot_ingest_updates", {"result": k}, v) for k, v in ingestor.stats().items() if k != "offset"
+    ])
+    bot.run_ingest(ingestor)
 
 def main():
     cfg = load_config()
+    if cfg.shard_workers > 1:
+        from .shard import ShardedRunner
 
-    storage = StateMemoryStorage()
-    bot = TeleBot(cfg.bot_token, state_storage=storage)
+        print(f"Bot is running ({cfg.shard_workers} shard workers)...")
+        checkpoint = None
+        if cfg.ingest_lanes > 0:
+            checkpoint = UpdateCheckpoint(cfg.ingest_path, flush_interval=cfg.ingest_flush_interval)
+        ShardedRunner(cfg, workers=cfg.shard_workers, lanes=cfg.shard_lanes,
+                      lane_queue_size=cfg.shard_lane_queue).run_polling(
+            checkpoint=checkpoint, max_age=cfg.ingest_max_age
+        )
+        return
 
-    # register handlers
-    start.register(bot, cfg)
-    start_nav.register(bot)
-    profile.register(bot)
-    wallet.register(bot)
-    support.register(bot)
-    catalog.register(bot)
-    order.register(bot)
-    chat.register(bot)
-    seller.register(bot)
-
-    print("Bot is running...")
-    bot.infinity_polling(skip_pending=True)
+    init_storage(cfg)
+    bot = build_bot(cfg)
+    if cfg.metrics_port:
+        serve_metrics(METRICS, cfg.metrics_listen, cfg.metrics_port)
+    BROADCASTS.resume()
+
+    try:
+        if cfg.bot_mode == "webhook":
+            run_webhook(bot, cfg)
+        else:
+            print(f"Bot is running ({cfg.bot_engine})...")
+            run_polling(bot, cfg)
+    finally:
+        BROADCASTS.stop()
+        bot.stop()
+        close_storage()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,286 @@
+import dataclasses
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from .engine import Engine
+from .metrics import METRICS
+from .storage import set_blocked, user_ids_after
+
+# Массовые рассылки админов.
+# Получатели читаются из хранилища пачками по chunk_size (keyset по user_id), в памяти — только текущая
+# пачка и окно отправленных, но ещё не учтённых сообщений. Отправка — через очередь исходящих движка
+# (низкий приоритет, лимиты Telegram и повторы на 429 — там же); одновременно в очереди не больше
+# concurrency сообщений кампании.
+# Прогресс — курсор: все получатели с user_id <= cursor обработаны. Курсор двигается по порядку id,
+# поэтому после рестарта кампания продолжается с него; повторно могут уйти только сообщения, бывшие
+# в полёте в момент падения (не больше concurrency). Чекпоинт — JSON на кампанию в каталоге path.
+# Заблокировавшие бота и удалённые аккаунты помечаются is_blocked и дальше в рассылки не попадают.
+
+RUNNING = "running"
+DONE = "done"
+CANCELLED = "cancelled"
+
+
+@dataclass
+class Campaign:
+    campaign_id: str
+    admin_chat_id: int
+    text: str = ""
+    # если задано — рассылается копия этого сообщения (любой тип контента), а не text
+    from_chat_id: int = 0
+    message_id: int = 0
+    owner: int = 0  # процесс (воркер шарда), который ведёт кампанию
+    status: str = RUNNING
+    cursor: int = 0
+    sent: int = 0
+    blocked: int = 0
+    failed: int = 0
+    progress_message_id: int = 0  # сообщение у админа, которое обновляется прогрессом
+    created_at: float = 0.0
+    updated_at: float = 0.0
+    finished_at: float = 0.0
+
+    @property
+    def processed(self) -> int:
+        return self.sent + self.blocked + self.failed
+
+
+def is_unreachable(exc: BaseException) -> bool:
+    # 403: бот заблокирован / пользователь удалён; 400 chat not found — чата больше нет
+    code = getattr(exc, "error_code", None)
+    if code == 403:
+        return True
+    return code == 400 and "chat not found" in str(getattr(exc, "description", "") or exc).lower()
+
+
+class _Run:
+    __slots__ = ("campaign", "thread", "stop", "slots", "last_checkpoint", "last_progress", "started", "base")
+
+    def __init__(self, campaign: Campaign, concurrency: int, now: float):
+        self.campaign = campaign
+        self.thread: Optional[threading.Thread] = None
+        self.stop = threading.Event()
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.last_checkpoint = now
+        self.last_progress = now
+        self.started = now
+        self.base = campaign.processed  # обработано до этого запуска — для скорости
+
+
+class Broadcaster:
+    def __init__(self, chunk_size: int = 1000, concurrency: int = 50, checkpoint_interval: float = 2.0,
+                 progress_interval: float = 10.0, clock: Callable[[], float] = time.monotonic):
+        self.chunk_size = chunk_size
+        self.concurrency = concurrency
+        self.checkpoint_interval = checkpoint_interval
+        self.progress_interval = progress_interval
+        # on_progress(campaign, rate) — периодически и по завершении; rate — получателей/с в этом запуске
+        self.on_progress: Optional[Callable[[Campaign, float], None]] = None
+        self.engine: Optional[Engine] = None
+        self.path = "data/broadcast"
+        self.owner = 0
+        self._clock = clock
+        self._runs: Dict[str, _Run] = {}
+        self._lock = threading.Lock()
+
+    def bind(self, engine: Engine, path: str) -> None:
+        self.engine = engine
+        self.path = path
+        METRICS.add_collector("broadcast", self._collect)
+
+    # --- чекпоинты ---
+
+    def _file(self, campaign_id: str) -> str:
+        return os.path.join(self.path, f"{campaign_id}.json")
+
+    def _save(self, c: Campaign) -> None:
+        os.makedirs(self.path, exist_ok=True)
+        c.updated_at = time.time()
+        tmp = self._file(c.campaign_id) + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(dataclasses.asdict(c), f, ensure_ascii=False)
+        os.replace(tmp, self._file(c.campaign_id))
+
+    def _load(self, campaign_id: str) -> Optional[Campaign]:
+        try:
+            with open(self._file(campaign_id), "r", encoding="utf-8") as f:
+                return Campaign(**json.load(f))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, TypeError) as e:
+            print(f"[broadcast] checkpoint {campaign_id} is unreadable: {e!r}")
+            return None
+
+    def _load_all(self) -> List[Campaign]:
+        try:
+            names = os.listdir(self.path)
+        except FileNotFoundError:
+            return []
+        loaded = (self._load(n[:-5]) for n in names if n.endswith(".json"))
+        return [c for c in loaded if c is not None]
+
+    # --- управление ---
+
+    def start(self, admin_chat_id: int, text: str = "", from_chat_id: int = 0, message_id: int = 0,
+              progress_message_id: int = 0) -> Campaign:
+        # progress_message_id сохраняется вместе с кампанией: прогресс обновляется с первого тика и после рестарта
+        now = time.time()
+        c = Campaign(uuid.uuid4().hex[:8], admin_chat_id, text, from_chat_id, message_id, owner=self.owner,
+                     progress_message_id=progress_message_id, created_at=now, updated_at=now)
+        self._save(c)
+        self._launch(c)
+        return c
+
+    def resume(self) -> List[Campaign]:
+        # незавершённые кампании этого процесса после рестарта
+        resumed = []
+        for c in self._load_all():
+            if c.status == RUNNING and c.owner == self.owner and self._launch(c):
+                resumed.append(c)
+        return resumed
+
+    def _launch(self, c: Campaign) -> bool:
+        if self.engine is None:
+            raise RuntimeError("broadcaster is not bound to an engine")
+        with self._lock:
+            if c.campaign_id in self._runs:
+                return False
+            run = self._runs[c.campaign_id] = _Run(c, self.concurrency, self._clock())
+        run.thread = threading.Thread(target=self._run, args=(run,), name=f"broadcast-{c.campaign_id}", daemon=True)
+        run.thread.start()
+        return True
+
+    def cancel(self, campaign_id: str) -> Optional[Campaign]:
+        with self._lock:
+            run = self._runs.get(campaign_id)
+        if run is not None:
+            run.campaign.status = CANCELLED
+            run.stop.set()
+            return run.campaign
+        c = self._load(campaign_id)
+        if c is not None and c.status == RUNNING:
+            c.status = CANCELLED
+            c.finished_at = time.time()
+            self._save(c)
+        return c
+
+    def get(self, campaign_id: str) -> Optional[Campaign]:
+        with self._lock:
+            run = self._runs.get(campaign_id)
+        return run.campaign if run is not None else self._load(campaign_id)
+
+    def campaigns(self, limit: int = 10) -> List[Campaign]:
+        with self._lock:
+            live = {cid: run.campaign for cid, run in self._runs.items()}
+        merged = {c.campaign_id: c for c in self._load_all()}
+        merged.update(live)
+        return sorted(merged.values(), key=lambda c: c.created_at, reverse=True)[:limit]
+
+    def stop(self, timeout: float = 30.0) -> None:
+        # остановка процесса: кампании остаются running и продолжатся после рестарта (resume)
+        with self._lock:
+            runs = list(self._runs.values())
+        for run in runs:
+            run.stop.set()
+        for run in runs:
+            if run.thread is not None:
+                run.thread.join(timeout=timeout)
+
+    def join(self, campaign_id: str, timeout: Optional[float] = None) -> None:
+        with self._lock:
+            run = self._runs.get(campaign_id)
+        if run is not None and run.thread is not None:
+            run.thread.join(timeout)
+
+    # --- отправка ---
+
+    def _submit(self, c: Campaign, user_id: int) -> Future:
+        if c.message_id:
+            return self.engine.submit("copy_message", user_id, c.from_chat_id, c.message_id)
+        return self.engine.submit("send_message", user_id, c.text)
+
+    def _account(self, c: Campaign, window: Deque[Tuple[int, Future]], wait: bool) -> None:
+        # учесть завершённые отправки в порядке id; курсор не обгоняет незавершённые
+        while window and (wait or window[0][1].done()):
+            user_id, fut = window.popleft()
+            exc = fut.exception()
+            if exc is None:
+                c.sent += 1
+            elif is_unreachable(exc):
+                c.blocked += 1
+                set_blocked(user_id, True)
+            else:
+                c.failed += 1
+            c.cursor = user_id
+
+    def _tick(self, run: _Run, final: bool = False) -> None:
+        now = self._clock()
+        if final or now - run.last_checkpoint >= self.checkpoint_interval:
+            run.last_checkpoint = now
+            self._save(run.campaign)
+        if self.on_progress is not None and (final or now - run.last_progress >= self.progress_interval):
+            run.last_progress = now
+            rate = (run.campaign.processed - run.base) / max(now - run.started, 1e-9)
+            try:
+                self.on_progress(run.campaign, rate)
+            except Exception as e:
+                print(f"[broadcast] progress callback failed: {e!r}")
+
+    def _run(self, run: _Run) -> None:
+        c = run.campaign
+        window: Deque[Tuple[int, Future]] = deque()
+        after = c.cursor
+        try:
+            while not run.stop.is_set():
+                ids = user_ids_after(after, self.chunk_size)
+                if not ids:
+                    break
+                for user_id in ids:
+                    while not run.slots.acquire(timeout=0.5):
+                        self._account(c, window, wait=False)
+                        if run.stop.is_set():
+                            break
+                    if run.stop.is_set():
+                        break
+                    fut = self._submit(c, user_id)
+                    fut.add_done_callback(lambda _f: run.slots.release())
+                    window.append((user_id, fut))
+                    self._account(c, window, wait=False)
+                    if len(window) > 4 * self.concurrency:
+                        # первое в окне застряло (повторы 429) — ждём его, чтобы окно не росло
+                        self._account(c, window, wait=True)
+                    self._tick(run)
+                after = ids[-1]
+            self._account(c, window, wait=True)
+            if c.status == RUNNING and not run.stop.is_set():
+                c.status = DONE
+            if c.status != RUNNING:
+                c.finished_at = time.time()
+        except Exception as e:
+            # очередь исходящих остановлена, база недоступна и т.п. — продолжим с чекпоинта после рестарта
+            print(f"[broadcast] campaign {c.campaign_id} interrupted: {e!r}")
+            self._account(c, window, wait=False)
+        finally:
+            self._tick(run, final=True)
+            with self._lock:
+                self._runs.pop(c.campaign_id, None)
+
+    def _collect(self):
+        with self._lock:
+            campaigns = [run.campaign for run in self._runs.values()]
+        rows = [("bot_broadcast_running", {}, len(campaigns))]
+        for c in campaigns:
+            for key in ("sent", "blocked", "failed"):
+                rows.append(("bot_broadcast_recipients", {"campaign": c.campaign_id, "result": key}, getattr(c, key)))
+        return rows
+
+
+# рассылки процесса; движок и каталог чекпоинтов задаются в handlers.broadcast.register
+BROADCASTS = Broadcaster()
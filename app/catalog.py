@@ -0,0 +1,259 @@
+import csv
+import heapq
+import sys
+import re
+import threading
+from bisect import bisect_left, bisect_right, insort
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .models import Product
+
+# Каталог товаров с индексами в памяти, чтобы ни просмотр, ни поиск не сканировали все товары:
+# - категория -> отсортированный список (price, product_id): страницы по курсору через bisect;
+# - продавец -> множество product_id;
+# - глобальный список (price, product_id) для выборок по диапазону цены;
+# - инвертированный индекс токен -> множество product_id + отсортированный словарь токенов
+#   для поиска по префиксу последнего слова (inline-поиск по мере набора).
+# Курсор страницы — ключ последнего показанного товара в base36, помещается в 64 байта callback_data.
+# Товары хранятся в таблице products (тот же backend, что пользователи и заказы) и загружаются в индексы
+# при старте (open); наполнить таблицу из CSV: python -m app.catalog products.csv
+
+PAGE_SIZE = 10
+LOAD_BATCH = 5000
+MAX_PREFIX_TOKENS = 64
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_B36 = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+_Key = Tuple[int, int]  # (price, product_id)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN_RE.findall(text.lower()) if len(t) > 1]
+
+
+def _b36(n: int) -> str:
+    if n == 0:
+        return "0"
+    out = []
+    while n:
+        n, r = divmod(n, 36)
+        out.append(_B36[r])
+    return "".join(reversed(out))
+
+
+def encode_cursor(key: _Key) -> str:
+    return f"{_b36(key[0])}.{_b36(key[1])}"
+
+
+def decode_cursor(cursor: str) -> Optional[_Key]:
+    try:
+        price, pid = cursor.split(".", 1)
+        return int(price, 36), int(pid, 36)
+    except ValueError:
+        return None
+
+
+class Catalog:
+    def __init__(self):
+        self._products: Dict[int, Product] = {}
+        self._by_category: Dict[str, List[_Key]] = {}
+        self._by_seller: Dict[int, Set[int]] = {}
+        self._by_price: List[_Key] = []
+        self._postings: Dict[str, Set[int]] = {}
+        self._vocab: List[str] = []  # отсортированные токены из _postings
+        self.backend = None  # после open() изменения пишутся в БД
+        self._lock = threading.RLock()
+
+    def open(self, backend) -> int:
+        # загрузка всех товаров из БД пачками; возвращает число загруженных
+        with self._lock:
+            self.backend = None
+            after, loaded = 0, 0
+            while True:
+                batch = backend.load_products(after, LOAD_BATCH)
+                if not batch:
+                    break
+                self.add_many(batch)
+                after = batch[-1].product_id
+                loaded += len(batch)
+            self.backend = backend
+            return loaded
+
+    def __len__(self) -> int:
+        return len(self._products)
+
+    def get(self, product_id: int) -> Optional[Product]:
+        return self._products.get(product_id)
+
+    # --- запись ---
+
+    def add(self, p: Product) -> None:
+        with self._lock:
+            if self.backend is not None:
+                self.backend.save_products([p])
+            if p.product_id in self._products:
+                self._unindex(self._products[p.product_id])
+            self._products[p.product_id] = p
+            key = (p.price, p.product_id)
+            insort(self._by_category.setdefault(p.category, []), key)
+            self._by_seller.setdefault(p.seller_id, set()).add(p.product_id)
+            insort(self._by_price, key)
+            for t in set(tokenize(p.title + " " + p.description)):
+                ids = self._postings.get(t)
+                if ids is None:
+                    ids = self._postings[t] = set()
+                    insort(self._vocab, t)
+                ids.add(p.product_id)
+
+    def add_many(self, products: Iterable[Product]) -> None:
+        # массовая загрузка: собираем индексы и сортируем один раз вместо insort на каждый товар
+        fresh = {p.product_id: p for p in products}  # повтор product_id во входе — побеждает последний
+        with self._lock:
+            if self.backend is not None:
+                self.backend.save_products(fresh.values())
+            # старые ключи заменяемых товаров убираем, пока индексы ещё отсортированы
+            for product_id in fresh.keys() & self._products.keys():
+                self._unindex(self._products[product_id])
+            for p in fresh.values():
+                self._products[p.product_id] = p
+                key = (p.price, p.product_id)
+                self._by_category.setdefault(p.category, []).append(key)
+                self._by_seller.setdefault(p.seller_id, set()).add(p.product_id)
+                self._by_price.append(key)
+                for t in set(tokenize(p.title + " " + p.description)):
+                    self._postings.setdefault(t, set()).add(p.product_id)
+            for keys in self._by_category.values():
+                keys.sort()
+            self._by_price.sort()
+            self._vocab = sorted(self._postings)
+
+    def remove(self, product_id: int) -> Optional[Product]:
+        with self._lock:
+            p = self._products.pop(product_id, None)
+            if p is not None:
+                if self.backend is not None:
+                    self.backend.delete_product(product_id)
+                self._unindex(p)
+            return p
+
+    def _unindex(self, p: Product) -> None:
+        key = (p.price, p.product_id)
+        _sorted_remove(self._by_category.get(p.category, []), key)
+        _sorted_remove(self._by_price, key)
+        ids = self._by_seller.get(p.seller_id)
+        if ids is not None:
+            ids.discard(p.product_id)
+            if not ids:
+                del self._by_seller[p.seller_id]
+        for t in set(tokenize(p.title + " " + p.description)):
+            ids = self._postings.get(t)
+            if ids is None:
+                continue
+            ids.discard(p.product_id)
+            if not ids:
+                del self._postings[t]
+                _sorted_remove(self._vocab, t)
+
+    # --- чтение ---
+
+    def browse(self, category: str, cursor: Optional[str] = None,
+               limit: int = PAGE_SIZE) -> Tuple[List[Product], Optional[str]]:
+        # страница категории по возрастанию цены; второй элемент — курсор следующей страницы
+        with self._lock:
+            keys = self._by_category.get(category, [])
+            after = decode_cursor(cursor) if cursor else None
+            start = bisect_right(keys, after) if after else 0
+            page = keys[start:start + limit]
+            more = start + limit < len(keys)
+            items = [self._products[pid] for _, pid in page]
+        return items, (encode_cursor(page[-1]) if more and page else None)
+
+    def count(self, category: str) -> int:
+        return len(self._by_category.get(category, ()))
+
+    def by_seller(self, seller_id: int) -> List[Product]:
+        with self._lock:
+            return sorted((self._products[i] for i in self._by_seller.get(seller_id, ())),
+                          key=lambda p: p.product_id)
+
+    def price_range(self, lo: int, hi: int, limit: int = PAGE_SIZE) -> List[Product]:
+        with self._lock:
+            i = bisect_left(self._by_price, (lo, -1))
+            j = bisect_right(self._by_price, (hi, float("inf")))
+            return [self._products[pid] for _, pid in self._by_price[i:min(j, i + limit)]]
+
+    def search(self, query: str, limit: int = 20, offset: int = 0) -> List[Product]:
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        with self._lock:
+            sets: List[Set[int]] = []
+            for t in tokens[:-1]:
+                ids = self._postings.get(t)
+                if not ids:
+                    return []
+                sets.append(ids)
+            # последнее слово может быть недописано — объединяем все токены с таким префиксом
+            last = tokens[-1]
+            exact = self._postings.get(last)
+            prefixed: Set[int] = set(exact) if exact else set()
+            i = bisect_left(self._vocab, last)
+            for t in self._vocab[i:i + MAX_PREFIX_TOKENS]:
+                if not t.startswith(last):
+                    break
+                prefixed |= self._postings[t]
+            if not prefixed:
+                return []
+            sets.append(prefixed)
+            sets.sort(key=len)
+            ids = set(sets[0])
+            for s in sets[1:]:
+                ids &= s
+                if not ids:
+                    return []
+            products = self._products
+            top = heapq.nsmallest(offset + limit, ids, key=lambda i: (products[i].price, i))
+            return [products[i] for i in top[offset:]]
+
+
+def _sorted_remove(items: list, value) -> None:
+    i = bisect_left(items, value)
+    if i < len(items) and items[i] == value:
+        del items[i]
+
+
+# общий каталог процесса
+CATALOG = Catalog()
+
+
+def import_csv(path: str, backend) -> int:
+    # колонки — поля Product (product_id, seller_id, category, title, price[, description])
+    with open(path, newline="", encoding="utf-8") as f:
+        products = [
+            Product(int(row["product_id"]), int(row["seller_id"]), row["category"], row["title"],
+                    int(row["price"]), row.get("description") or "")
+            for row in csv.DictReader(f)
+        ]
+    for i in range(0, len(products), LOAD_BATCH):
+        backend.save_products(products[i:i + LOAD_BATCH])
+    return len(products)
+
+
+def main(argv: List[str]) -> int:
+    from .config import load_config
+    from .storage import make_backend
+
+    if len(argv) != 1:
+        print("usage: python -m app.catalog products.csv")
+        return 2
+    backend = make_backend(load_config())
+    try:
+        print(f"imported {import_csv(argv[0], backend)} products")
+    finally:
+        backend.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
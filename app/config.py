@@ -18,7 +18,53 @@ class Config:
     db_name: str
     db_user: str
     db_password: str
+    db_backend: str = "memory"  # memory / sqlite / postgres
+    db_path: str = "data/market_bot.sqlite3"
+    db_pool_size: int = 4
+    db_cache_size: int = 10_000
+    db_flush_interval: float = 0.5
+    fsm_backend: str = "memory"  # memory / sqlite
+    fsm_path: str = "data/fsm_states.sqlite3"
+    fsm_state_ttl: float = 24 * 3600
+    fsm_cache_ttl: float = 30.0  # 0 — доверять кэшу без ограничения (только при шардинге по user_id)
     assets_main_image_path: str = "assets/main.jpg"
+    media_cache_path: str = "data/media_cache.json"
+    bot_mode: str = "polling"  # polling / webhook
+    bot_engine: str = "sync"  # sync / async
+    http_pool_size: int = 50
+    out_global_rate: float = 30.0
+    out_chat_rate: float = 1.0
+    out_chat_burst: float = 3.0
+    out_workers: int = 8
+    out_max_retries: int = 3
+    order_confirm_timeout: float = 72 * 3600
+    order_escalate_timeout: float = 24 * 3600
+    chat_path: str = "data/chat"
+    chat_segment_size: int = 64 * 1024 * 1024
+    chat_idle_ttl: float = 1800
+    flood_rate: int = 30
+    flood_window: float = 10.0
+    flood_mute: float = 30.0
+    flood_dup_window: float = 1.0
+    broadcast_path: str = "data/broadcast"
+    broadcast_chunk_size: int = 1000
+    broadcast_concurrency: int = 50
+    ingest_lanes: int = 8  # 0 — обычный infinity_polling(skip_pending=True); для async по умолчанию 32
+    ingest_path: str = "data/update_offset.json"
+    ingest_max_age: float = 3600.0
+    ingest_flush_interval: float = 1.0
+    metrics_listen: str = "127.0.0.1"
+    metrics_port: int = 0
+    shard_workers: int = 1
+    shard_lanes: int = 4
+    shard_lane_queue: int = 100
+    webhook_url: str = ""
+    webhook_listen: str = "127.0.0.1"
+    webhook_port: int = 8443
+    webhook_path: str = "/telegram"
+    webhook_secret: str = ""
+    webhook_workers: int = 8
+    webhook_queue_size: int = 256
 
 def load_config() -> Config:
     token = os.getenv("BOT_TOKEN", "").strip()
@@ -31,6 +77,28 @@ def load_config() -> Config:
     db_name = os.getenv("DB_NAME", "").strip()
     db_user = os.getenv("DB_USER", "").strip()
     db_password = os.getenv("DB_PASSWORD", "").strip()
+    db_backend = os.getenv("DB_BACKEND", "memory").strip().lower()
+    db_path = os.getenv("DB_PATH", "data/market_bot.sqlite3").strip()
+    db_pool_size = int(os.getenv("DB_POOL_SIZE", "4").strip())
+    db_cache_size = int(os.getenv("DB_CACHE_SIZE", "10000").strip())
+    db_flush_interval = float(os.getenv("DB_FLUSH_INTERVAL", "0.5").strip())
+    fsm_backend = os.getenv("FSM_BACKEND", "memory").strip().lower()
+    if fsm_backend not in ("memory", "sqlite"):
+        raise RuntimeError(f"Unknown FSM_BACKEND: {fsm_backend!r}")
+
+    bot_mode = os.getenv("BOT_MODE", "polling").strip().lower()
+    webhook_url = os.getenv("WEBHOOK_URL", "").strip()
+    webhook_secret = os.getenv("WEBHOOK_SECRET", "").strip()
+    if bot_mode == "webhook" and not webhook_url:
+        raise RuntimeError("BOT_MODE=webhook requires WEBHOOK_URL")
+    bot_engine = os.getenv("BOT_ENGINE", "sync").strip().lower()
+    if bot_engine not in ("sync", "async"):
+        raise RuntimeError(f"Unknown BOT_ENGINE: {bot_engine!r}")
+    if bot_engine == "async" and bot_mode == "webhook":
+        raise RuntimeError("BOT_ENGINE=async поддерживается только с BOT_MODE=polling")
+    shard_workers = int(os.getenv("SHARD_WORKERS", "1").strip())
+    if shard_workers > 1 and (bot_engine != "sync" or bot_mode != "polling"):
+        raise RuntimeError("SHARD_WORKERS>1 поддерживается только с BOT_ENGINE=sync и BOT_MODE=polling")
 
     return Config(
         bot_token=token,
@@ -40,4 +108,50 @@ def load_config() -> Config:
         db_name=db_name,
         db_user=db_user,
         db_password=db_password,
+        db_backend=db_backend,
+        db_path=db_path,
+        db_pool_size=db_pool_size,
+        db_cache_size=db_cache_size,
+        db_flush_interval=db_flush_interval,
+        fsm_backend=fsm_backend,
+        fsm_path=os.getenv("FSM_PATH", "data/fsm_states.sqlite3").strip(),
+        fsm_state_ttl=float(os.getenv("FSM_STATE_TTL", str(24 * 3600)).strip()),
+        fsm_cache_ttl=float(os.getenv("FSM_CACHE_TTL", "30").strip()),
+        bot_mode=bot_mode,
+        bot_engine=bot_engine,
+        http_pool_size=int(os.getenv("HTTP_POOL_SIZE", "50").strip()),
+        out_global_rate=float(os.getenv("OUT_GLOBAL_RATE", "30").strip()),
+        out_chat_rate=float(os.getenv("OUT_CHAT_RATE", "1").strip()),
+        out_chat_burst=float(os.getenv("OUT_CHAT_BURST", "3").strip()),
+        out_workers=int(os.getenv("OUT_WORKERS", "8").strip()),
+        out_max_retries=int(os.getenv("OUT_MAX_RETRIES", "3").strip()),
+        order_confirm_timeout=float(os.getenv("ORDER_CONFIRM_TIMEOUT", str(72 * 3600)).strip()),
+        order_escalate_timeout=float(os.getenv("ORDER_ESCALATE_TIMEOUT", str(24 * 3600)).strip()),
+        chat_path=os.getenv("CHAT_PATH", "data/chat").strip(),
+        chat_segment_size=int(os.getenv("CHAT_SEGMENT_SIZE", str(64 * 1024 * 1024)).strip()),
+        chat_idle_ttl=float(os.getenv("CHAT_IDLE_TTL", "1800").strip()),
+        flood_rate=int(os.getenv("FLOOD_RATE", "30").strip()),
+        flood_window=float(os.getenv("FLOOD_WINDOW", "10").strip()),
+        flood_mute=float(os.getenv("FLOOD_MUTE", "30").strip()),
+        flood_dup_window=float(os.getenv("FLOOD_DUP_WINDOW", "1").strip()),
+        broadcast_path=os.getenv("BROADCAST_PATH", "data/broadcast").strip(),
+        broadcast_chunk_size=int(os.getenv("BROADCAST_CHUNK_SIZE", "1000").strip()),
+        broadcast_concurrency=int(os.getenv("BROADCAST_CONCURRENCY", "50").strip()),
+        # дорожки async-движка — корутины, их можно держать больше, чем потоков
+        ingest_lanes=int(os.getenv("INGEST_LANES", "32" if bot_engine == "async" else "8").strip()),
+        ingest_path=os.getenv("INGEST_PATH", "data/update_offset.json").strip(),
+        ingest_max_age=float(os.getenv("INGEST_MAX_AGE", "3600").strip()),
+        ingest_flush_interval=float(os.getenv("INGEST_FLUSH_INTERVAL", "1").strip()),
+        metrics_listen=os.getenv("METRICS_LISTEN", "127.0.0.1").strip(),
+        metrics_port=int(os.getenv("METRICS_PORT", "0").strip()),
+        shard_workers=shard_workers,
+        shard_lanes=int(os.getenv("SHARD_LANES", "4").strip()),
+        shard_lane_queue=int(os.getenv("SHARD_LANE_QUEUE", "100").strip()),
+        webhook_url=webhook_url,
+        webhook_listen=os.getenv("WEBHOOK_LISTEN", "127.0.0.1").strip(),
+        webhook_port=int(os.getenv("WEBHOOK_PORT", "8443").strip()),
+        webhook_path=os.getenv("WEBHOOK_PATH", "/telegram").strip(),
+        webhook_secret=webhook_secret,
+        webhook_workers=int(os.getenv("WEBHOOK_WORKERS", "8").strip()),
+        webhook_queue_size=int(os.getenv("WEBHOOK_QUEUE_SIZE", "256").strip()),
     )
@@ -0,0 +1,355 @@
+import asyncio
+import functools
+import inspect
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Coroutine, Optional
+
+from telebot import TeleBot, custom_filters
+from telebot.apihelper import ApiTelegramException
+
+from .config import Config
+from .flood import FloodGuard
+from .ingest import Ingestor
+from .metrics import METRICS, update_type
+from .outbound import PRIORITY_BULK, SCHEDULED_METHODS, OutboundScheduler
+
+# Движок исполнения хендлеров. Хендлеры пишутся один раз как `async def` и вызывают API через
+# `await bot.<метод>(...)`, где bot — движок:
+# - SyncEngine: обёртка над обычным TeleBot. Методы API — корутины, которые сразу выполняют
+#   блокирующий вызов и завершаются без единой приостановки, поэтому хендлер прогоняется
+#   синхронно через run_sync() прямо в потоке telebot, без event loop.
+# - AsyncEngine: AsyncTeleBot с общей пуловой aiohttp-сессией, хендлеры регистрируются как есть.
+# Отправки и правки сообщений (SCHEDULED_METHODS) в обоих движках идут через OutboundScheduler.
+# Блокирующие вызовы хранилища (БД, файлы) хендлеры делают через `await bot.run_blocking(fn, ...)`:
+# sync-движок вызывает fn сразу, async — в пуле потоков, чтобы промах кэша не останавливал event loop.
+# Хендлеры и вызовы методов бота замеряются в METRICS (см. metrics.py).
+
+AsyncHandler = Callable[..., Coroutine[Any, Any, Any]]
+
+# ошибки Bot API у sync и async клиентов — разные классы с одинаковыми полями
+try:
+    from telebot.asyncio_helper import ApiTelegramException as _AsyncApiTelegramException
+    API_ERRORS: tuple = (ApiTelegramException, _AsyncApiTelegramException)
+except ImportError:
+    API_ERRORS = (ApiTelegramException,)
+
+
+def run_sync(coro: Coroutine) -> Any:
+    try:
+        coro.send(None)
+    except StopIteration as e:
+        return e.value
+    coro.close()
+    raise RuntimeError("handler awaited real async I/O under the sync engine")
+
+
+class Engine:
+    is_async = False
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.outbound: Optional[OutboundScheduler] = None
+        self.ingestor: Optional[Ingestor] = None
+        self.flood: Optional[FloodGuard] = None
+
+    # _execute возвращает Future, а не результат (см. OutboundScheduler, nonblocking)
+    nonblocking_execute = False
+
+    def _execute(self, method: str, args: tuple, kwargs: dict) -> Any:
+        # вызывается потоками планировщика
+        raise NotImplementedError
+
+    def start_outbound(self, cfg: Config) -> OutboundScheduler:
+        self.outbound = OutboundScheduler(
+            self._execute,
+            global_rate=cfg.out_global_rate,
+            chat_rate=cfg.out_chat_rate,
+            chat_burst=cfg.out_chat_burst,
+            workers=cfg.out_workers,
+            max_retries=cfg.out_max_retries,
+            nonblocking=self.nonblocking_execute,
+        )
+        outbound = self.outbound
+        METRICS.add_collector("outbound", lambda: [
+            (f"bot_outbound_{k}", {}, v) for k, v in outbound.stats().items()
+        ])
+        return self.outbound
+
+    def submit(self, method: str, *args, priority: int = PRIORITY_BULK, **kwargs) -> Future:
+        # неблокирующая постановка (рассылки и т.п.), по умолчанию с низким приоритетом
+        if self.outbound is None:
+            raise RuntimeError("outbound scheduler is not started")
+        return self.outbound.submit(method, args, kwargs, priority=priority)
+
+    def stop(self) -> None:
+        if self.outbound is not None:
+            self.outbound.stop()
+
+    async def run_blocking(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        return fn(*args, **kwargs)
+
+    def _wrap(self, fn: AsyncHandler) -> Callable:
+        raise NotImplementedError
+
+    def install_flood_guard(self, guard: FloodGuard) -> None:
+        # фильтр ставится на process_new_updates самого бота: через него идут polling, webhook и шарды
+        raise NotImplementedError
+
+    def _watch(self, guard: FloodGuard) -> None:
+        self.flood = guard
+        METRICS.add_collector("flood", lambda: [
+            ("bot_flood_updates", {"verdict": k}, v) for k, v in guard.stats().items() if k != "users"
+        ] + [("bot_flood_tracked_users", {}, guard.stats()["users"])])
+
+    def _instrumented(self, fn: AsyncHandler) -> Callable:
+        return self._wrap(METRICS.instrument(fn, f"{fn.__module__.rsplit('.', 1)[-1]}.{fn.__name__}"))
+
+    def message_handler(self, **filters):
+        def decorator(fn: AsyncHandler) -> AsyncHandler:
+            self.bot.message_handler(**filters)(self._instrumented(fn))
+            return fn
+        return decorator
+
+    def callback_query_handler(self, **filters):
+        def decorator(fn: AsyncHandler) -> AsyncHandler:
+            self.bot.callback_query_handler(**filters)(self._instrumented(fn))
+            return fn
+        return decorator
+
+    def inline_handler(self, **filters):
+        def decorator(fn: AsyncHandler) -> AsyncHandler:
+            self.bot.inline_handler(**filters)(self._instrumented(fn))
+            return fn
+        return decorator
+
+    def run_polling(self, skip_pending: bool = True) -> None:
+        raise NotImplementedError
+
+    def run_ingest(self, ingestor: Ingestor) -> None:
+        # polling через Ingestor: чекпоинт offset и параллельный разбор очереди (см. ingest.py)
+        raise NotImplementedError
+
+    def stop_polling(self) -> None:
+        # из другого потока; run_polling/run_ingest вернётся после текущего getUpdates
+        raise NotImplementedError
+
+
+class SyncEngine(Engine):
+    def __init__(self, bot: TeleBot):
+        super().__init__(bot)
+        bot.add_custom_filter(custom_filters.StateFilter(bot))
+
+    def _execute(self, method: str, args: tuple, kwargs: dict) -> Any:
+        fn = getattr(self.bot, method)
+        return METRICS.timed_call(method, lambda: fn(*args, **kwargs))
+
+    def __getattr__(self, name: str):
+        method = getattr(self.bot, name)
+        if not callable(method):
+            return method
+
+        if name in SCHEDULED_METHODS:
+            @functools.wraps(method)
+            async def call(*args, **kwargs):
+                if self.outbound is None:
+                    return METRICS.timed_call(name, lambda: method(*args, **kwargs))
+                return self.outbound.call(name, *args, **kwargs)
+        else:
+            @functools.wraps(method)
+            async def call(*args, **kwargs):
+                return METRICS.timed_call(name, lambda: method(*args, **kwargs))
+
+        # кэшируем обёртку, чтобы не создавать её на каждый вызов
+        self.__dict__[name] = call
+        return call
+
+    def _wrap(self, fn: AsyncHandler) -> Callable:
+        @functools.wraps(fn)
+        def handler(obj):
+            return run_sync(fn(obj))
+        return handler
+
+    async def get_state_data(self, user_id: int, chat_id: int) -> dict:
+        return self.bot.current_states.get_data(chat_id, user_id) or {}
+
+    def install_flood_guard(self, guard: FloodGuard) -> None:
+        self._watch(guard)
+        bot = self.bot
+        process = bot.process_new_updates
+
+        def process_new_updates(updates):
+            allowed = []
+            for u in updates:
+                METRICS.inc("bot_updates_total", "type", update_type(u))
+                state = None
+                if guard.needs_state(u):
+                    state = bot.current_states.get_state(u.message.chat.id, u.message.from_user.id)
+                if guard.check(u, state):
+                    allowed.append(u)
+            if allowed:
+                process(allowed)
+            # отброшенные апдейты тоже подтверждаем, иначе polling получит их снова
+            if updates:
+                bot.last_update_id = max(bot.last_update_id, updates[-1].update_id)
+
+        bot.process_new_updates = process_new_updates
+
+    def run_polling(self, skip_pending: bool = True) -> None:
+        self.bot.infinity_polling(skip_pending=skip_pending)
+
+    def run_ingest(self, ingestor: Ingestor) -> None:
+        self.ingestor = ingestor
+        ingestor.run()
+
+    def stop_polling(self) -> None:
+        if self.ingestor is not None:
+            self.ingestor.stop()
+        self.bot.stop_polling()
+
+
+class AsyncEngine(Engine):
+    is_async = True
+
+    def __init__(self, bot):
+        super().__init__(bot)
+        from telebot import asyncio_filters
+
+        class StateFilter(asyncio_filters.StateFilter):
+            # states.py использует sync-класс State, async-фильтр узнаёт только свой — сравниваем по имени
+            async def check(self, message, text):
+                if isinstance(text, list):
+                    text = [getattr(i, "name", i) for i in text]
+                else:
+                    text = getattr(text, "name", text)
+                return await super().check(message, text)
+
+        bot.add_custom_filter(StateFilter(bot))
+        self._loop_ready = threading.Event()
+        self._stopping = threading.Event()
+        self._polling_task: Optional[asyncio.Future] = None
+
+    _loop: Optional[asyncio.AbstractEventLoop] = None
+    # поток планировщика не ждёт ответа: запрос выполняется в event loop, в полёте их сколько угодно
+    nonblocking_execute = True
+
+    def _execute(self, method: str, args: tuple, kwargs: dict) -> Future:
+        fn = getattr(self.bot, method)
+        if self._loop is None:
+            # submit() до запуска polling (возобновлённые рассылки, таймеры заказов) ждёт event loop
+            self._loop_ready.wait()
+        return asyncio.run_coroutine_threadsafe(METRICS.timed_await(method, fn(*args, **kwargs)), self._loop)
+
+    def __getattr__(self, name: str):
+        attr = getattr(self.bot, name)
+        if name in SCHEDULED_METHODS:
+            method = attr
+
+            @functools.wraps(method)
+            async def call(*args, **kwargs):
+                if self.outbound is None:
+                    return await METRICS.timed_await(name, method(*args, **kwargs))
+                self._loop = asyncio.get_running_loop()
+                return await asyncio.wrap_future(self.outbound.submit(name, args, kwargs))
+            attr = call
+        elif inspect.iscoroutinefunction(attr):
+            method = attr
+
+            @functools.wraps(method)
+            async def call(*args, **kwargs):
+                return await METRICS.timed_await(name, method(*args, **kwargs))
+            attr = call
+        self.__dict__[name] = attr
+        return attr
+
+    def _wrap(self, fn: AsyncHandler) -> Callable:
+        return fn
+
+    async def run_blocking(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        return await asyncio.to_thread(fn, *args, **kwargs)
+
+    async def get_state_data(self, user_id: int, chat_id: int) -> dict:
+        return await self.bot.current_states.get_data(chat_id, user_id) or {}
+
+    def install_flood_guard(self, guard: FloodGuard) -> None:
+        self._watch(guard)
+        bot = self.bot
+        process = bot.process_new_updates
+
+        async def process_new_updates(updates):
+            allowed = []
+            for u in updates:
+                METRICS.inc("bot_updates_total", "type", update_type(u))
+                state = None
+                if guard.needs_state(u):
+                    state = await bot.current_states.get_state(u.message.chat.id, u.message.from_user.id)
+                if guard.check(u, state):
+                    allowed.append(u)
+            if allowed:
+                await process(allowed)
+
+        bot.process_new_updates = process_new_updates
+
+    def _serve(self, polling: Coroutine) -> None:
+        # polling — отменяемая задача: stop_polling() из другого потока отменяет её, прерывая и ожидание getUpdates
+        async def run():
+            # нужен для submit() из посторонних потоков до первого вызова API из хендлера
+            self._loop = asyncio.get_running_loop()
+            self._loop_ready.set()
+            self._polling_task = asyncio.ensure_future(polling)
+            if self._stopping.is_set():
+                self._polling_task.cancel()
+            try:
+                await self._polling_task
+            except asyncio.CancelledError:
+                pass
+            finally:
+                await self.bot.close_session()
+
+        asyncio.run(run())
+
+    def run_polling(self, skip_pending: bool = True) -> None:
+        self._serve(self.bot.infinity_polling(skip_pending=skip_pending))
+
+    def run_ingest(self, ingestor: Ingestor) -> None:
+        self.ingestor = ingestor
+        self._serve(ingestor.run_async())
+
+    def stop_polling(self) -> None:
+        self._stopping.set()
+        if self.ingestor is not None:
+            # дорожки дорабатывают взятое, остальное остаётся в чекпоинте
+            self.ingestor.stop()
+        task, loop = self._polling_task, self._loop
+        if task is not None and loop is not None:
+            loop.call_soon_threadsafe(task.cancel)
+
+
+def make_engine(cfg: Config, state_storage=None, threaded: Optional[bool] = None) -> Engine:
+    # state_storage — синхронный StateStorageBase; для async-движка оборачивается автоматически.
+    # threaded=False — хендлеры выполняются в потоке вызывающего process_new_updates
+    if cfg.bot_engine == "async":
+        try:
+            from telebot import asyncio_helper
+            from telebot.async_telebot import AsyncTeleBot
+            from telebot.asyncio_storage import StateMemoryStorage as AsyncStateMemoryStorage
+        except ImportError as e:
+            raise RuntimeError("BOT_ENGINE=async требует пакет aiohttp (pip install aiohttp)") from e
+        # одна aiohttp-сессия на процесс, размер пула соединений — из конфига
+        asyncio_helper.REQUEST_LIMIT = cfg.http_pool_size
+        if state_storage is not None:
+            from .storage.fsm import make_async_state_storage
+            state_storage = make_async_state_storage(state_storage)
+        engine = AsyncEngine(AsyncTeleBot(cfg.bot_token, state_storage=state_storage or AsyncStateMemoryStorage()))
+        engine.start_outbound(cfg)
+        return engine
+
+    from telebot.storage import StateMemoryStorage
+    if threaded is None:
+        # в webhook-режиме хендлеры выполняет наш пул воркеров, при polling через Ingestor — его дорожки;
+        # собственный пул telebot нужен только обычному infinity_polling
+        threaded = cfg.bot_mode != "webhook" and cfg.ingest_lanes <= 0
+    bot = TeleBot(cfg.bot_token, state_storage=state_storage or StateMemoryStorage(), threaded=threaded)
+    engine = SyncEngine(bot)
+    engine.start_outbound(cfg)
+    return engine
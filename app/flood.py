@@ -0,0 +1,174 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+from telebot.types import Update
+
+from .states import ChatStates, SupportStates
+
+# Защита от флуда до диспетчеризации: апдейт отбрасывается ещё в потоке приёма,
+# не занимая воркер хендлера и не порождая вызовов API.
+# - повтор того же callback_data (или того же inline-запроса) в пределах dup_window схлопывается;
+# - общий лимит апдейтов на пользователя в скользящем окне; превышение — мьют,
+#   каждый следующий мьют вдвое длиннее (до MAX_MUTE);
+# - отдельные лимиты на сообщения в состояниях с "дорогими" хендлерами (поддержка, чат).
+# Отброшенному нажатию кнопки отвечаем пустым answer_callback_query (on_dropped_callback), чтобы у клиента
+# не крутились "часики" до таймаута Telegram, — не чаще раза в answer_interval на пользователя.
+# Окно — приближённое скользящее: счётчики текущего и прошлого интервала, прошлый учитывается
+# с весом оставшейся доли. На пользователя — один объект со слотами, всего не больше max_users (LRU).
+
+MAX_MUTE = 3600.0
+
+# имя состояния -> (сообщений, за секунд)
+STATE_LIMITS: Dict[str, Tuple[int, float]] = {
+    SupportStates.waiting_message.name: (3, 60.0),
+    ChatStates.chatting.name: (20, 10.0),
+}
+
+MUTED = "muted"
+THROTTLED = "throttled"
+
+
+class _Window:
+    __slots__ = ("start", "prev", "curr")
+
+    def __init__(self, now: float):
+        self.start = now
+        self.prev = 0
+        self.curr = 0
+
+    def hit(self, now: float, window: float, limit: int) -> bool:
+        # True — событие укладывается в лимит (и учтено)
+        periods = int((now - self.start) // window)
+        if periods:
+            self.prev = self.curr if periods == 1 else 0
+            self.curr = 0
+            self.start += periods * window
+        weight = 1.0 - (now - self.start) / window
+        if self.prev * weight + self.curr >= limit:
+            return False
+        self.curr += 1
+        return True
+
+
+class _UserFlood:
+    __slots__ = ("window", "state", "state_window", "muted_until", "strikes", "last_key", "last_at",
+                 "noticed_at", "answered_at")
+
+    def __init__(self, now: float):
+        self.window = _Window(now)
+        self.state: Optional[str] = None
+        self.state_window: Optional[_Window] = None
+        self.muted_until = 0.0
+        self.strikes = 0
+        self.last_key: Optional[str] = None
+        self.last_at = 0.0
+        self.noticed_at = float("-inf")
+        self.answered_at = float("-inf")
+
+
+def subject_of(update: Update) -> Optional[Tuple[int, int, Optional[str]]]:
+    # (user_id, chat_id, ключ для схлопывания повторов) или None — апдейт не от пользователя
+    if update.callback_query is not None:
+        c = update.callback_query
+        chat_id = c.message.chat.id if c.message is not None else c.from_user.id
+        return c.from_user.id, chat_id, "cb:" + (c.data or "")
+    if update.inline_query is not None:
+        q = update.inline_query
+        return q.from_user.id, q.from_user.id, f"iq:{q.query}:{q.offset}"
+    m = update.message or update.edited_message
+    if m is not None and m.from_user is not None:
+        return m.from_user.id, m.chat.id, None
+    return None
+
+
+class FloodGuard:
+    def __init__(self, rate: int = 30, window: float = 10.0, mute: float = 30.0, dup_window: float = 1.0,
+                 state_limits: Optional[Dict[str, Tuple[int, float]]] = None, max_users: int = 100_000,
+                 on_notice: Optional[Callable[[int, str, float], None]] = None,
+                 on_dropped_callback: Optional[Callable[[str], None]] = None, answer_interval: float = 1.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.window = window
+        self.mute = mute
+        self.dup_window = dup_window
+        self.state_limits = STATE_LIMITS if state_limits is None else state_limits
+        self.max_users = max_users
+        # on_notice(chat_id, MUTED/THROTTLED, секунд) — не чаще раза в окно на пользователя
+        self.on_notice = on_notice
+        # on_dropped_callback(callback_query_id) — погасить "часики" отброшенного нажатия
+        self.on_dropped_callback = on_dropped_callback
+        self.answer_interval = answer_interval
+        self._clock = clock
+        self._users: "OrderedDict[int, _UserFlood]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters: Dict[str, int] = {"passed": 0, "duplicate": 0, "muted": 0, "rate": 0, "state": 0}
+
+    def _user(self, user_id: int, now: float) -> _UserFlood:
+        u = self._users.get(user_id)
+        if u is None:
+            u = self._users[user_id] = _UserFlood(now)
+            if len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(user_id)
+        return u
+
+    def _notice(self, u: _UserFlood, chat_id: int, kind: str, seconds: float, now: float) -> None:
+        if self.on_notice is not None and now - u.noticed_at >= self.window:
+            u.noticed_at = now
+            self.on_notice(chat_id, kind, seconds)
+
+    def _drop(self, u: _UserFlood, update: Update, now: float) -> bool:
+        # под _lock; всегда False — апдейт отброшен
+        if (self.on_dropped_callback is not None and update.callback_query is not None
+                and now - u.answered_at >= self.answer_interval):
+            u.answered_at = now
+            self.on_dropped_callback(update.callback_query.id)
+        return False
+
+    def check(self, update: Update, state: Optional[str] = None) -> bool:
+        # state — текущее FSM-состояние отправителя, нужно только для сообщений (см. needs_state)
+        subject = subject_of(update)
+        if subject is None:
+            return True
+        user_id, chat_id, key = subject
+        now = self._clock()
+        with self._lock:
+            u = self._user(user_id, now)
+            if now < u.muted_until:
+                self.counters["muted"] += 1
+                return self._drop(u, update, now)
+            if key is not None:
+                if key == u.last_key and now - u.last_at < self.dup_window:
+                    u.last_at = now
+                    self.counters["duplicate"] += 1
+                    return self._drop(u, update, now)
+                u.last_key, u.last_at = key, now
+            if self.rate > 0 and not u.window.hit(now, self.window, self.rate):
+                if now - u.muted_until > MAX_MUTE:
+                    u.strikes = 0  # давно не нарушал — начинаем с короткого мьюта
+                u.strikes += 1
+                seconds = min(self.mute * 2 ** (u.strikes - 1), MAX_MUTE)
+                u.muted_until = now + seconds
+                self.counters["rate"] += 1
+                self._notice(u, chat_id, MUTED, seconds, now)
+                return self._drop(u, update, now)
+            limit = self.state_limits.get(state) if state is not None else None
+            if limit is not None:
+                if u.state != state or u.state_window is None:
+                    u.state, u.state_window = state, _Window(now)
+                if not u.state_window.hit(now, limit[1], limit[0]):
+                    self.counters["state"] += 1
+                    self._notice(u, chat_id, THROTTLED, limit[1], now)
+                    return False
+            self.counters["passed"] += 1
+            return True
+
+    def needs_state(self, update: Update) -> bool:
+        return bool(self.state_limits) and update.message is not None and update.message.from_user is not None
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.counters, users=len(self._users))
@@ -0,0 +1,54 @@
+import io
+
+from telebot.types import Message
+
+from ..config import Config
+from ..engine import Engine
+from ..metrics import METRICS
+
+# Админские команды наблюдаемости (только Config.admin_ids):
+# /stats — сводка метрик; /profile on [мс] | off | dump — сэмплирующий профайлер медленных хендлеров.
+# Админские команды (и рассылок из broadcast.py) от остальных отклоняются здесь же, а не проваливаются
+# в хендлеры состояний: иначе "/stats" в чате с продавцом ушёл бы собеседнику.
+
+ADMIN_COMMANDS = ["stats", "profile", "broadcast", "broadcasts", "broadcast_cancel"]
+
+
+def register(bot: Engine, cfg: Config):
+    admins = frozenset(cfg.admin_ids)
+
+    def is_admin(m: Message) -> bool:
+        return m.from_user is not None and m.from_user.id in admins
+
+    @bot.message_handler(commands=["stats"], func=is_admin)
+    async def cmd_stats(m: Message):
+        await bot.send_message(m.chat.id, METRICS.summary()[:4000])
+
+    @bot.message_handler(commands=["profile"], func=is_admin)
+    async def cmd_profile(m: Message):
+        args = (m.text or "").split()[1:]
+        action = args[0] if args else "dump"
+        if action == "on":
+            threshold_ms = float(args[1]) if len(args) > 1 and args[1].isdigit() else 200.0
+            METRICS.start_profiler(threshold=threshold_ms / 1000)
+            await bot.send_message(m.chat.id, f"🔬 Профайлер включён, порог {threshold_ms:.0f} мс.")
+        elif action == "off":
+            profiler = METRICS.stop_profiler()
+            text = profiler.dump() if profiler is not None else "Профайлер не был включён."
+            await send_dump(m.chat.id, "🔬 Профайлер выключен.\n\n" + text)
+        elif METRICS.profiler is not None:
+            await send_dump(m.chat.id, METRICS.profiler.dump())
+        else:
+            await bot.send_message(m.chat.id, "Профайлер выключен: /profile on [порог, мс]")
+
+    @bot.message_handler(commands=ADMIN_COMMANDS, func=lambda m: not is_admin(m))
+    async def cmd_not_admin(m: Message):
+        await bot.send_message(m.chat.id, "⛔ Команда доступна только администраторам.")
+
+    async def send_dump(chat_id: int, text: str):
+        if len(text) <= 4000:
+            await bot.send_message(chat_id, text)
+            return
+        doc = io.BytesIO(text.encode("utf-8"))
+        doc.name = "slow_handlers.txt"
+        await bot.send_document(chat_id, doc)
@@ -0,0 +1,76 @@
+from telebot.types import Message
+
+from ..broadcast import BROADCASTS, RUNNING, Campaign
+from ..config import Config
+from ..engine import Engine
+from ..outbound import PRIORITY_INTERACTIVE
+
+# Рассылки (только Config.admin_ids):
+# /broadcast <текст> — разослать текст всем; /broadcast ответом на сообщение — разослать его копию;
+# /broadcasts — последние кампании; /broadcast_cancel <id> — остановить кампанию.
+# Прогресс обновляется в сообщении, которое бот присылает при запуске.
+
+STATUS_TITLES = {RUNNING: "идёт", "done": "завершена", "cancelled": "отменена"}
+
+
+def progress_text(c: Campaign, rate: float = 0.0) -> str:
+    text = (
+        f"📣 Рассылка `{c.campaign_id}`: {STATUS_TITLES.get(c.status, c.status)}\n"
+        f"Доставлено: {c.sent}, заблокировали бота: {c.blocked}, ошибки: {c.failed}"
+    )
+    if c.status == RUNNING and rate > 0:
+        text += f"\nСкорость: {rate:.1f}/с"
+    return text
+
+
+def register(bot: Engine, cfg: Config):
+    admins = frozenset(cfg.admin_ids)
+    BROADCASTS.chunk_size = cfg.broadcast_chunk_size
+    BROADCASTS.concurrency = cfg.broadcast_concurrency
+    BROADCASTS.bind(bot, cfg.broadcast_path)
+
+    def on_progress(c: Campaign, rate: float):
+        if c.progress_message_id:
+            bot.submit("edit_message_text", progress_text(c, rate), c.admin_chat_id, c.progress_message_id,
+                       parse_mode="Markdown", priority=PRIORITY_INTERACTIVE)
+        if c.status != RUNNING:
+            bot.submit("send_message", c.admin_chat_id, f"📣 Рассылка `{c.campaign_id}` "
+                       f"{STATUS_TITLES.get(c.status, c.status)}.", parse_mode="Markdown",
+                       priority=PRIORITY_INTERACTIVE)
+
+    BROADCASTS.on_progress = on_progress
+
+    def is_admin(m: Message) -> bool:
+        return m.from_user is not None and m.from_user.id in admins
+
+    @bot.message_handler(commands=["broadcast"], func=is_admin)
+    async def cmd_broadcast(m: Message):
+        text = (m.text or "").partition(" ")[2].strip()
+        source = m.reply_to_message
+        if source is None and not text:
+            await bot.send_message(m.chat.id, "Использование: /broadcast <текст> или ответом на сообщение для рассылки.")
+            return
+        # сообщение прогресса — до запуска, чтобы его id попал в кампанию раньше первого тика
+        msg = await bot.send_message(m.chat.id, "📣 Рассылка запускается…")
+        if source is not None:
+            c = BROADCASTS.start(m.chat.id, from_chat_id=m.chat.id, message_id=source.message_id,
+                                 progress_message_id=msg.message_id)
+        else:
+            c = BROADCASTS.start(m.chat.id, text=text, progress_message_id=msg.message_id)
+        bot.submit("edit_message_text", progress_text(c), m.chat.id, msg.message_id, parse_mode="Markdown",
+                   priority=PRIORITY_INTERACTIVE)
+
+    @bot.message_handler(commands=["broadcasts"], func=is_admin)
+    async def cmd_broadcasts(m: Message):
+        campaigns = BROADCASTS.campaigns()
+        text = "\n\n".join(progress_text(c) for c in campaigns) or "Рассылок ещё не было."
+        await bot.send_message(m.chat.id, text, parse_mode="Markdown")
+
+    @bot.message_handler(commands=["broadcast_cancel"], func=is_admin)
+    async def cmd_broadcast_cancel(m: Message):
+        campaign_id = (m.text or "").partition(" ")[2].strip()
+        c = BROADCASTS.cancel(campaign_id) if campaign_id.isalnum() else None
+        if c is None:
+            await bot.send_message(m.chat.id, "Рассылка не найдена: /broadcast_cancel <id> (см. /broadcasts)")
+            return
+        await bot.send_message(m.chat.id, progress_text(c), parse_mode="Markdown")
@@ -1,12 +1,42 @@
-from telebot import TeleBot
-from telebot.types import CallbackQuery
-from ..callbacks import unpack, Cb
-
-def register(bot: TeleBot):
-
-    @bot.callback_query_handler(func=lambda c: c.data and c.data.startswith(Cb.CAT + ":"))
-    def open_category(c: CallbackQuery):
-        parts = unpack(c.data)
-        code = parts[1] if len(parts) > 1 else "??"
-        bot.answer_callback_query(c.id)
-        bot.send_message(c.message.chat.id, f"📦 Категория {code}. (Заглушка) Тут будет список товаров/фильтры.")
+from telebot.types import CallbackQuery, InlineQuery, InlineQueryResultArticle, InputTextMessageContent
+from ..callbacks import Cb
+from ..catalog import CATALOG
+from ..engine import Engine
+from ..keyboards import catalog_page_kb
+from ..router import CallbackRouter
+from ..storage import storage_backend
+
+INLINE_PAGE = 20
+
+def register(bot: Engine, router: CallbackRouter):
+    # каталог загружается из общей БД; каждый воркер шарда держит свои индексы
+    CATALOG.open(storage_backend())
+
+    @router.route(Cb.CAT)
+    async def open_category(c: CallbackQuery, code: str = "??", cursor: str = "", *_):
+        items, next_cursor = CATALOG.browse(code, cursor or None)
+        await bot.answer_callback_query(c.id)
+        if not items:
+            text = f"📦 Категория {code}: пока нет товаров."
+        else:
+            lines = [f"📦 Категория {code} ({CATALOG.count(code)} шт.)", ""]
+            lines += [f"• {p.title} — {p.price}" for p in items]
+            text = "\n".join(lines)
+        buy = tuple((p.product_id, f"{p.title} — {p.price}") for p in items)
+        await bot.send_message(c.message.chat.id, text, reply_markup=catalog_page_kb(code, next_cursor, buy))
+
+    @bot.inline_handler(func=lambda q: True)
+    async def inline_search(q: InlineQuery):
+        offset = int(q.offset) if q.offset.isdigit() else 0
+        found = CATALOG.search(q.query, limit=INLINE_PAGE, offset=offset)
+        results = [
+            InlineQueryResultArticle(
+                id=str(p.product_id),
+                title=f"{p.title} — {p.price}",
+                description=p.description[:100] or p.category,
+                input_message_content=InputTextMessageContent(f"{p.title}\nЦена: {p.price}\nКатегория: {p.category}"),
+            )
+            for p in found
+        ]
+        next_offset = str(offset + INLINE_PAGE) if len(found) == INLINE_PAGE else ""
+        await bot.answer_inline_query(q.id, results, cache_time=5, is_personal=False, next_offset=next_offset)
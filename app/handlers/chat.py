@@ -1,25 +1,123 @@
-from telebot import TeleBot
+import time
+
 from telebot.types import CallbackQuery, Message
 from ..callbacks import Cb
+from ..config import Config
+from ..engine import API_ERRORS, Engine
+from ..keyboards import chat_kb
+from ..orders import ORDERS
+from ..relay import RELAY, Room
+from ..router import CallbackRouter
 from ..states import ChatStates
+from ..storage import append_chat_message, chat_history, chat_reply_room
+
+# Прямой чат покупатель <-> продавец внутри бота.
+# Покупатель в состоянии chatting пишет в свою текущую комнату, получатель отвечает реплаем
+# на доставленную копию. Сообщения пересылаются copy_message (любой тип контента),
+# в историю пишется текст/подпись или тип вложения.
+
+RELAYED_CONTENT = ["text", "photo", "document", "video", "voice", "audio", "sticker", "animation", "video_note"]
+HISTORY_LIMIT = 20
+
+
+def _history_text(m: Message) -> str:
+    return m.text or m.caption or f"[{m.content_type}]"
+
+
+def register(bot: Engine, router: CallbackRouter, cfg: Config):
+    RELAY.idle_ttl = cfg.chat_idle_ttl
+    RELAY.resolve_reply = chat_reply_room
 
-# Каркас "прямого чата" внутри бота.
-# Реальная логика: комнаты, маршрутизация buyer<->seller, хранение сообщений/контекстов, антиспам.
+    async def enter_chat(user_id: int, chat_id: int, room: Room):
+        await bot.set_state(user_id, ChatStates.chatting, chat_id)
+        # ключ комнаты в данных состояния: вытесненная из памяти комната откроется заново
+        await bot.add_data(user_id, chat_id, room=list(room.key))
 
-def register(bot: TeleBot):
+    async def relay(m: Message, room: Room):
+        peer = room.peer(m.from_user.id)
+        try:
+            copy = await bot.copy_message(peer, m.chat.id, m.message_id)
+        except API_ERRORS:
+            await bot.send_message(m.chat.id, "⚠️ Не удалось доставить сообщение: собеседник ещё не запускал бота.")
+            return
+        RELAY.delivered(room, peer, copy.message_id)
+        await bot.run_blocking(append_chat_message, room.key, m.from_user.id, _history_text(m), copy.message_id)
 
-    @bot.callback_query_handler(func=lambda c: c.data and c.data.startswith(Cb.CHAT + ":start"))
-    def chat_start(c: CallbackQuery):
-        bot.answer_callback_query(c.id)
-        bot.send_message(c.message.chat.id, "💬 Введи ID продавца (заглушка).")
-        bot.set_state(c.from_user.id, ChatStates.waiting_seller_id, c.message.chat.id)
+    @router.route(Cb.CHAT, "start")
+    async def chat_start(c: CallbackQuery):
+        await bot.answer_callback_query(c.id)
+        await bot.set_state(c.from_user.id, ChatStates.waiting_seller_id, c.message.chat.id)
+        await bot.send_message(c.message.chat.id, "💬 Введи ID продавца.")
+
+    @router.route(Cb.CHAT, "order", args=(int,))
+    async def chat_order(c: CallbackQuery, order_id: int):
+        order = await bot.run_blocking(ORDERS.get, order_id)
+        if order is None or c.from_user.id not in (order.buyer_id, order.seller_id):
+            await bot.answer_callback_query(c.id, "Заказ не найден.", show_alert=True)
+            return
+        await bot.answer_callback_query(c.id)
+        room = RELAY.open(c.from_user.id, order.buyer_id, order.seller_id, order_id)
+        await enter_chat(c.from_user.id, c.message.chat.id, room)
+        await bot.send_message(c.message.chat.id, f"✅ Чат по заказу {order_id} открыт. Пиши сообщение.",
+                               reply_markup=chat_kb())
 
     @bot.message_handler(state=ChatStates.waiting_seller_id, content_types=["text"])
-    def chat_get_seller(m: Message):
-        seller_id = m.text.strip()
-        bot.set_state(m.from_user.id, ChatStates.chatting, m.chat.id)
-        bot.send_message(m.chat.id, f"✅ Чат с продавцом {seller_id} открыт. (Заглушка) Пиши сообщение.")
-
-    @bot.message_handler(state=ChatStates.chatting, content_types=["text"])
-    def chat_forward(m: Message):
-        bot.send_message(m.chat.id, "📨 (Заглушка) Сообщение было бы отправлено продавцу/в чат-комнату.")
+    async def chat_get_seller(m: Message):
+        text = m.text.strip()
+        if not text.isdigit() or int(text) == m.from_user.id:
+            await bot.send_message(m.chat.id, "ID продавца — число, и это не твой ID.")
+            return
+        seller_id = int(text)
+        room = RELAY.open(m.from_user.id, m.from_user.id, seller_id)
+        await enter_chat(m.from_user.id, m.chat.id, room)
+        await bot.send_message(m.chat.id, f"✅ Чат с продавцом {seller_id} открыт. Пиши сообщение.",
+                               reply_markup=chat_kb())
+
+    def is_chat_reply(m: Message) -> bool:
+        return m.reply_to_message is not None and RELAY.for_reply(m.chat.id, m.reply_to_message.message_id) is not None
+
+    if bot.is_async:
+        # маршрута нет в памяти — он ищется в истории на диске, не на event loop
+        async def reply_filter(m: Message) -> bool:
+            if m.reply_to_message is None:
+                return False
+            if RELAY.known_reply(m.chat.id, m.reply_to_message.message_id):
+                return is_chat_reply(m)
+            return await bot.run_blocking(is_chat_reply, m)
+    else:
+        reply_filter = is_chat_reply
+
+    @bot.message_handler(func=reply_filter, content_types=RELAYED_CONTENT)
+    async def chat_reply(m: Message):
+        room = RELAY.for_reply(m.chat.id, m.reply_to_message.message_id)
+        if room is not None:
+            await relay(m, room)
+
+    @bot.message_handler(state=ChatStates.chatting, content_types=RELAYED_CONTENT)
+    async def chat_forward(m: Message):
+        room = RELAY.room_of(m.from_user.id)
+        if room is None:
+            key = (await bot.get_state_data(m.from_user.id, m.chat.id)).get("room")
+            if not key:
+                await bot.delete_state(m.from_user.id, m.chat.id)
+                await bot.send_message(m.chat.id, "Чат закрыт, открой его заново из профиля.")
+                return
+            room = RELAY.open(m.from_user.id, *key)
+        await relay(m, room)
+
+    @router.route(Cb.CHAT, "history")
+    async def chat_show_history(c: CallbackQuery):
+        await bot.answer_callback_query(c.id)
+        room = RELAY.room_of(c.from_user.id)
+        records = await bot.run_blocking(chat_history, room.key, HISTORY_LIMIT) if room is not None else []
+        if not records:
+            await bot.send_message(c.message.chat.id, "История пуста.")
+            return
+        lines = [
+            f"{time.strftime('%d.%m %H:%M', time.localtime(r.ts))} "
+            f"{'ты' if r.sender_id == c.from_user.id else 'собеседник'}: {r.text}"
+            for r in reversed(records)
+        ]
+        # лимит сообщения Telegram — 4096 символов, старые строки отбрасываем
+        text = "\n".join(lines)[-3900:]
+        await bot.send_message(c.message.chat.id, "📜 История чата\n\n" + text)
@@ -1,13 +1,122 @@
-from telebot import TeleBot
 from telebot.types import CallbackQuery
-from ..callbacks import unpack, Cb
+from ..callbacks import Cb
+from ..catalog import CATALOG
+from ..config import Config
+from ..engine import Engine
+from ..keyboards import dispute_kb, my_orders_kb, order_kb
+from ..models import Order
+from ..orders import AUTO_CONFIRMED, DISPUTE, ORDERS, OrderError
+from ..render import show_screen
+from ..router import CallbackRouter
+from ..storage import InsufficientFunds, owns_user, storage_backend
 
-def register(bot: TeleBot):
+ORDER_ACTIONS = ("pay", "cancel", "delivered", "confirm", "dispute", "refund", "release")
+MY_ORDERS_PAGE = 10
 
-    @bot.callback_query_handler(func=lambda c: c.data and c.data.startswith(Cb.ORD + ":"))
-    def order_actions(c: CallbackQuery):
-        parts = unpack(c.data)
-        action = parts[1] if len(parts) > 1 else "unknown"
-        order_id = parts[2] if len(parts) > 2 else "?"
-        bot.answer_callback_query(c.id)
-        bot.send_message(c.message.chat.id, f"🧾 Заказ {order_id}, действие={action}. (Заглушка) Тут будет смена статуса/эскроу.")
+STATUS_TITLES = {
+    "created": "создан",
+    "paid": "оплачен",
+    "delivered": "доставлен",
+    "confirmed": "выполнен",
+    "dispute": "спор",
+    "refunded": "возврат покупателю",
+    "cancelled": "отменён",
+}
+
+
+def _status(order: Order) -> str:
+    title = STATUS_TITLES.get(order.status, order.status)
+    return title + (" (у админов)" if order.escalated else "")
+
+
+def register(bot: Engine, router: CallbackRouter, cfg: Config):
+    ORDERS.confirm_timeout = cfg.order_confirm_timeout
+    ORDERS.escalate_timeout = cfg.order_escalate_timeout
+    # заказы в той же БД, что кошельки; при шардировании её читают и пишут все воркеры
+    ORDERS.open(storage_backend(), shared=cfg.shard_workers > 1, owns=owns_user)
+    admins = frozenset(cfg.admin_ids)
+
+    def on_timer(order: Order, event: str):
+        # поток таймеров — только неблокирующая постановка в очередь отправки
+        if event == AUTO_CONFIRMED:
+            text = f"✅ Заказ {order.order_id} подтверждён автоматически, средства переведены продавцу."
+            targets = [order.buyer_id, order.seller_id]
+        else:
+            text = f"⏰ Заказ {order.order_id} завис в статусе «{STATUS_TITLES[order.status]}», передан админам."
+            targets = [order.buyer_id, order.seller_id]
+            if order.status == DISPUTE:
+                text_admin = text + f"\nСумма {order.amount}: вернуть покупателю или перевести продавцу?"
+                for chat_id in cfg.admin_ids:
+                    bot.submit("send_message", chat_id, text_admin, reply_markup=dispute_kb(order.order_id))
+            else:
+                targets += cfg.admin_ids
+        for chat_id in targets:
+            bot.submit("send_message", chat_id, text)
+
+    ORDERS.on_event = on_timer
+
+    async def order_action(c: CallbackQuery, action: str, order_id: int):
+        uid = c.from_user.id
+        try:
+            order = await bot.run_blocking(ORDERS.transition, order_id, action, uid, admin=uid in admins)
+        except OrderError:
+            await bot.answer_callback_query(c.id, "Действие недоступно для этого заказа.", show_alert=True)
+            return
+        except InsufficientFunds:
+            await bot.answer_callback_query(c.id, "Недостаточно средств.", show_alert=True)
+            return
+        await bot.answer_callback_query(c.id)
+        text = f"🧾 Заказ {order.order_id}: {_status(order)}."
+        kb = order_kb(order.order_id, order.status)
+        await bot.send_message(c.message.chat.id, text, reply_markup=kb)
+        for other in (order.buyer_id, order.seller_id):
+            if other != uid:
+                await bot.send_message(other, text, reply_markup=kb)
+
+    for action in ORDER_ACTIONS:
+        router.route(Cb.ORD, action, args=(int,))(
+            lambda c, order_id, action=action: order_action(c, action, order_id)
+        )
+
+    @router.route(Cb.ORD, "new", args=(int,))
+    async def new_order(c: CallbackQuery, product_id: int):
+        product = CATALOG.get(product_id)
+        if product is None:
+            await bot.answer_callback_query(c.id, "Товар больше не продаётся.", show_alert=True)
+            return
+        try:
+            order = await bot.run_blocking(ORDERS.create, c.from_user.id, product.seller_id, product.price)
+        except OrderError:
+            await bot.answer_callback_query(c.id, "Это твой товар.", show_alert=True)
+            return
+        await bot.answer_callback_query(c.id)
+        await bot.send_message(
+            c.message.chat.id,
+            f"🧾 Заказ {order.order_id}: {product.title}, {order.amount}.\n"
+            "После оплаты сумма держится до подтверждения получения.",
+            reply_markup=order_kb(order.order_id, order.status),
+        )
+
+    async def show_my_orders(c: CallbackQuery, before_id: int | None):
+        uid = c.from_user.id
+        orders = ORDERS.for_buyer(uid, before_id=before_id, limit=MY_ORDERS_PAGE)
+        lines = [f"`#{o.order_id}` {o.amount} — {_status(o)}" for o in orders] or ["Заказов пока нет."]
+        if before_id is None and ORDERS.for_seller(uid, limit=1):
+            # панель продавца: счётчики по индексу (продавец, статус), без обхода заказов
+            lines.append(
+                "\n*Продажи:* "
+                f"ждут отправки {ORDERS.count('paid', seller_id=uid)}, "
+                f"ждут подтверждения {ORDERS.count('delivered', seller_id=uid)}, "
+                f"споры {ORDERS.count('dispute', seller_id=uid)}"
+            )
+        older = orders[-1].order_id if len(orders) == MY_ORDERS_PAGE else None
+        await show_screen(bot, c, "📦 *Мои заказы*\n\n" + "\n".join(lines), my_orders_kb(older),
+                          parse_mode="Markdown")
+
+    @router.route(Cb.ORD, "my")
+    async def my_orders(c: CallbackQuery):
+        await show_my_orders(c, None)
+
+    @router.route(Cb.ORD, "my_before", args=(int,))
+    async def my_orders_before(c: CallbackQuery, before_id: int):
+        await show_my_orders(c, before_id)
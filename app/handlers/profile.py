@@ -1,14 +1,16 @@
-from telebot import TeleBot
 from telebot.types import CallbackQuery
 from ..callbacks import Cb
+from ..engine import Engine
+from ..router import CallbackRouter
 from ..storage import get_user
 from ..keyboards import profile_kb
+from ..render import show_screen
 
-def register(bot: TeleBot):
+def register(bot: Engine, router: CallbackRouter):
 
-    @bot.callback_query_handler(func=lambda c: c.data and c.data.startswith(Cb.NAV + ":profile"))
-    def open_profile(c: CallbackQuery):
-        u = get_user(c.from_user.id, c.from_user.username)
+    @router.route(Cb.NAV, "profile")
+    async def open_profile(c: CallbackQuery):
+        u = await bot.run_blocking(get_user, c.from_user.id, c.from_user.username)
         text = (
             "👤 *Профиль*\n"
             f"ID: `{u.user_id}`\n"
@@ -17,11 +19,4 @@ def register(bot: TeleBot):
             f"Продавец: *{'да' if u.is_seller else 'нет'}*\n"
             f"Верификация телефона: *{'да' if u.seller_verified_phone else 'нет'}*\n"
         )
-        bot.edit_message_caption(
-            caption=text,
-            chat_id=c.message.chat.id,
-            message_id=c.message.message_id,
-            reply_markup=profile_kb(),
-            parse_mode="Markdown",
-        )
-        bot.answer_callback_query(c.id)
+        await show_screen(bot, c, text, profile_kb(), parse_mode="Markdown")
@@ -1,31 +1,36 @@
-﻿from telebot import TeleBot
-from telebot.types import Message
+﻿from telebot.types import Message
 
 from ..config import Config
+from ..engine import Engine
 from ..keyboards import main_menu_kb
+from ..media import MediaCache
+from ..storage import touch_user
 
 WELCOME_TEXT = "РАБОТАЕМ НАХУЙ"
 
 
-def register(bot: TeleBot, cfg: Config):
+def register(bot: Engine, cfg: Config):
+    media = MediaCache(cfg.media_cache_path)
+
     @bot.message_handler(commands=["start", "home"])
-    def cmd_start(m: Message):
+    async def cmd_start(m: Message):
+        await bot.run_blocking(touch_user, m.from_user.id, m.from_user.username)
         try:
-            with open(cfg.assets_main_image_path, "rb") as f:
-                bot.send_photo(
-                    m.chat.id,
-                    photo=f,
-                    caption=WELCOME_TEXT,
-                    reply_markup=main_menu_kb(page=1),
-                )
+            await media.send_photo(
+                bot,
+                m.chat.id,
+                cfg.assets_main_image_path,
+                caption=WELCOME_TEXT,
+                reply_markup=main_menu_kb(page=1),
+            )
         except FileNotFoundError:
-            bot.send_message(
+            await bot.send_message(
                 m.chat.id,
                 WELCOME_TEXT + "\n\n(assets/main.jpg не найден — добавь картинку)",
                 reply_markup=main_menu_kb(page=1),
             )
         except Exception:
-            bot.send_message(
+            await bot.send_message(
                 m.chat.id,
                 WELCOME_TEXT + "\n\n(Не удалось отправить изображение. Замени assets/main.jpg на валидный JPG.)",
                 reply_markup=main_menu_kb(page=1),
@@ -1,31 +1,36 @@
-﻿from telebot import TeleBot
-from telebot.types import CallbackQuery
+﻿from telebot.types import CallbackQuery
 
-from ..callbacks import Cb, unpack
+from ..callbacks import Cb
+from ..engine import Engine
 from ..keyboards import main_menu_kb
+from ..render import show_markup, show_screen
+from ..router import CallbackRouter
 from .start import WELCOME_TEXT
 
 
-def register(bot: TeleBot):
-    @bot.callback_query_handler(func=lambda c: c.data and c.data.startswith(Cb.NAV + ":"))
-    def nav_router(c: CallbackQuery):
-        parts = unpack(c.data)
-        action = parts[1] if len(parts) > 1 else "home"
+def register(bot: Engine, router: CallbackRouter):
+    @router.route(Cb.NAV, "home")
+    async def nav_home(c: CallbackQuery):
+        await show_screen(bot, c, WELCOME_TEXT, main_menu_kb(page=1))
 
-        if action == "home":
-            bot.edit_message_caption(
-                chat_id=c.message.chat.id,
-                message_id=c.message.message_id,
-                caption=WELCOME_TEXT,
-                reply_markup=main_menu_kb(page=1),
-            )
-            bot.answer_callback_query(c.id)
-            return
+    @router.route(Cb.NAV, "catalog")
+    async def nav_catalog(c: CallbackQuery):
+        await bot.answer_callback_query(c.id)
+        await bot.send_message(c.message.chat.id, "📦 Каталог открыт. Выбери нужную категорию/товар.")
+
+    @router.route(Cb.NAV, "page", args=(int,))
+    async def nav_page(c: CallbackQuery, page: int):
+        await show_markup(bot, c, main_menu_kb(page=page))
 
-        if action == "catalog":
-            bot.answer_callback_query(c.id)
-            bot.send_message(c.message.chat.id, "📦 Каталог открыт. Выбери нужную категорию/товар.")
+    @router.route(Cb.NAV, "noop")
+    async def nav_noop(c: CallbackQuery):
+        await bot.answer_callback_query(c.id)
+
+    @router.route(Cb.NAV)
+    async def nav_router(c: CallbackQuery, action: str = "home", *_):
+        if action == "home":
+            await nav_home(c)
             return
 
-        bot.answer_callback_query(c.id)
-        bot.send_message(c.message.chat.id, f"🔘 Нажато: {action}. (Заглушка) Тут будет функционал.")
+        await bot.answer_callback_query(c.id)
+        await bot.send_message(c.message.chat.id, f"🔘 Нажато: {action}. (Заглушка) Тут будет функционал.")
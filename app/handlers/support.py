@@ -1,28 +1,29 @@
-﻿from telebot import TeleBot
-from telebot.types import CallbackQuery, Message
+﻿from telebot.types import CallbackQuery, Message
 
 from ..callbacks import Cb
+from ..engine import Engine
 from ..keyboards import support_kb
+from ..router import CallbackRouter
 from ..states import SupportStates
 
 
-def register(bot: TeleBot):
-    @bot.callback_query_handler(func=lambda c: c.data and c.data.startswith(Cb.SUP + ":open"))
-    def support_open(c: CallbackQuery):
-        bot.answer_callback_query(c.id)
-        bot.send_message(
+def register(bot: Engine, router: CallbackRouter):
+    @router.route(Cb.SUP, "open")
+    async def support_open(c: CallbackQuery):
+        await bot.answer_callback_query(c.id)
+        await bot.send_message(
             c.message.chat.id,
             "🛟 Поддержка\nВыберите действие:",
             reply_markup=support_kb(),
         )
 
-    @bot.callback_query_handler(func=lambda c: c.data and c.data.startswith(Cb.SUP + ":contact"))
-    def support_contact(c: CallbackQuery):
-        bot.answer_callback_query(c.id)
-        bot.send_message(c.message.chat.id, "📝 Напиши сообщение в поддержку.")
-        bot.set_state(c.from_user.id, SupportStates.waiting_message, c.message.chat.id)
+    @router.route(Cb.SUP, "contact")
+    async def support_contact(c: CallbackQuery):
+        await bot.answer_callback_query(c.id)
+        await bot.set_state(c.from_user.id, SupportStates.waiting_message, c.message.chat.id)
+        await bot.send_message(c.message.chat.id, "📝 Напиши сообщение в поддержку.")
 
     @bot.message_handler(state=SupportStates.waiting_message, content_types=["text"])
-    def support_message(m: Message):
-        bot.delete_state(m.from_user.id, m.chat.id)
-        bot.send_message(m.chat.id, "✅ Сообщение принято. Оператор ответит позже.")
+    async def support_message(m: Message):
+        await bot.delete_state(m.from_user.id, m.chat.id)
+        await bot.send_message(m.chat.id, "✅ Сообщение принято. Оператор ответит позже.")
@@ -1,53 +1,120 @@
-from telebot import TeleBot
+import time
+
 from telebot.types import CallbackQuery, Message
 
 from ..callbacks import Cb
-from ..storage import get_user
-from ..keyboards import wallet_kb
+from ..engine import Engine
+from ..storage import InsufficientFunds, balance_history, get_balance, post_balance
+from ..keyboards import wallet_history_kb, wallet_kb
+from ..render import show_screen
+from ..router import CallbackRouter
 from ..states import WalletStates
 
-def register(bot: TeleBot):
+HISTORY_PAGE = 10
+
+_KIND_TITLES = {
+    "topup": "пополнение",
+    "withdraw": "вывод",
+    "adjust": "корректировка",
+    "order": "заказ",
+}
+
+
+def _parse_amount(text: str | None) -> int | None:
+    try:
+        amount = int((text or "").strip())
+    except ValueError:
+        return None
+    return amount if amount > 0 else None
+
+
+def register(bot: Engine, router: CallbackRouter):
 
-    @bot.callback_query_handler(func=lambda c: c.data and c.data.startswith(Cb.NAV + ":wallet"))
-    def open_wallet(c: CallbackQuery):
-        u = get_user(c.from_user.id, c.from_user.username)
+    @router.route(Cb.NAV, "wallet")
+    async def open_wallet(c: CallbackQuery):
+        balance = await bot.run_blocking(get_balance, c.from_user.id)
         text = (
             "💰 *Кошелёк*\n"
-            f"Текущий баланс: *{u.balance}*\n\n"
+            f"Текущий баланс: *{balance}*\n\n"
             "Выбери действие:"
         )
-        bot.edit_message_caption(
-            caption=text,
-            chat_id=c.message.chat.id,
-            message_id=c.message.message_id,
-            reply_markup=wallet_kb(),
-            parse_mode="Markdown",
-        )
-        bot.answer_callback_query(c.id)
+        await show_screen(bot, c, text, wallet_kb(), parse_mode="Markdown")
+
+    async def show_history(c: CallbackQuery, before_seq: int | None):
+        entries = await bot.run_blocking(balance_history, c.from_user.id, before_seq=before_seq, limit=HISTORY_PAGE)
+        if entries:
+            lines = [
+                f"`#{e.seq}` {time.strftime('%d.%m %H:%M', time.localtime(e.created_at))} "
+                f"{e.delta:+d} → {e.balance_after} ({_KIND_TITLES.get(e.kind, e.kind)})"
+                for e in entries
+            ]
+        else:
+            lines = ["Операций пока нет."]
+        # курсор "раньше" — seq последней показанной записи; seq=1 — самая первая операция
+        older = entries[-1].seq if entries and entries[-1].seq > 1 else None
+        await show_screen(bot, c, "📜 *История операций*\n\n" + "\n".join(lines), wallet_history_kb(older),
+                          parse_mode="Markdown")
+
+    @router.route(Cb.WAL, "history")
+    async def wallet_history(c: CallbackQuery):
+        await show_history(c, None)
 
-    @bot.callback_query_handler(func=lambda c: c.data and c.data.startswith(Cb.WAL + ":topup"))
-    def wallet_topup(c: CallbackQuery):
-        bot.answer_callback_query(c.id)
-        bot.send_message(c.message.chat.id, "➕ Введи сумму пополнения (заглушка).")
-        bot.set_state(c.from_user.id, WalletStates.topup_amount, c.message.chat.id)
+    @router.route(Cb.WAL, "history_before", args=(int,))
+    async def wallet_history_before(c: CallbackQuery, before_seq: int):
+        await show_history(c, before_seq)
+
+    @router.route(Cb.WAL, "topup")
+    async def wallet_topup(c: CallbackQuery):
+        await bot.answer_callback_query(c.id)
+        await bot.set_state(c.from_user.id, WalletStates.topup_amount, c.message.chat.id)
+        await bot.send_message(c.message.chat.id, "➕ Введи сумму пополнения (заглушка).")
 
     @bot.message_handler(state=WalletStates.topup_amount, content_types=["text"])
-    def wallet_topup_amount(m: Message):
-        bot.delete_state(m.from_user.id, m.chat.id)
-        bot.send_message(m.chat.id, "✅ Принято. (Заглушка) Тут будет создание инвойса/платежа.")
+    async def wallet_topup_amount(m: Message):
+        if _parse_amount(m.text) is None:
+            await bot.send_message(m.chat.id, "Сумма должна быть целым положительным числом.")
+            return
+        await bot.delete_state(m.from_user.id, m.chat.id)
+        await bot.send_message(m.chat.id, "✅ Принято. (Заглушка) Тут будет создание инвойса/платежа.")
 
-    @bot.callback_query_handler(func=lambda c: c.data and c.data.startswith(Cb.WAL + ":withdraw"))
-    def wallet_withdraw(c: CallbackQuery):
-        bot.answer_callback_query(c.id)
-        bot.send_message(c.message.chat.id, "➖ Введи сумму вывода (заглушка).")
-        bot.set_state(c.from_user.id, WalletStates.withdraw_amount, c.message.chat.id)
+    @router.route(Cb.WAL, "withdraw")
+    async def wallet_withdraw(c: CallbackQuery):
+        await bot.answer_callback_query(c.id)
+        await bot.set_state(c.from_user.id, WalletStates.withdraw_amount, c.message.chat.id)
+        await bot.send_message(c.message.chat.id, "➖ Введи сумму вывода.")
 
     @bot.message_handler(state=WalletStates.withdraw_amount, content_types=["text"])
-    def wallet_withdraw_amount(m: Message):
-        bot.set_state(m.from_user.id, WalletStates.withdraw_details, m.chat.id)
-        bot.send_message(m.chat.id, "✍️ Введи реквизиты/комментарий для вывода (заглушка).")
+    async def wallet_withdraw_amount(m: Message):
+        amount = _parse_amount(m.text)
+        if amount is None:
+            await bot.send_message(m.chat.id, "Сумма должна быть целым положительным числом.")
+            return
+        balance = await bot.run_blocking(get_balance, m.from_user.id)
+        if amount > balance:
+            await bot.send_message(m.chat.id, f"Недостаточно средств: на балансе {balance}.")
+            return
+        await bot.set_state(m.from_user.id, WalletStates.withdraw_details, m.chat.id)
+        await bot.add_data(m.from_user.id, m.chat.id, amount=amount)
+        await bot.send_message(m.chat.id, "✍️ Введи реквизиты/комментарий для вывода.")
 
     @bot.message_handler(state=WalletStates.withdraw_details, content_types=["text"])
-    def wallet_withdraw_details(m: Message):
-        bot.delete_state(m.from_user.id, m.chat.id)
-        bot.send_message(m.chat.id, "📨 Заявка на вывод создана. (Заглушка) Тут будет запись в БД и уведомление админам.")
+    async def wallet_withdraw_details(m: Message):
+        data = await bot.get_state_data(m.from_user.id, m.chat.id)
+        await bot.delete_state(m.from_user.id, m.chat.id)
+        amount = data.get("amount")
+        if not amount:
+            await bot.send_message(m.chat.id, "Сумма вывода потерялась, начни заново из кошелька.")
+            return
+        try:
+            # op_id от сообщения с реквизитами: повторная доставка апдейта не спишет дважды
+            entry = await bot.run_blocking(post_balance, m.from_user.id, -amount,
+                                           op_id=f"withdraw:{m.chat.id}:{m.message_id}", kind="withdraw")
+        except InsufficientFunds:
+            balance = await bot.run_blocking(get_balance, m.from_user.id)
+            await bot.send_message(m.chat.id, f"Недостаточно средств: на балансе {balance}.")
+            return
+        await bot.send_message(
+            m.chat.id,
+            f"📨 Заявка на вывод {amount} создана, остаток {entry.balance_after}. "
+            "(Заглушка) Тут будет уведомление админам.",
+        )
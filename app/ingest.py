@@ -0,0 +1,356 @@
+import asyncio
+import json
+import os
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Set
+
+from telebot.types import Update
+
+# Приём апдейтов в режиме polling с долговечным чекпоинтом вместо skip_pending.
+# Чекпоинт (UpdateCheckpoint) — JSON-файл: offset (все update_id < offset обработаны), id завершённых
+# не по порядку и сами апдейты, взятые в обработку, но не завершённые. Прежде чем подтвердить Telegram
+# новый offset (следующий getUpdates), взятые апдейты сохраняются на диск; после рестарта они
+# обрабатываются заново первыми, а то, что Telegram доставит повторно, распознаётся по чекпоинту и
+# пропускается. Прогресс обработки пишется не чаще раза в flush_interval (0 — после каждого апдейта)
+# и при остановке: после жёсткого падения повторно обработаются только апдейты за последний интервал.
+# После простоя накопленные апдейты разбираются пачками по batch параллельно в lanes потоках (корутинах),
+# апдейты одного пользователя — в одной дорожке и по порядку; в обработке не больше max_pending.
+# Апдейт с датой старше max_age (сообщения, правки, события участников; у callback и inline-запросов
+# даты нет) отбрасывается без обработки.
+
+_UPDATE_KINDS = (
+    "message", "edited_message", "callback_query", "inline_query", "chosen_inline_result",
+    "shipping_query", "pre_checkout_query", "poll_answer", "my_chat_member", "chat_member",
+    "chat_join_request", "message_reaction", "business_message", "edited_business_message",
+)
+_DATED_KINDS = (
+    "message", "edited_message", "channel_post", "edited_channel_post", "business_message",
+    "edited_business_message", "my_chat_member", "chat_member", "chat_join_request", "message_reaction",
+)
+
+NEW = "new"
+BUSY = "busy"  # уже в обработке — Telegram вернул его снова, пока offset не сдвинулся
+DONE = "done"
+
+
+def user_key(raw: dict) -> int:
+    for kind in _UPDATE_KINDS:
+        obj = raw.get(kind)
+        if not obj:
+            continue
+        user = obj.get("from") or obj.get("user")
+        if user and "id" in user:
+            return int(user["id"])
+        chat = obj.get("chat")
+        if chat and "id" in chat:
+            return int(chat["id"])
+    return int(raw.get("update_id", 0))
+
+
+def shard_of(user_id: int, shards: int) -> int:
+    # id в Telegram идут плотно, перемешиваем перед взятием остатка
+    return ((user_id * 2654435761) & 0xFFFFFFFF) % shards
+
+
+def update_date(raw: dict) -> Optional[int]:
+    for kind in _DATED_KINDS:
+        obj = raw.get(kind)
+        if obj:
+            return obj.get("edit_date") or obj.get("date")
+    return None
+
+
+class UpdateCheckpoint:
+    def __init__(self, path: str, flush_interval: float = 1.0, clock: Callable[[], float] = time.monotonic):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._clock = clock
+        self.offset = 0  # все update_id < offset обработаны
+        # взяты в обработку, но не завершены — сохраняются целиком; JSON строится один раз в begin()
+        self._pending: Dict[int, str] = {}
+        self._done: Set[int] = set()  # завершены, но >= offset
+        self._fetch = 0  # следующий update_id, который запросим у Telegram
+        self._saved_fetch = 0
+        self._dirty = False
+        self._saved_at = clock()
+        self._cond = threading.Condition()
+        self._save_lock = threading.Lock()
+        self._load()
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.offset = int(data.get("offset", 0))
+            self._done = {int(i) for i in data.get("done", ()) if int(i) >= self.offset}
+            self._pending = {int(raw["update_id"]): json.dumps(raw, ensure_ascii=False) for raw in data.get("pending", ())}
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, TypeError, KeyError) as e:
+            print(f"[ingest] checkpoint {self.path} is unreadable, starting from Telegram's backlog: {e!r}")
+        self._fetch = self._saved_fetch = max(self._done | self._pending.keys() | {self.offset - 1}) + 1
+
+    def pending(self) -> List[dict]:
+        # незавершённые до остановки — обрабатываются заново перед новыми
+        with self._cond:
+            return [json.loads(self._pending[i]) for i in sorted(self._pending)]
+
+    def in_flight(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
+    def ack_offset(self) -> Optional[int]:
+        # offset для getUpdates; None — с начала очереди Telegram. Всё, что ниже, Telegram забудет,
+        # поэтому взятые в обработку апдейты сначала сохраняются на диск
+        with self._cond:
+            fetch, saved = self._fetch, self._saved_fetch
+        if fetch > saved:
+            self.save()
+        return fetch or None
+
+    def begin(self, raw: dict) -> str:
+        update_id = raw["update_id"]
+        with self._cond:
+            if update_id < self.offset or update_id in self._done:
+                return DONE
+            if update_id in self._pending:
+                return BUSY
+            self._pending[update_id] = json.dumps(raw, ensure_ascii=False)
+            self._fetch = max(self._fetch, update_id + 1)
+            self._dirty = True
+            return NEW
+
+    def finish(self, update_id: int) -> None:
+        if self.mark_done(update_id):
+            self.save()
+
+    def mark_done(self, update_id: int) -> bool:
+        # то же, что finish, но без записи на диск; True — пора сохранить (save), см. flush_interval
+        with self._cond:
+            self._pending.pop(update_id, None)
+            self._done.add(update_id)
+            low = min(self._pending) if self._pending else self._fetch
+            if low > self.offset:
+                self.offset = low
+                self._done = {i for i in self._done if i >= low}
+            self._dirty = True
+            self._cond.notify_all()
+            return self._clock() - self._saved_at >= self.flush_interval
+
+    def wait_progress(self, timeout: float) -> None:
+        with self._cond:
+            self._cond.wait(timeout)
+
+    def save(self) -> None:
+        with self._save_lock:
+            with self._cond:
+                if not self._dirty:
+                    return
+                fetch = self._fetch
+                head = json.dumps({"offset": self.offset, "done": sorted(self._done)})
+                pending = [self._pending[i] for i in sorted(self._pending)]
+                self._dirty = False
+                self._saved_at = self._clock()
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = self.path + ".tmp"
+            try:
+                with open(tmp, "w", encoding="utf-8") as f:
+                    f.write(f'{head[:-1]}, "pending": [{", ".join(pending)}]}}')
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp, self.path)
+            except BaseException:
+                # не записали — ack_offset не должен подтвердить Telegram то, чего нет на диске
+                with self._cond:
+                    self._dirty = True
+                raise
+            with self._cond:
+                self._saved_fetch = max(self._saved_fetch, fetch)
+
+    def close(self) -> None:
+        self.save()
+
+
+class Ingestor:
+    def __init__(self, bot, checkpoint: UpdateCheckpoint, lanes: int = 8, max_age: float = 3600.0,
+                 batch: int = 100, max_pending: int = 1000, poll_timeout: int = 20,
+                 clock: Callable[[], float] = time.time):
+        # bot — TeleBot (threaded=False: хендлер выполняется в потоке дорожки) или AsyncTeleBot
+        self.bot = bot
+        self.checkpoint = checkpoint
+        self.lanes = lanes
+        self.max_age = max_age
+        self.batch = batch
+        # не больше max_pending апдейтов в обработке: ограничивает память и размер чекпоинта
+        self.max_pending = max_pending
+        self.poll_timeout = poll_timeout
+        self._clock = clock
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self.counters: Dict[str, int] = {"processed": 0, "failed": 0, "stale": 0, "duplicate": 0}
+        # завершение апдейта в чекпоинте; в run_async — без fsync на event loop
+        self._finish: Callable[[int], None] = checkpoint.finish
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.counters, offset=self.checkpoint.offset)
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self.counters[key] += 1
+
+    def _route(self, raw: dict, dispatch: Callable[[int, dict], None]) -> None:
+        date = update_date(raw)
+        if self.max_age > 0 and date is not None and self._clock() - date > self.max_age:
+            self._count("stale")
+            self._finish(raw["update_id"])
+            return
+        dispatch(shard_of(user_key(raw), self.lanes), raw)
+
+    def _admit(self, updates: List[dict], dispatch: Callable[[int, dict], None]) -> None:
+        for raw in updates:
+            if self.checkpoint.begin(raw) == NEW:
+                self._route(raw, dispatch)
+            else:
+                self._count("duplicate")
+
+    def _room(self) -> bool:
+        # берём сразу целую пачку: опрос ради пары апдейтов переписывал бы чекпоинт почти впустую
+        return self.checkpoint.in_flight() + self.batch <= self.max_pending
+
+    def _done(self, raw: dict, error: Optional[BaseException]) -> None:
+        if error is not None:
+            print(f"[ingest] update {raw.get('update_id')} failed: {error!r}")
+        self._count("failed" if error is not None else "processed")
+        self._finish(raw["update_id"])
+
+    # --- TeleBot ---
+
+    def run(self) -> None:
+        from telebot import apihelper
+
+        token = self.bot.token
+        queues: List["queue.Queue[Optional[dict]]"] = [queue.Queue() for _ in range(self.lanes)]
+
+        def lane(q: "queue.Queue[Optional[dict]]") -> None:
+            while True:
+                raw = q.get()
+                if raw is None:
+                    return
+                if self._stopped.is_set():
+                    continue  # остаётся в чекпоинте, обработается после рестарта
+                error = None
+                try:
+                    self.bot.process_new_updates([Update.de_json(raw)])
+                except Exception as e:
+                    error = e
+                self._done(raw, error)
+
+        def dispatch(i: int, raw: dict) -> None:
+            queues[i].put(raw)
+
+        threads = [threading.Thread(target=lane, args=(q,), name=f"ingest-{i}", daemon=True)
+                   for i, q in enumerate(queues)]
+        for t in threads:
+            t.start()
+        try:
+            for raw in self.checkpoint.pending():
+                self._route(raw, dispatch)
+            while not self._stopped.is_set():
+                if not self._room():
+                    self.checkpoint.wait_progress(1.0)
+                    continue
+                try:
+                    updates = apihelper.get_updates(token, offset=self.checkpoint.ack_offset(), limit=self.batch,
+                                                    timeout=self.poll_timeout + 10,
+                                                    long_polling_timeout=self.poll_timeout)
+                except Exception as e:
+                    print(f"[ingest] getUpdates failed: {e!r}")
+                    self._stopped.wait(1.0)
+                    continue
+                self._admit(updates, dispatch)
+        finally:
+            for q in queues:
+                q.put(None)
+            for t in threads:
+                t.join()
+            self.checkpoint.close()
+
+    # --- AsyncTeleBot ---
+
+    async def run_async(self) -> None:
+        from telebot import asyncio_helper
+
+        token = self.bot.token
+        loop = asyncio.get_running_loop()
+        queues: List["asyncio.Queue[Optional[dict]]"] = [asyncio.Queue() for _ in range(self.lanes)]
+        progress = asyncio.Event()
+        saving: List[Optional[asyncio.Future]] = [None]
+
+        def saved(fut: asyncio.Future) -> None:
+            if not fut.cancelled() and fut.exception() is not None:
+                print(f"[ingest] checkpoint save failed: {fut.exception()!r}")
+
+        def finish(update_id: int) -> None:
+            # запись чекпоинта (fsync) — в пуле потоков и не больше одной сразу; следующая подхватит
+            # всё, что завершится, пока идёт эта
+            if self.checkpoint.mark_done(update_id) and (saving[0] is None or saving[0].done()):
+                saving[0] = loop.run_in_executor(None, self.checkpoint.save)
+                saving[0].add_done_callback(saved)
+
+        self._finish = finish
+
+        async def lane(q: "asyncio.Queue[Optional[dict]]") -> None:
+            while True:
+                raw = await q.get()
+                if raw is None:
+                    return
+                if self._stopped.is_set():
+                    continue  # остаётся в чекпоинте, обработается после рестарта
+                error = None
+                try:
+                    await self.bot.process_new_updates([Update.de_json(raw)])
+                except Exception as e:
+                    error = e
+                self._done(raw, error)
+                progress.set()
+
+        def dispatch(i: int, raw: dict) -> None:
+            queues[i].put_nowait(raw)
+
+        tasks = [asyncio.create_task(lane(q)) for q in queues]
+        try:
+            for raw in self.checkpoint.pending():
+                self._route(raw, dispatch)
+            while not self._stopped.is_set():
+                if not self._room():
+                    progress.clear()
+                    try:
+                        await asyncio.wait_for(progress.wait(), 1.0)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                try:
+                    # сохранение чекпоинта (fsync) — вне event loop
+                    offset = await loop.run_in_executor(None, self.checkpoint.ack_offset)
+                    updates = await asyncio_helper.get_updates(token, offset=offset, limit=self.batch,
+                                                               timeout=self.poll_timeout,
+                                                               request_timeout=self.poll_timeout + 10)
+                except Exception as e:
+                    print(f"[ingest] getUpdates failed: {e!r}")
+                    await asyncio.sleep(1.0)
+                    continue
+                self._admit(updates, dispatch)
+        finally:
+            for q in queues:
+                q.put_nowait(None)
+            await asyncio.gather(*tasks)
+            if saving[0] is not None:
+                await asyncio.wait([saving[0]])
+            await loop.run_in_executor(None, self.checkpoint.close)
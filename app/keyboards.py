@@ -1,4 +1,6 @@
-﻿from telebot import types
+﻿from functools import lru_cache
+
+from telebot import types
 
 from .callbacks import Cb, pack
 
@@ -10,14 +12,52 @@ CATEGORIES = [
     "BR", "BS", "BT", "BW", "BZ",
 ]
 
+CATEGORIES_PER_ROW = 5
+CATEGORIES_PER_PAGE = 10
+MAIN_MENU_PAGES = max(1, -(-len(CATEGORIES) // CATEGORIES_PER_PAGE))
 
-def main_menu_kb(page: int = 1) -> types.InlineKeyboardMarkup:
-    kb = types.InlineKeyboardMarkup(row_width=2)
+# Клавиатуры неизменяемые, поэтому строим их один раз при импорте (параметризованные — через LRU),
+# а JSON для Telegram сериализуем при первой отправке и дальше отдаём готовую строку.
+# Возвращаемые объекты общие — не модифицировать.
+
+
+class _CachedMarkup(types.InlineKeyboardMarkup):
+    _json = None
+
+    def to_json(self):
+        if self._json is None:
+            self._json = super().to_json()
+        return self._json
+
+
+def _freeze(kb: _CachedMarkup) -> _CachedMarkup:
+    kb.to_json()
+    return kb
+
+
+def _build_main_menu(page: int) -> types.InlineKeyboardMarkup:
+    kb = _CachedMarkup(row_width=2)
 
     kb.row(
         types.InlineKeyboardButton("🔥 КАТАЛОГ", callback_data=pack(Cb.NAV, "catalog")),
         types.InlineKeyboardButton("Поддержка", callback_data=pack(Cb.SUP, "open")),
     )
+
+    start = (page - 1) * CATEGORIES_PER_PAGE
+    codes = CATEGORIES[start:start + CATEGORIES_PER_PAGE]
+    for i in range(0, len(codes), CATEGORIES_PER_ROW):
+        kb.row(*[
+            types.InlineKeyboardButton(code, callback_data=pack(Cb.CAT, code))
+            for code in codes[i:i + CATEGORIES_PER_ROW]
+        ])
+    if MAIN_MENU_PAGES > 1:
+        prev_page = page - 1 if page > 1 else MAIN_MENU_PAGES
+        next_page = page + 1 if page < MAIN_MENU_PAGES else 1
+        kb.row(
+            types.InlineKeyboardButton("◀️", callback_data=pack(Cb.NAV, "page", str(prev_page))),
+            types.InlineKeyboardButton(f"{page}/{MAIN_MENU_PAGES}", callback_data=pack(Cb.NAV, "noop")),
+            types.InlineKeyboardButton("▶️", callback_data=pack(Cb.NAV, "page", str(next_page))),
+        )
     kb.row(
         types.InlineKeyboardButton("Баланс", callback_data=pack(Cb.NAV, "wallet")),
     )
@@ -28,48 +68,142 @@ def main_menu_kb(page: int = 1) -> types.InlineKeyboardMarkup:
         types.InlineKeyboardButton("Получить возможности продавца", callback_data=pack(Cb.SELL, "verify_phone")),
     )
 
-    return kb
+    return _freeze(kb)
 
 
-def support_kb() -> types.InlineKeyboardMarkup:
-    kb = types.InlineKeyboardMarkup(row_width=1)
+_MAIN_MENU = tuple(_build_main_menu(p) for p in range(1, MAIN_MENU_PAGES + 1))
+
+
+def main_menu_kb(page: int = 1) -> types.InlineKeyboardMarkup:
+    page = min(max(page, 1), MAIN_MENU_PAGES)
+    return _MAIN_MENU[page - 1]
+
+
+def _build_support_kb() -> types.InlineKeyboardMarkup:
+    kb = _CachedMarkup(row_width=1)
     kb.add(types.InlineKeyboardButton("Обратиться в поддержку", callback_data=pack(Cb.SUP, "contact")))
     kb.add(types.InlineKeyboardButton("Запрос на вывод", callback_data=pack(Cb.WAL, "withdraw")))
     kb.add(types.InlineKeyboardButton("⬅️ Назад", callback_data=pack(Cb.NAV, "home")))
-    return kb
+    return _freeze(kb)
 
 
-def profile_kb() -> types.InlineKeyboardMarkup:
-    kb = types.InlineKeyboardMarkup(row_width=2)
+def _build_profile_kb() -> types.InlineKeyboardMarkup:
+    kb = _CachedMarkup(row_width=2)
     kb.row(
         types.InlineKeyboardButton("💬 Чат с продавцом", callback_data=pack(Cb.CHAT, "start")),
         types.InlineKeyboardButton("🛟 Поддержка", callback_data=pack(Cb.SUP, "open")),
     )
     kb.row(
+        types.InlineKeyboardButton("📦 Мои заказы", callback_data=pack(Cb.ORD, "my")),
         types.InlineKeyboardButton("✅ Продавец: верификация", callback_data=pack(Cb.SELL, "verify_phone")),
-        types.InlineKeyboardButton("⬅️ Назад", callback_data=pack(Cb.NAV, "home")),
     )
-    return kb
+    kb.add(types.InlineKeyboardButton("⬅️ Назад", callback_data=pack(Cb.NAV, "home")))
+    return _freeze(kb)
 
 
-def wallet_kb() -> types.InlineKeyboardMarkup:
-    kb = types.InlineKeyboardMarkup(row_width=2)
+def _build_wallet_kb() -> types.InlineKeyboardMarkup:
+    kb = _CachedMarkup(row_width=2)
     kb.row(
         types.InlineKeyboardButton("➕ Пополнить", callback_data=pack(Cb.WAL, "topup")),
         types.InlineKeyboardButton("➖ Вывод", callback_data=pack(Cb.WAL, "withdraw")),
     )
     kb.row(
-        types.InlineKeyboardButton("📜 История (заглушка)", callback_data=pack(Cb.WAL, "history")),
+        types.InlineKeyboardButton("📜 История", callback_data=pack(Cb.WAL, "history")),
         types.InlineKeyboardButton("⬅️ Назад", callback_data=pack(Cb.NAV, "home")),
     )
-    return kb
+    return _freeze(kb)
+
 
+def _build_chat_kb() -> types.InlineKeyboardMarkup:
+    kb = _CachedMarkup(row_width=1)
+    kb.add(types.InlineKeyboardButton("📜 История чата", callback_data=pack(Cb.CHAT, "history")))
+    return _freeze(kb)
 
-def order_kb(order_id: int) -> types.InlineKeyboardMarkup:
-    kb = types.InlineKeyboardMarkup(row_width=2)
+
+_SUPPORT_KB = _build_support_kb()
+_PROFILE_KB = _build_profile_kb()
+_WALLET_KB = _build_wallet_kb()
+_CHAT_KB = _build_chat_kb()
+
+
+def support_kb() -> types.InlineKeyboardMarkup:
+    return _SUPPORT_KB
+
+
+def profile_kb() -> types.InlineKeyboardMarkup:
+    return _PROFILE_KB
+
+
+def wallet_kb() -> types.InlineKeyboardMarkup:
+    return _WALLET_KB
+
+
+def chat_kb() -> types.InlineKeyboardMarkup:
+    return _CHAT_KB
+
+
+@lru_cache(maxsize=1024)
+def order_kb(order_id: int, status: str = "paid") -> types.InlineKeyboardMarkup:
+    # кнопки по статусу заказа; лишние всё равно отсекает OrderBook.transition
+    kb = _CachedMarkup(row_width=2)
+    if status == "created":
+        kb.row(
+            types.InlineKeyboardButton("💳 Оплатить", callback_data=pack(Cb.ORD, "pay", str(order_id))),
+            types.InlineKeyboardButton("✖️ Отменить", callback_data=pack(Cb.ORD, "cancel", str(order_id))),
+        )
+        return _freeze(kb)
+    if status in ("paid", "delivered"):
+        kb.row(
+            types.InlineKeyboardButton("📦 Отметить доставку", callback_data=pack(Cb.ORD, "delivered", str(order_id))),
+            types.InlineKeyboardButton("✅ Подтвердить выполнение", callback_data=pack(Cb.ORD, "confirm", str(order_id))),
+        )
+    row = [types.InlineKeyboardButton("💬 Чат по заказу", callback_data=pack(Cb.CHAT, "order", str(order_id)))]
+    if status in ("paid", "delivered"):
+        row.append(types.InlineKeyboardButton("⚠️ Открыть спор", callback_data=pack(Cb.ORD, "dispute", str(order_id))))
+    kb.row(*row)
+    return _freeze(kb)
+
+
+@lru_cache(maxsize=1024)
+def dispute_kb(order_id: int) -> types.InlineKeyboardMarkup:
+    # для админов: разбор спора
+    kb = _CachedMarkup(row_width=2)
     kb.row(
-        types.InlineKeyboardButton("📦 Отметить доставку (заглушка)", callback_data=pack(Cb.ORD, "delivered", str(order_id))),
-        types.InlineKeyboardButton("✅ Подтвердить выполнение", callback_data=pack(Cb.ORD, "confirm", str(order_id))),
+        types.InlineKeyboardButton("↩️ Вернуть покупателю", callback_data=pack(Cb.ORD, "refund", str(order_id))),
+        types.InlineKeyboardButton("💸 Перевести продавцу", callback_data=pack(Cb.ORD, "release", str(order_id))),
     )
-    kb.add(types.InlineKeyboardButton("⚠️ Открыть спор (заглушка)", callback_data=pack(Cb.ORD, "dispute", str(order_id))))
-    return kb
+    return _freeze(kb)
+
+
+@lru_cache(maxsize=1024)
+def my_orders_kb(before_id: int | None) -> types.InlineKeyboardMarkup:
+    kb = _CachedMarkup(row_width=2)
+    if before_id:
+        kb.add(types.InlineKeyboardButton("⬅️ Раньше", callback_data=pack(Cb.ORD, "my_before", str(before_id))))
+    kb.add(types.InlineKeyboardButton("👤 В профиль", callback_data=pack(Cb.NAV, "profile")))
+    return _freeze(kb)
+
+
+@lru_cache(maxsize=1024)
+def wallet_history_kb(before_seq: int | None) -> types.InlineKeyboardMarkup:
+    kb = _CachedMarkup(row_width=2)
+    if before_seq:
+        kb.add(types.InlineKeyboardButton("⬅️ Раньше", callback_data=pack(Cb.WAL, "history_before", str(before_seq))))
+    kb.add(types.InlineKeyboardButton("💰 В кошелёк", callback_data=pack(Cb.NAV, "wallet")))
+    return _freeze(kb)
+
+
+@lru_cache(maxsize=1024)
+def catalog_page_kb(code: str, next_cursor: str | None,
+                    buy: tuple[tuple[int, str], ...] = ()) -> types.InlineKeyboardMarkup:
+    # buy — (product_id, подпись) товаров страницы: кнопка заказа на каждый
+    kb = _CachedMarkup(row_width=2)
+    for product_id, label in buy:
+        kb.add(types.InlineKeyboardButton(f"🛒 {label}"[:64], callback_data=pack(Cb.ORD, "new", str(product_id))))
+    if next_cursor:
+        kb.add(types.InlineKeyboardButton("➡️ Дальше", callback_data=pack(Cb.CAT, code, next_cursor)))
+    kb.row(
+        types.InlineKeyboardButton("🔍 Поиск", switch_inline_query_current_chat=""),
+        types.InlineKeyboardButton("⬅️ Назад", callback_data=pack(Cb.NAV, "home")),
+    )
+    return _freeze(kb)
@@ -0,0 +1 @@
+# Нагрузочные прогоны против фейкового Bot API: python -m app.loadtest --help
@@ -0,0 +1,511 @@
+import argparse
+import dataclasses
+import http.client
+import json
+import logging
+import math
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from .fake_api import FakeBotApi
+from .scenarios import FLOWS, build_update, read_recorded, user_script
+
+# Нагрузочный прогон бота против фейкового Bot API:
+#   python -m app.loadtest [--users 20 --rounds 2 --engine sync|async --latency-ms 5 --rate-429 0.01]
+#   python -m app.loadtest --replay updates.jsonl [--rate 200]
+#   python -m app.loadtest --broadcast 100000 [--blocked 0.05]
+#   python -m app.loadtest --backlog 10000 --users 200 [--backlog-age 600]
+#   python -m app.loadtest --mode webhook [...] — те же апдейты POST'ом в локальный webhook-сервер бота
+# Синтетика — замкнутый цикл: каждый виртуальный пользователь шлёт следующий апдейт, когда бот ответил
+# на предыдущий (или истёк --step-timeout, это ошибка). Записанный поток шлётся открытым циклом,
+# ответом на апдейт считается первый вызов API в тот же чат (на callback — answerCallbackQuery).
+# Задержка — от выдачи апдейта в getUpdates (или начала POST в webhook) до ответа, считается вместе
+# с приёмом и отправкой. На 503 от webhook'а (очередь воркера полна) апдейт, как в Telegram, повторяется
+# после Retry-After.
+# Рассылка — кампания (broadcast.py) на --broadcast пользователей, доля --blocked из них заблокировала бота;
+# скорость — получателей/с, ошибкой считается получатель, которому не удалось доставить по другой причине.
+# Очередь после простоя — --backlog апдейтов сценариев (пользователи вперемешку, даты на --backlog-age секунд
+# в прошлом) лежат в getUpdates до старта бота; seconds — время, за которое бот ответил на все, кроме
+# отброшенных как устаревшие (старше INGEST_MAX_AGE).
+# Результат сравнивается с baseline.json (по профилю режим-движок[-webhook]): падение updates/s, рост p99, памяти
+# или числа апдейтов без ответа больше --tolerance — регрессия, код выхода 1.
+# --update-baseline перезаписывает профиль.
+# Базовые значения зависят от машины — обновляй их на той же, где гоняешь сравнение.
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+SELLER_OFFSET = 10 ** 9  # продавцы заказов — отдельные пользователи, которые не пишут боту
+USER_OFFSET = 10 ** 6
+ADMIN_CHAT_ID = 1
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _rss_mb() -> float:
+    # пиковый RSS процесса (бот и генератор нагрузки в одном процессе); ru_maxrss на Linux — в КБ
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class _Waiter:
+    __slots__ = ("expect", "sent_at", "done", "latency")
+
+    def __init__(self, expect: Optional[str], sent_at: float):
+        self.expect = expect  # None — подходит любой вызов в чат
+        self.sent_at = sent_at
+        self.done = threading.Event()
+        self.latency = 0.0
+
+
+class Tracker:
+    # сопоставляет вызовы API с ожидающими апдейтами: по chat_id, для answerCallbackQuery — по id callback'а
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_chat: Dict[int, Deque[_Waiter]] = {}
+        self._by_callback: Dict[str, _Waiter] = {}
+        self.latencies: List[float] = []
+
+    def expect(self, chat_id: int, expect: Optional[str], callback_id: Optional[str] = None) -> _Waiter:
+        w = _Waiter(expect, time.perf_counter())
+        with self._lock:
+            if callback_id is not None and expect in (None, "answerCallbackQuery"):
+                self._by_callback[callback_id] = w
+            else:
+                self._by_chat.setdefault(chat_id, deque()).append(w)
+        return w
+
+    def _finish(self, w: _Waiter, t: float) -> None:
+        w.latency = t - w.sent_at
+        self.latencies.append(w.latency)
+        w.done.set()
+
+    def on_call(self, method: str, params: Dict[str, str], t: float) -> None:
+        with self._lock:
+            if method == "answerCallbackQuery":
+                w = self._by_callback.pop(params.get("callback_query_id", ""), None)
+                if w is not None:
+                    self._finish(w, t)
+                return
+            chat = params.get("chat_id", "")
+            waiters = self._by_chat.get(int(chat)) if chat.lstrip("-").isdigit() else None
+            if waiters and waiters[0].expect in (None, method):
+                self._finish(waiters.popleft(), t)
+
+    def forget(self, chat_id: int, w: _Waiter) -> None:
+        # шаг не дождался ответа — поздний ответ не должен засчитаться следующему шагу
+        with self._lock:
+            waiters = self._by_chat.get(chat_id)
+            if waiters and w in waiters:
+                waiters.remove(w)
+            for key, other in list(self._by_callback.items()):
+                if other is w:
+                    del self._by_callback[key]
+
+
+class WebhookDelivery:
+    # доставка апдейтов POST'ом в webhook бота, как это делает Telegram
+    def __init__(self, server, secret: str):
+        from ..webhook import SECRET_HEADER
+
+        self.address = server.server_address[:2]
+        self.path = server.webhook_path
+        self.headers = {SECRET_HEADER: secret, "Content-Type": "application/json"}
+        self._lock = threading.Lock()
+        self._next_update_id = 1
+        self.rejected = 0  # ответы 503
+
+    def push(self, update: dict) -> int:
+        with self._lock:
+            update_id = self._next_update_id
+            self._next_update_id += 1
+        body = json.dumps(dict(update, update_id=update_id), ensure_ascii=False).encode("utf-8")
+        while True:
+            conn = http.client.HTTPConnection(*self.address, timeout=30)
+            try:
+                conn.request("POST", self.path, body, self.headers)
+                resp = conn.getresponse()
+                resp.read()
+            finally:
+                conn.close()
+            if resp.status != 503:
+                break
+            with self._lock:
+                self.rejected += 1
+            time.sleep(float(resp.getheader("Retry-After") or 1))
+        if resp.status != 200:
+            raise RuntimeError(f"webhook answered {resp.status} to update {update_id}")
+        return update_id
+
+
+def prepare_orders(users: List[int], rounds: int) -> Dict[int, List[int]]:
+    # на каждый круг — оплаченный заказ, по которому покупатель откроет спор
+    from ..orders import ORDERS
+    from ..storage import add_balance
+
+    orders: Dict[int, List[int]] = {}
+    for uid in users:
+        add_balance(uid, rounds, op_id=f"loadtest:{uid}")
+        orders[uid] = []
+        for _ in range(rounds):
+            order = ORDERS.create(uid, uid + SELLER_OFFSET, 1)
+            ORDERS.transition(order.order_id, "pay", uid)
+            orders[uid].append(order.order_id)
+    return orders
+
+
+def run_synthetic(push: Callable[[dict], int], tracker: Tracker, args) -> Tuple[int, int]:
+    flows = args.flows.split(",") if args.flows else list(FLOWS)
+    users = [USER_OFFSET + i for i in range(args.users)]
+    orders = prepare_orders(users, args.rounds) if "order" in flows else {}
+    timeouts = [0]
+    lock = threading.Lock()
+
+    def virtual_user(uid: int) -> None:
+        rng = random.Random(args.seed * 1_000_003 + uid)
+        for message_id, (step, round_no) in enumerate(user_script(flows, args.rounds, rng), start=1):
+            order_id = orders[uid][round_no] if uid in orders else None
+            update = build_update(step, uid, message_id, order_id)
+            cb = update.get("callback_query")
+            w = tracker.expect(uid, step.expect, cb["id"] if cb else None)
+            push(update)
+            if not w.done.wait(args.step_timeout):
+                tracker.forget(uid, w)
+                with lock:
+                    timeouts[0] += 1
+            if args.think_ms:
+                time.sleep(rng.uniform(0, 2 * args.think_ms) / 1000)
+
+    threads = [threading.Thread(target=virtual_user, args=(uid,), daemon=True) for uid in users]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return len(tracker.latencies), timeouts[0]
+
+
+def run_replay(push: Callable[[dict], int], tracker: Tracker, args) -> Tuple[int, int]:
+    from ..ingest import user_key
+
+    waiters = []
+    interval = 1.0 / args.rate if args.rate > 0 else 0.0
+    next_at = time.perf_counter()
+    for update in read_recorded(args.replay):
+        chat_id = user_key(update)
+        cb = update.get("callback_query")
+        waiters.append((chat_id, tracker.expect(chat_id, None, cb["id"] if cb else None)))
+        push(update)
+        if interval:
+            next_at += interval
+            time.sleep(max(0.0, next_at - time.perf_counter()))
+    timeouts = 0
+    deadline = time.monotonic() + args.step_timeout
+    for chat_id, w in waiters:
+        if not w.done.wait(max(0.0, deadline - time.monotonic())):
+            tracker.forget(chat_id, w)
+            timeouts += 1
+    return len(tracker.latencies), timeouts
+
+
+def push_backlog(api: FakeBotApi, tracker: Tracker, args, max_age: float) -> List[Tuple[int, _Waiter]]:
+    flows = args.flows.split(",") if args.flows else list(FLOWS)
+    users = [USER_OFFSET + i for i in range(args.users)]
+    per_round = sum(len(FLOWS[f]) for f in flows if f != "start") or 1
+    rounds = max(1, math.ceil((args.backlog / len(users) - len(FLOWS["start"])) / per_round))
+    orders = prepare_orders(users, rounds) if "order" in flows else {}
+    scripts = {uid: user_script(flows, rounds, random.Random(args.seed * 1_000_003 + uid)) for uid in users}
+    date = int(time.time() - args.backlog_age)
+    stale = max_age > 0 and args.backlog_age > max_age
+    waiters = []
+    pushed = 0
+    for index in range(max(len(script) for script in scripts.values())):
+        for uid in users:
+            if pushed >= args.backlog or index >= len(scripts[uid]):
+                continue
+            step, round_no = scripts[uid][index]
+            update = build_update(step, uid, index + 1, orders[uid][round_no] if uid in orders else None)
+            cb = update.get("callback_query")
+            (cb or update)["message"]["date"] = date
+            if cb or not stale:
+                # устаревшие сообщения бот отбросит; у callback'ов даты нет — они обрабатываются всегда
+                waiters.append((uid, tracker.expect(uid, step.expect, cb["id"] if cb else None)))
+            api.push(update)
+            pushed += 1
+    return waiters
+
+
+def wait_backlog(tracker: Tracker, waiters: List[Tuple[int, _Waiter]], args) -> Tuple[int, int, float]:
+    # ждём, пока бот продвигается: таймаут --step-timeout отсчитывается от последнего ответа
+    timeouts = 0
+    deadline = time.monotonic() + args.step_timeout
+    finished = 0.0
+    for chat_id, w in waiters:
+        if w.done.wait(max(0.0, deadline - time.monotonic())):
+            deadline = time.monotonic() + args.step_timeout
+            finished = max(finished, w.sent_at + w.latency)
+        else:
+            tracker.forget(chat_id, w)
+            timeouts += 1
+    return len(waiters) - timeouts, timeouts, finished
+
+
+def seed_recipients(api: FakeBotApi, args) -> None:
+    from ..storage import touch_user
+
+    rng = random.Random(args.seed)
+    for i in range(args.broadcast):
+        uid = USER_OFFSET + i
+        touch_user(uid)
+        if rng.random() < args.blocked:
+            api.blocked.add(uid)
+
+
+def run_broadcast(api: FakeBotApi, args) -> Tuple[int, int]:
+    from ..broadcast import BROADCASTS
+
+    c = BROADCASTS.start(ADMIN_CHAT_ID, text="📣 loadtest")
+    BROADCASTS.join(c.campaign_id)
+    if c.blocked != len(api.blocked):
+        print(f"blocked recipients: {c.blocked} pruned, {len(api.blocked)} expected")
+    return c.sent + c.blocked, c.failed
+
+
+def make_config(args, workdir: str):
+    from ..config import load_config
+
+    os.environ.setdefault("BOT_TOKEN", "123456:loadtest")
+    # умолчания, зависящие от движка (INGEST_LANES), load_config берёт по BOT_ENGINE
+    os.environ["BOT_ENGINE"] = args.engine
+    cfg = load_config()
+    overrides = dict(
+        bot_engine=args.engine,
+        bot_mode=args.bot_mode,
+        webhook_listen="127.0.0.1",
+        webhook_port=0,
+        webhook_secret="loadtest",
+        admin_ids=[],
+        db_backend=args.db,
+        db_path=os.path.join(workdir, "bot.sqlite3"),
+        fsm_backend=args.db,
+        fsm_path=os.path.join(workdir, "fsm_states.sqlite3"),
+        media_cache_path=os.path.join(workdir, "media_cache.json"),
+        chat_path=os.path.join(workdir, "chat"),
+        broadcast_path=os.path.join(workdir, "broadcast"),
+        ingest_path=os.path.join(workdir, "update_offset.json"),
+        metrics_port=0,
+        shard_workers=1,
+    )
+    if not args.flood:
+        # виртуальные пользователи жмут кнопки быстрее человека — антифлуд мерил бы сам себя
+        overrides.update(flood_rate=0, flood_dup_window=0.0)
+    if not args.real_limits:
+        # лимиты Telegram на отправку ограничили бы прогон, а не бота
+        overrides.update(out_global_rate=100_000.0, out_chat_rate=1_000.0, out_chat_burst=1_000.0)
+    if args.ingest_lanes is not None:
+        overrides.update(ingest_lanes=args.ingest_lanes)
+    if args.max_age is not None:
+        overrides.update(ingest_max_age=args.max_age)
+    return dataclasses.replace(cfg, **overrides)
+
+
+def slow_db(latency: float) -> None:
+    # сетевая БД: каждая транзакция backend'а ждёт latency секунд (SQLite локально отвечает за микросекунды)
+    from contextlib import contextmanager
+
+    from ..storage import storage_backend
+
+    pool = storage_backend().pool
+    connection = pool.connection
+
+    @contextmanager
+    def slow_connection():
+        time.sleep(latency)
+        with connection() as conn:
+            yield conn
+
+    pool.connection = slow_connection
+
+
+def run(args) -> dict:
+    import telebot
+    from telebot import apihelper
+
+    from ..bot import build_bot, make_webhook_server, run_polling
+    from ..orders import ORDERS
+    from ..render import RENDERS
+    from ..storage import close_storage, init_storage
+
+    tracker = Tracker()
+    api = FakeBotApi(latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000, rate_429=args.rate_429,
+                     retry_after=args.retry_after, on_call=tracker.on_call, seed=args.seed).start()
+    apihelper.API_URL = api.api_url
+    if args.engine == "async":
+        from telebot import asyncio_helper
+        asyncio_helper.API_URL = api.api_url
+
+    with tempfile.TemporaryDirectory(prefix="loadtest-") as workdir:
+        cfg = make_config(args, workdir)
+        init_storage(cfg)
+        if args.db_latency_ms > 0:
+            slow_db(args.db_latency_ms / 1000)
+        bot = build_bot(cfg)
+        backlog = push_backlog(api, tracker, args, cfg.ingest_max_age) if args.backlog else []
+        webhook = delivery = None
+        push = api.push
+        if cfg.bot_mode == "webhook":
+            webhook = make_webhook_server(bot, cfg)
+            delivery = WebhookDelivery(webhook, cfg.webhook_secret)
+            push = delivery.push
+            poller = threading.Thread(target=webhook.serve_forever, name="bot-webhook", daemon=True)
+        else:
+            poller = threading.Thread(target=run_polling, args=(bot, cfg), name="bot-polling", daemon=True)
+        started = time.perf_counter()
+        poller.start()
+        try:
+            if webhook is None and not api.polling.wait(10):
+                raise RuntimeError("bot did not start polling the fake API")
+            if args.backlog:
+                # догонять бот начинает с запуска, время старта polling входит в замер
+                completed, timeouts, finished = wait_backlog(tracker, backlog, args)
+                elapsed = (finished or time.perf_counter()) - started
+            else:
+                if args.broadcast:
+                    seed_recipients(api, args)
+                started = time.perf_counter()
+                if args.broadcast:
+                    completed, timeouts = run_broadcast(api, args)
+                elif args.replay:
+                    completed, timeouts = run_replay(push, tracker, args)
+                else:
+                    completed, timeouts = run_synthetic(push, tracker, args)
+                elapsed = time.perf_counter() - started
+            ingest = bot.ingestor.stats() if bot.ingestor is not None else {}
+            flood = bot.flood.stats() if args.flood and bot.flood is not None else None
+        finally:
+            # infinity_polling пишет остановку как ошибку
+            telebot.logger.setLevel(logging.CRITICAL)
+            if webhook is not None:
+                webhook.stop()
+            else:
+                bot.stop_polling()
+            poller.join(timeout=10)
+            bot.stop()
+            ORDERS.close()
+            close_storage()
+            api.stop()
+
+    latencies = tracker.latencies
+    return {
+        "updates": completed + timeouts,
+        "timeouts": timeouts,
+        "seconds": round(elapsed, 3),
+        "updates_per_sec": round(completed / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(_percentile(latencies, 0.50) * 1000, 2),
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 2),
+        "rss_mb": round(_rss_mb(), 1),
+        "api_calls": dict(sorted(api.calls.items())),
+        "injected_429": api.injected_429,
+        # правки экранов, не отправленные из-за кэша (сэкономленные запросы к API)
+        "edits_skipped": RENDERS.stats()["skipped"],
+        # processed / failed / stale / duplicate и итоговый offset приёма апдейтов
+        "ingest": ingest,
+        **({"flood": flood} if flood is not None else {}),
+        # апдейты, которые webhook отклонил 503 и клиент доставил повторно
+        **({"webhook_rejected": delivery.rejected} if delivery is not None else {}),
+    }
+
+
+def compare(report: dict, base: dict, tolerance: float) -> List[str]:
+    problems = []
+    if report["timeouts"] > base.get("timeouts", 0) * (1 + tolerance):
+        problems.append(f"{report['timeouts']} updates got no response, baseline {base.get('timeouts', 0)}")
+    if report["updates_per_sec"] < base["updates_per_sec"] * (1 - tolerance):
+        problems.append(f"updates/s {report['updates_per_sec']} < baseline {base['updates_per_sec']}")
+    for key in ("p99_ms", "rss_mb"):
+        # у рассылки задержек нет (0) — не сравниваем
+        if base.get(key) and report[key] > base[key] * (1 + tolerance):
+            problems.append(f"{key} {report[key]} > baseline {base[key]}")
+    return problems
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    p = argparse.ArgumentParser(prog="python -m app.loadtest", description="Load test against a fake Bot API")
+    p.add_argument("--engine", choices=("sync", "async"), default="sync")
+    p.add_argument("--mode", dest="bot_mode", choices=("polling", "webhook"), default="polling",
+                   help="how updates reach the bot (webhook — POSTs to a local server, sync engine only)")
+    p.add_argument("--users", type=int, default=20, help="virtual users (synthetic mode)")
+    p.add_argument("--rounds", type=int, default=2, help="passes over all flows per user")
+    p.add_argument("--flows", default="", help=f"comma-separated subset of {','.join(FLOWS)}")
+    p.add_argument("--think-ms", type=float, default=0.0, help="mean pause between a user's steps")
+    p.add_argument("--replay", default="", help="jsonl file with recorded updates (open loop)")
+    p.add_argument("--broadcast", type=int, default=0, help="run a broadcast to this many users instead")
+    p.add_argument("--blocked", type=float, default=0.05, help="share of broadcast recipients who blocked the bot")
+    p.add_argument("--backlog", type=int, default=0, help="updates queued before the bot starts (catch-up run)")
+    p.add_argument("--backlog-age", type=float, default=60.0, help="how old the queued updates are, seconds")
+    p.add_argument("--max-age", type=float, default=None, help="override INGEST_MAX_AGE")
+    p.add_argument("--ingest-lanes", type=int, default=None, help="override INGEST_LANES (0 — skip_pending polling)")
+    p.add_argument("--rate", type=float, default=0.0, help="replay rate, updates/s (0 — as fast as possible)")
+    p.add_argument("--latency-ms", type=float, default=5.0, help="fake API response latency")
+    p.add_argument("--jitter-ms", type=float, default=0.0)
+    p.add_argument("--rate-429", type=float, default=0.0, help="share of API calls answered with 429")
+    p.add_argument("--retry-after", type=int, default=1)
+    p.add_argument("--step-timeout", type=float, default=5.0, help="seconds to wait for a response")
+    p.add_argument("--flood", action="store_true", help="keep the flood guard enabled")
+    p.add_argument("--db", choices=("memory", "sqlite"), default="memory",
+                   help="users, ledger and FSM storage (sqlite — handlers do real blocking I/O)")
+    p.add_argument("--db-latency-ms", type=float, default=0.0, help="with --db sqlite: added per DB transaction")
+    p.add_argument("--real-limits", action="store_true", help="keep OUT_* send rate limits")
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--baseline", default=BASELINE_PATH)
+    p.add_argument("--profile", default="",
+                   help="baseline key (default: <synthetic|replay|broadcast|backlog>-<engine>[-webhook][-flood][-sqlite])")
+    p.add_argument("--tolerance", type=float, default=0.2)
+    p.add_argument("--update-baseline", action="store_true")
+    args = p.parse_args(argv)
+    if args.bot_mode == "webhook" and (args.engine == "async" or args.backlog or args.broadcast):
+        p.error("--mode webhook works with the sync engine and synthetic or replay load")
+    return args
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    mode = "broadcast" if args.broadcast else "backlog" if args.backlog else "replay" if args.replay else "synthetic"
+    # --mode webhook, --flood и --db sqlite — отдельные профили со своим baseline
+    profile = args.profile or f"{mode}-{args.engine}" + ("-webhook" if args.bot_mode == "webhook" else "") + (
+        "-flood" if args.flood else "") + ("-sqlite" if args.db == "sqlite" else "")
+    report = run(args)
+    print(json.dumps({profile: report}, ensure_ascii=False, indent=1))
+
+    try:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baselines = json.load(f)
+    except FileNotFoundError:
+        baselines = {}
+    if args.update_baseline:
+        baselines[profile] = {k: report[k] for k in ("updates", "timeouts", "updates_per_sec", "p50_ms", "p99_ms", "rss_mb")}
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baselines, f, indent=1, sort_keys=True)
+            f.write("\n")
+        print(f"baseline {profile!r} updated")
+        return 0
+    base = baselines.get(profile)
+    if base is None:
+        print(f"no baseline for {profile!r}, run with --update-baseline")
+        return 0 if not report["timeouts"] else 1
+    problems = compare(report, base, args.tolerance)
+    for problem in problems:
+        print(f"REGRESSION: {problem}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
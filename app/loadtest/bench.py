@@ -0,0 +1,513 @@
+import argparse
+import os
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+# Микробенчмарки отдельных подсистем, без Telegram и фейкового API:
+#   python -m app.loadtest.bench ledger [--n 200000 --threads 8 --db memory|sqlite]
+#   python -m app.loadtest.bench orders [--n 1000000 --users 100000]
+#   python -m app.loadtest.bench shard [--n 20000 --workers 2 --delay-ms 1 --kill]
+#   python -m app.loadtest.bench catalog [--n 100000]
+#   python -m app.loadtest.bench fsm [--n 100000 --threads 8 --users 10000]
+#   python -m app.loadtest.bench flood [--n 1000000 --users 100000]
+#   python -m app.loadtest.bench router [--n 200000]
+#   python -m app.loadtest.bench users [--n 200000 --threads 8 --users 10000 --cache-size 5000]
+# Печатает операций/с и задержки; ничего не сравнивает с baseline — для замеров до/после правки.
+
+BENCHES: Dict[str, Callable[[argparse.Namespace], Dict[str, float]]] = {}
+DEFAULT_N: Dict[str, int] = {}
+
+
+def bench(name: str, n: int = 100_000):
+    def deco(fn):
+        BENCHES[name] = fn
+        DEFAULT_N[name] = n
+        return fn
+    return deco
+
+
+def _backend(args: argparse.Namespace, tmp: str):
+    from ..storage.backends import MemoryBackend, SqliteBackend
+
+    if args.db == "sqlite":
+        return SqliteBackend(os.path.join(tmp, "bench.db"), pool_size=max(4, args.threads))
+    return MemoryBackend()
+
+
+def _run_threads(threads: int, work: Callable[[int], None]) -> float:
+    pool = [threading.Thread(target=work, args=(t,)) for t in range(threads)]
+    started = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return time.perf_counter() - started
+
+
+def _percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+
+@bench("ledger")
+def bench_ledger(args: argparse.Namespace) -> Dict[str, float]:
+    # проводки по --users пользователям из --threads потоков + зачисления чужому шарду через transfers
+    from ..ingest import shard_of
+    from ..storage.ledger import Ledger
+
+    with tempfile.TemporaryDirectory() as tmp:
+        backend = _backend(args, tmp)
+        owner = Ledger(backend, flush_interval=args.flush_interval, owns=lambda uid: shard_of(uid, 2) == 0)
+        per_thread = args.n // args.threads
+        latencies: List[List[float]] = [[] for _ in range(args.threads)]
+
+        def work(t: int) -> None:
+            out = latencies[t]
+            for i in range(per_thread):
+                user_id = (t * per_thread + i) % args.users
+                started = time.perf_counter()
+                if shard_of(user_id, 2) == 0:
+                    owner.post(user_id, 1, f"b:{t}:{i}", "bench")
+                else:
+                    backend.add_transfer(f"b:{t}:{i}", user_id, 1, "bench")
+                out.append(time.perf_counter() - started)
+
+        elapsed = _run_threads(args.threads, work)
+        owner.flush()
+        drained = time.perf_counter()
+        peer = Ledger(backend, flush_interval=0, owns=lambda uid: shard_of(uid, 2) == 1)
+        transfers = 0
+        while True:
+            moved = peer.transfer_pump()
+            if not moved:
+                break
+            transfers += moved
+        drain = time.perf_counter() - drained
+        flat = [x for out in latencies for x in out]
+        result = {
+            "ops": len(flat),
+            "ops_per_s": len(flat) / elapsed,
+            "p50_us": _percentile(flat, 0.5) * 1e6,
+            "p99_us": _percentile(flat, 0.99) * 1e6,
+            "transfers_per_s": transfers / drain if drain else 0.0,
+        }
+        owner.close()
+        peer.close()
+        backend.close()
+    return result
+
+
+@bench("orders", n=1_000_000)
+def bench_orders(args: argparse.Namespace) -> Dict[str, float]:
+    # --n заказов (по умолчанию миллион): создание, оплата и доставка, экраны "мои заказы"/панель продавца,
+    # загрузка всех заказов при рестарте (open) и пиковая память
+    import resource
+
+    from ..orders import OrderBook
+
+    with tempfile.TemporaryDirectory() as tmp:
+        backend = _backend(args, tmp)
+        book = OrderBook(backend)
+        book.open(backend)
+        per_thread = args.n // args.threads
+        sellers = max(1, args.users // 10)
+
+        def create(t: int) -> None:
+            for i in range(per_thread):
+                buyer = (t * per_thread + i) % args.users + 1
+                order = book.create(buyer, args.users + 1 + buyer % sellers, 1)
+                book.transition(order.order_id, "pay", buyer)
+                if i % 2:
+                    book.transition(order.order_id, "delivered", order.seller_id)
+
+        elapsed = _run_threads(args.threads, create)
+        total = per_thread * args.threads
+        reads: List[float] = []
+        for uid in range(1, 1001):
+            started = time.perf_counter()
+            book.for_buyer(uid)
+            book.count("paid", seller_id=args.users + 1 + uid % sellers)
+            reads.append(time.perf_counter() - started)
+        book.close()
+        del book  # память на рестарте считаем для одного реестра
+        started = time.perf_counter()
+        restarted = OrderBook(backend)
+        loaded = restarted.open(backend)
+        load = time.perf_counter() - started
+        restarted.close()
+        backend.close()
+    return {
+        "orders": total,
+        "orders_per_s": total / elapsed,
+        "transitions_per_s": total * 1.5 / elapsed,
+        "screen_p99_us": _percentile(reads, 0.99) * 1e6,
+        "load_s": load,
+        "loaded": loaded,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+@bench("catalog")
+def bench_catalog(args: argparse.Namespace) -> Dict[str, float]:
+    # --n товаров: построение индексов и их память, задержки страницы категории, поиска и выборки по цене
+    import random
+    import tracemalloc
+
+    from ..catalog import Catalog
+    from ..keyboards import CATEGORIES
+    from ..models import Product
+
+    rng = random.Random(1)
+    words = [f"{w}{i}" for w in ("ключ", "аккаунт", "подписка", "скин", "игра", "gift", "steam", "pro")
+             for i in range(250)]
+    products = [
+        Product(i, rng.randrange(1, args.users + 1), rng.choice(CATEGORIES),
+                " ".join(rng.sample(words, 3)), rng.randrange(1, 100_000), " ".join(rng.sample(words, 5)))
+        for i in range(1, args.n + 1)
+    ]
+    catalog = Catalog()
+    tracemalloc.start()
+    started = time.perf_counter()
+    catalog.add_many(products)
+    build = time.perf_counter() - started
+    index_mb = tracemalloc.get_traced_memory()[0] / 2**20
+    tracemalloc.stop()
+
+    def timed(fn, repeat: int = 2000) -> List[float]:
+        out = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn()
+            out.append(time.perf_counter() - started)
+        return out
+
+    def page():
+        items, cursor = catalog.browse(rng.choice(CATEGORIES))
+        if cursor:
+            catalog.browse(rng.choice(CATEGORIES), cursor)
+
+    browse = timed(page)
+    search = timed(lambda: catalog.search(" ".join(rng.sample(words, 2))[:-1]))
+    prefix = timed(lambda: catalog.search(rng.choice(words)[:3]))
+    price = timed(lambda: catalog.price_range(rng.randrange(100_000), 100_000))
+    return {
+        "products": len(catalog),
+        "build_s": build,
+        "index_mb": index_mb,
+        "browse_p99_us": _percentile(browse, 0.99) * 1e6,
+        "search_p50_us": _percentile(search, 0.5) * 1e6,
+        "search_p99_us": _percentile(search, 0.99) * 1e6,
+        "prefix_p99_us": _percentile(prefix, 0.99) * 1e6,
+        "price_p99_us": _percentile(price, 0.99) * 1e6,
+    }
+
+
+@bench("fsm")
+def bench_fsm(args: argparse.Namespace) -> Dict[str, float]:
+    # SqliteStateStorage: --n операций из --threads потоков, на каждое сообщение get_state (StateFilter),
+    # каждое десятое — переход сценария (set_state/set_data/delete_state); задержки чтения и записи
+    from ..storage.fsm import SqliteStateStorage
+
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = SqliteStateStorage(os.path.join(tmp, "fsm.sqlite3"), pool_size=max(4, args.threads))
+        per_thread = args.n // args.threads
+        reads: List[List[float]] = [[] for _ in range(args.threads)]
+        writes: List[List[float]] = [[] for _ in range(args.threads)]
+
+        def work(t: int) -> None:
+            for i in range(per_thread):
+                user_id = (t * per_thread + i * 7919) % args.users
+                started = time.perf_counter()
+                storage.get_state(user_id, user_id)
+                reads[t].append(time.perf_counter() - started)
+                if i % 10 == 0:
+                    started = time.perf_counter()
+                    if i % 30 == 0:
+                        storage.delete_state(user_id, user_id)
+                    else:
+                        storage.set_state(user_id, user_id, "waiting_amount")
+                        storage.set_data(user_id, user_id, "step", i)
+                    writes[t].append(time.perf_counter() - started)
+
+        elapsed = _run_threads(args.threads, work)
+        storage.close()
+    flat_reads = [x for out in reads for x in out]
+    flat_writes = [x for out in writes for x in out]
+    return {
+        "ops": len(flat_reads) + len(flat_writes),
+        "ops_per_s": (len(flat_reads) + len(flat_writes)) / elapsed,
+        "get_p50_us": _percentile(flat_reads, 0.5) * 1e6,
+        "get_p99_us": _percentile(flat_reads, 0.99) * 1e6,
+        "set_p50_us": _percentile(flat_writes, 0.5) * 1e6,
+        "set_p99_us": _percentile(flat_writes, 0.99) * 1e6,
+    }
+
+
+@bench("flood", n=1_000_000)
+def bench_flood(args: argparse.Namespace) -> Dict[str, float]:
+    # накладные FloodGuard на апдейт в потоке приёма: --n апдейтов (сообщения, в т.ч. в состоянии поддержки,
+    # и callback'и) от --users пользователей, память на отслеживаемых пользователей
+    import random
+    import tracemalloc
+
+    from telebot.types import Update
+
+    from ..flood import FloodGuard
+    from ..states import SupportStates
+
+    rng = random.Random(1)
+    support = SupportStates.waiting_message.name
+
+    def update(user_id: int, kind: int) -> Update:
+        sender = {"id": user_id, "is_bot": False, "first_name": "u"}
+        if kind == 0:
+            return Update.de_json({"update_id": 1, "callback_query": {
+                "id": "1", "chat_instance": "1", "data": f"NAV:{rng.randrange(5)}", "from": sender}})
+        return Update.de_json({"update_id": 1, "message": {
+            "message_id": 1, "date": 0, "text": "hi", "from": sender, "chat": {"id": user_id, "type": "private"}}})
+
+    sample = [(update(rng.randrange(1, args.users + 1), i % 3), support if i % 10 == 0 else None)
+              for i in range(min(args.n, 50_000))]
+    # виртуальные часы: поток 2000 апдейтов/с, большинство укладывается в лимиты — замеряем обычный путь
+    now = [0.0]
+    guard = FloodGuard(max_users=args.users, clock=lambda: now[0])
+    started = time.perf_counter()
+    passed = 0
+    for i in range(args.n):
+        now[0] += 0.0005
+        u, state = sample[i % len(sample)]
+        if guard.needs_state(u):
+            passed += guard.check(u, state)
+        else:
+            passed += guard.check(u)
+    elapsed = time.perf_counter() - started
+    stats = guard.stats()
+    # память на отслеживаемых пользователей — отдельным проходом, tracemalloc искажает время
+    tracemalloc.start()
+    fresh = FloodGuard(max_users=args.users, clock=lambda: now[0])
+    for u, _ in sample:
+        fresh.check(u)
+    users_mb = tracemalloc.get_traced_memory()[0] / 2**20
+    tracemalloc.stop()
+    return {
+        "updates": args.n,
+        "ns_per_update": elapsed / args.n * 1e9,
+        "passed": passed,
+        "dropped": args.n - passed,
+        "users": stats["users"],
+        "users_mb": users_mb * stats["users"] / max(1, fresh.stats()["users"]),
+    }
+
+
+# маршруты callback'ов бота (handlers/*) и примеры callback_data к ним; args — число int-аргументов
+_ROUTES = [
+    ("NAV", "home", 0), ("NAV", "catalog", 0), ("NAV", "page", 1), ("NAV", "noop", 0), ("NAV", "profile", 0),
+    ("NAV", "wallet", 0), ("NAV", None, 0), ("CAT", None, 0), ("WAL", "history", 0), ("WAL", "history_before", 1),
+    ("WAL", "topup", 0), ("WAL", "withdraw", 0), ("SUP", "open", 0), ("SUP", "contact", 0),
+    ("CHAT", "start", 0), ("CHAT", "order", 1), ("CHAT", "history", 0), ("SELL", "verify_phone", 0),
+    ("ORD", "new", 1), ("ORD", "my", 0), ("ORD", "my_before", 1),
+] + [("ORD", action, 1) for action in ("pay", "cancel", "delivered", "confirm", "dispute", "refund", "release")]
+
+
+@bench("router", n=200_000)
+def bench_router(args: argparse.Namespace) -> Dict[str, float]:
+    # разбор callback_data: CallbackRouter (один dict-поиск) против прежней цепочки startswith()-фильтров,
+    # которые telebot проверял по очереди, а хендлер потом сам разбирал data; одинаковый набор --n нажатий
+    import random
+
+    from ..callbacks import pack, unpack
+    from ..router import CallbackRouter
+
+    async def handler(c, *a):
+        pass
+
+    router = CallbackRouter()
+    chain = []
+    # как и в старых модулях, общий обработчик action стоит после точных
+    for action, sub, nargs in sorted(_ROUTES, key=lambda route: route[1] is None):
+        router.route(action, sub, args=(int,) * nargs)(handler)
+        prefix = pack(action, sub) if sub is not None else action + ":"
+        chain.append((lambda c, prefix=prefix: c.data and c.data.startswith(prefix), nargs))
+
+    class Query:
+        __slots__ = ("data",)
+
+        def __init__(self, data: str):
+            self.data = data
+
+    rng = random.Random(1)
+    sample = []
+    for _ in range(10_000):
+        action, sub, nargs = rng.choice(_ROUTES)
+        sub = sub or rng.choice(("main", "games", "soft"))
+        sample.append(Query(pack(action, sub, *(str(rng.randrange(1, 10**6)) for _ in range(nargs)))))
+
+    def old(c) -> None:
+        for matches, nargs in chain:
+            if matches(c):
+                parts = unpack(c.data)
+                tuple(int(v) for v in parts[2:2 + nargs])
+                return
+
+    def new(c) -> None:
+        router.resolve(c.data)
+
+    result: Dict[str, float] = {"routes": len(_ROUTES), "dispatches": args.n}
+    for name, fn in (("chain", old), ("router", new)):
+        started = time.perf_counter()
+        for i in range(args.n):
+            fn(sample[i % len(sample)])
+        result[f"{name}_ns"] = (time.perf_counter() - started) / args.n * 1e9
+    result["speedup"] = result["chain_ns"] / result["router_ns"]
+    return result
+
+
+@bench("users", n=200_000)
+def bench_users(args: argparse.Namespace) -> Dict[str, float]:
+    # UserRepository на MemoryBackend и SqliteBackend: --n операций из --threads потоков (get, каждая пятая —
+    # update) по --users пользователям с LRU на --cache-size, write-behind раз в --flush-interval;
+    # ops/s, задержки и итоговый flush для каждого backend'а (--db не учитывается)
+    import random
+
+    from ..storage.backends import MemoryBackend, SqliteBackend
+    from ..storage.repository import UserRepository
+
+    result: Dict[str, float] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        backends = (("memory", MemoryBackend()),
+                    ("sqlite", SqliteBackend(os.path.join(tmp, "users.db"), pool_size=max(4, args.threads))))
+        for name, backend in backends:
+            repo = UserRepository(backend, cache_size=args.cache_size, flush_interval=args.flush_interval)
+            per_thread = args.n // args.threads
+            gets: List[List[float]] = [[] for _ in range(args.threads)]
+            updates: List[List[float]] = [[] for _ in range(args.threads)]
+
+            def work(t: int) -> None:
+                rng = random.Random(t)
+                for i in range(per_thread):
+                    user_id = rng.randrange(1, args.users + 1)
+                    started = time.perf_counter()
+                    if i % 5 == 0:
+                        repo.update(user_id, lambda u: setattr(u, "balance", u.balance + 1))
+                        updates[t].append(time.perf_counter() - started)
+                    else:
+                        repo.get(user_id)
+                        gets[t].append(time.perf_counter() - started)
+
+            elapsed = _run_threads(args.threads, work)
+            started = time.perf_counter()
+            repo.flush()
+            flush = time.perf_counter() - started
+            repo.close()
+            flat_gets = [x for out in gets for x in out]
+            flat_updates = [x for out in updates for x in out]
+            result.update({
+                f"{name}_ops_per_s": (len(flat_gets) + len(flat_updates)) / elapsed,
+                f"{name}_get_p99_us": _percentile(flat_gets, 0.99) * 1e6,
+                f"{name}_update_p99_us": _percentile(flat_updates, 0.99) * 1e6,
+                f"{name}_final_flush_ms": flush * 1000,
+            })
+    return result
+
+
+def _sleep_worker(delay: float, index: int, cfg, inbox, acks, heartbeat, lanes: int, lane_queue_size: int) -> None:
+    # воркер шарда без бота: "хендлер" спит delay секунд
+    import signal
+
+    from ..shard import serve
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    serve(index, inbox, acks, heartbeat, lanes, lane_queue_size, lambda raw: time.sleep(delay))
+
+
+def make_runner(workers: int, lanes: int, lane_queue_size: int, delay: float, queue_size: int = 1000,
+                health_timeout: float = 30.0, on_done=None):
+    from functools import partial
+
+    from ..config import load_config
+    from ..shard import ShardedRunner
+
+    os.environ.setdefault("BOT_TOKEN", "123456:bench")
+    return ShardedRunner(load_config(), workers=workers, lanes=lanes, queue_size=queue_size,
+                         lane_queue_size=lane_queue_size, health_timeout=health_timeout, on_done=on_done,
+                         worker=partial(_sleep_worker, delay))
+
+
+@bench("shard", n=20_000)
+def bench_shard(args: argparse.Namespace) -> Dict[str, float]:
+    # --n апдейтов через ShardedRunner в --workers процессов с "хендлером" на --delay-ms: пропускная способность,
+    # пик неподтверждённых (ограничен очередями — backpressure) и, с --kill, отсутствие потерь при убийстве воркера
+    import random
+    import resource
+
+    done = set()
+    lock = threading.Lock()
+
+    def on_done(update_id: int) -> None:
+        with lock:
+            done.add(update_id)
+
+    runner = make_runner(args.workers, args.lanes, args.lane_queue, args.delay_ms / 1000, on_done=on_done)
+    runner.start()
+    rng = random.Random(1)
+    peak = 0
+    started = time.perf_counter()
+    for update_id in range(1, args.n + 1):
+        user_id = rng.randrange(1, args.users + 1)
+        runner.dispatch({"update_id": update_id, "message": {"from": {"id": user_id}, "chat": {"id": user_id}}})
+        if update_id % 100 == 0:
+            peak = max(peak, runner.in_flight())
+        if args.kill and update_id == args.n // 2:
+            runner.procs[0].kill()
+    dispatched = time.perf_counter() - started
+    while runner.in_flight():
+        runner.check_health()
+        for i in range(runner.workers):
+            runner._flush_resend(i)
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - started
+    runner.stop()
+    runner.drain()
+    return {
+        "updates": args.n,
+        "done": len(done),
+        "updates_per_s": args.n / elapsed,
+        "dispatch_s": dispatched,
+        "peak_in_flight": peak,
+        "restarts": sum(runner.restarts),
+        "ingest_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(prog="python -m app.loadtest.bench", description="Subsystem micro-benchmarks")
+    p.add_argument("name", choices=sorted(BENCHES))
+    p.add_argument("--n", type=int, default=None, help="operations (default depends on the benchmark)")
+    p.add_argument("--threads", type=int, default=8)
+    p.add_argument("--users", type=int, default=10_000)
+    p.add_argument("--db", choices=("memory", "sqlite"), default="memory")
+    p.add_argument("--flush-interval", type=float, default=0.2)
+    p.add_argument("--cache-size", type=int, default=5_000, help="users: UserRepository LRU size")
+    p.add_argument("--workers", type=int, default=2, help="shard: worker processes")
+    p.add_argument("--lanes", type=int, default=4, help="shard: lanes per worker")
+    p.add_argument("--lane-queue", type=int, default=100, help="shard: lane queue size")
+    p.add_argument("--delay-ms", type=float, default=1.0, help="shard: simulated handler time")
+    p.add_argument("--kill", action="store_true", help="shard: kill a worker halfway and check nothing is lost")
+    args = p.parse_args(argv)
+    if args.n is None:
+        args.n = DEFAULT_N[args.name]
+    return args
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    result = BENCHES[args.name](args)
+    print(f"{args.name}: " + ", ".join(f"{k}={v:.1f}" if isinstance(v, float) else f"{k}={v}"
+                                       for k, v in result.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,213 @@
+import json
+import random
+import re
+import socket
+import threading
+import time
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Set
+from urllib.parse import parse_qsl, urlsplit
+
+# Фейковый Bot API для нагрузочных прогонов: отдаёт апдейты через getUpdates (long polling)
+# и отвечает на вызовы бота правдоподобными объектами, не ходя в Telegram.
+# - задержка ответа latency ± jitter секунд на каждый вызов, кроме getUpdates;
+# - с вероятностью rate_429 вызов отвечает 429 Too Many Requests с parameters.retry_after;
+# - вызовы в чаты из blocked отвечают 403, как для заблокировавших бота;
+# - on_call(method, params, t) вызывается для каждого обработанного вызова (t — time.perf_counter()).
+# Параметры читаются из query string, urlencoded/JSON-тела и простых полей multipart (файлы пропускаются).
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "loadtest", "username": "loadtest_bot"}
+# sendPhoto отвечает этим file_id, дальше бот шлёт фото по нему (см. MediaCache)
+PHOTO_FILE_ID = "loadtest-photo"
+
+_MULTIPART_FIELD = re.compile(
+    rb'Content-Disposition: form-data; name="([^"]+)"(?:; filename="[^"]*")?\r\n(?:[^\r\n]+\r\n)*\r\n(.*?)\r\n--',
+    re.S,
+)
+_NO_RESULT = {"answerCallbackQuery", "answerInlineQuery", "setWebhook", "deleteWebhook", "setMyCommands",
+              "deleteMessage", "sendChatAction"}
+
+
+def _parse_body(content_type: str, body: bytes) -> Dict[str, str]:
+    if not body:
+        return {}
+    if content_type.startswith("application/json"):
+        return {k: v if isinstance(v, str) else json.dumps(v) for k, v in json.loads(body).items()}
+    if content_type.startswith("multipart/form-data"):
+        return {
+            name.decode(): value.decode("utf-8", "replace")
+            for name, value in _MULTIPART_FIELD.findall(body)
+            if len(value) < 4096  # содержимое загружаемого файла не нужно
+        }
+    return dict(parse_qsl(body.decode("utf-8", "replace")))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "FakeBotApi"
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        # заголовки и тело уходят разными write — без TCP_NODELAY keep-alive упирается в Nagle/delayed ACK
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):  # noqa: A002 — сигнатура BaseHTTPRequestHandler
+        pass
+
+    def _handle(self) -> None:
+        url = urlsplit(self.path)
+        parts = url.path.strip("/").split("/")
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        if len(parts) != 2 or not parts[0].startswith("bot"):
+            self._reply(HTTPStatus.NOT_FOUND, {"ok": False, "error_code": 404, "description": "Not Found"})
+            return
+        params = dict(parse_qsl(url.query))
+        params.update(_parse_body(self.headers.get("Content-Type", ""), body))
+        status, payload = self.server.call(parts[1], params)
+        self._reply(status, payload)
+
+    do_GET = _handle
+    do_POST = _handle
+
+    def _reply(self, status: int, payload: dict) -> None:
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class FakeBotApi(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, jitter: float = 0.0,
+                 rate_429: float = 0.0, retry_after: int = 1, poll_wait: float = 0.5,
+                 on_call: Optional[Callable[[str, Dict[str, str], float], None]] = None, seed: int = 0):
+        super().__init__((host, port), _Handler)
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        # long polling держим не дольше poll_wait: остановка бота не ждёт таймаут клиента
+        self.poll_wait = poll_wait
+        self.on_call = on_call
+        self._random = random.Random(seed)
+        self._cond = threading.Condition()
+        self._updates: List[dict] = []  # ещё не подтверждённые offset'ом
+        self._next_update_id = 1
+        self._next_message_id = 1000
+        self.calls: Dict[str, int] = {}
+        self.injected_429 = 0
+        self.blocked: Set[int] = set()
+        # бот начал обычный polling (после skip_pending): апдейты больше не будут пропущены
+        self.polling = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def api_url(self) -> str:
+        # формат apihelper.API_URL / asyncio_helper.API_URL
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/bot{{0}}/{{1}}"
+
+    def start(self) -> "FakeBotApi":
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-bot-api", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def push(self, update: dict) -> int:
+        # update без update_id; возвращает присвоенный id
+        with self._cond:
+            update_id = self._next_update_id
+            self._next_update_id += 1
+            self._updates.append(dict(update, update_id=update_id))
+            self._cond.notify_all()
+        return update_id
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._updates)
+
+    def _get_updates(self, params: Dict[str, str]) -> List[dict]:
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        timeout = min(float(params.get("timeout") or 0), self.poll_wait)
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            if offset < 0:
+                # skip_pending: клиент просит последние |offset| апдейтов, чтобы подтвердить их
+                return self._updates[offset:]
+            self.polling.set()
+            if offset:
+                self._updates = [u for u in self._updates if u["update_id"] >= offset]
+            while not self._updates:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                self._cond.wait(left)
+            return self._updates[:limit]
+
+    def _message(self, params: Dict[str, str]) -> dict:
+        with self._cond:
+            self._next_message_id += 1
+            message_id = int(params.get("message_id") or 0) or self._next_message_id
+        chat_id = int(params.get("chat_id") or 0)
+        msg = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+        }
+        if "text" in params:
+            msg["text"] = params["text"]
+        if "caption" in params:
+            msg["caption"] = params["caption"]
+        return msg
+
+    def call(self, method: str, params: Dict[str, str]):
+        if method == "getUpdates":
+            return HTTPStatus.OK, {"ok": True, "result": self._get_updates(params)}
+        delay = self.latency + (self._random.uniform(-self.jitter, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+        with self._cond:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            limited = self.rate_429 > 0 and self._random.random() < self.rate_429
+            if limited:
+                self.injected_429 += 1
+        chat = params.get("chat_id", "")
+        if chat.lstrip("-").isdigit() and int(chat) in self.blocked:
+            return HTTPStatus.FORBIDDEN, {
+                "ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user",
+            }
+        if limited:
+            return HTTPStatus.TOO_MANY_REQUESTS, {
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }
+        if method == "getMe":
+            result = BOT_USER
+        elif method in _NO_RESULT:
+            result = True
+        elif method == "copyMessage":
+            result = {"message_id": self._message(params)["message_id"]}
+        elif method == "sendPhoto":
+            result = self._message(params)
+            result["photo"] = [{"file_id": PHOTO_FILE_ID, "file_unique_id": PHOTO_FILE_ID, "width": 1, "height": 1}]
+        elif method.startswith(("send", "edit")):
+            result = self._message(params)
+        else:
+            result = True
+        if self.on_call is not None:
+            self.on_call(method, params, time.perf_counter())
+        return HTTPStatus.OK, {"ok": True, "result": result}
@@ -0,0 +1,141 @@
+import itertools
+import json
+import random
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Сценарии нагрузки. Виртуальный пользователь проходит /start и затем потоки в случайном порядке;
+# каждый шаг — один апдейт и метод API, которым бот на него отвечает (по нему шаг считается выполненным).
+# Повторные нажатия той же кнопки — как у живых пользователей, экран при этом не меняется.
+# В данных callback'ов "{order}" подставляется id заказа пользователя на текущий круг
+# (заказы заранее создаются оплаченными, см. __main__.prepare_orders).
+
+_callback_ids = itertools.count(1)
+
+
+@dataclass(frozen=True)
+class Step:
+    kind: str  # text / callback / contact
+    payload: str
+    expect: str  # метод Bot API, завершающий шаг
+
+
+def text(payload: str, expect: str = "sendMessage") -> Step:
+    return Step("text", payload, expect)
+
+
+def callback(payload: str, expect: str = "answerCallbackQuery") -> Step:
+    return Step("callback", payload, expect)
+
+
+def contact(expect: str = "sendMessage") -> Step:
+    return Step("contact", "", expect)
+
+
+FLOWS: Dict[str, List[Step]] = {
+    "start": [text("/start", "sendPhoto")],
+    "nav": [
+        callback("NAV:page:2"),
+        callback("NAV:page:3"),
+        callback("NAV:page:1"),
+        callback("NAV:catalog", "sendMessage"),
+        callback("NAV:home"),
+        callback("NAV:home"),
+    ],
+    "profile": [
+        callback("NAV:profile"),
+        callback("NAV:profile"),
+        callback("ORD:my"),
+        callback("NAV:home"),
+    ],
+    "wallet": [
+        callback("NAV:wallet"),
+        callback("NAV:wallet"),
+        callback("WAL:history"),
+        callback("WAL:topup", "sendMessage"),
+        text("сто"),
+        text("100"),
+        callback("WAL:withdraw", "sendMessage"),
+        text("100000"),
+    ],
+    "support": [
+        callback("SUP:open", "sendMessage"),
+        callback("SUP:contact", "sendMessage"),
+        text("Не пришёл товар по заказу"),
+    ],
+    "seller": [
+        callback("SELL:verify_phone", "sendMessage"),
+        text("+70000000000"),
+        contact(),
+    ],
+    "order": [
+        callback("ORD:delivered:{order}"),  # покупателю недоступно — алерт
+        callback("ORD:dispute:{order}", "sendMessage"),
+        callback("ORD:confirm:{order}"),  # спор уже открыт — алерт
+    ],
+}
+
+
+def _user(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": f"u{user_id}", "language_code": "ru"}
+
+
+def _message(user_id: int, message_id: int, **fields) -> dict:
+    return dict({
+        "message_id": message_id,
+        "from": _user(user_id),
+        "chat": {"id": user_id, "type": "private"},
+        "date": int(time.time()),
+    }, **fields)
+
+
+def build_update(step: Step, user_id: int, message_id: int, order_id: Optional[int] = None) -> dict:
+    # update_id проставляет FakeBotApi.push
+    if step.kind == "text":
+        fields = {"text": step.payload}
+        if step.payload.startswith("/"):
+            command = step.payload.split()[0]
+            fields["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+        return {"message": _message(user_id, message_id, **fields)}
+    if step.kind == "contact":
+        return {"message": _message(user_id, message_id, contact={
+            "phone_number": "+70000000000", "first_name": f"u{user_id}", "user_id": user_id,
+        })}
+    data = step.payload.format(order=order_id or 0)
+    return {"callback_query": {
+        "id": str(next(_callback_ids)),
+        "from": _user(user_id),
+        "chat_instance": str(user_id),
+        # кнопка "нажата" под сообщением бота с главным экраном
+        "message": {
+            "message_id": 1,
+            "from": {"id": 1, "is_bot": True, "first_name": "loadtest"},
+            "chat": {"id": user_id, "type": "private"},
+            "date": int(time.time()),
+            "caption": "main",
+        },
+        "data": data,
+    }}
+
+
+def user_script(flows: List[str], rounds: int, rng: random.Random) -> List[Tuple[Step, int]]:
+    # (шаг, номер круга): /start, затем rounds раз все потоки (кроме start) в случайном порядке
+    steps = [(step, 0) for step in FLOWS["start"]]
+    names = [f for f in flows if f != "start"]
+    for i in range(rounds):
+        rng.shuffle(names)
+        for name in names:
+            steps.extend((step, i) for step in FLOWS[name])
+    return steps
+
+
+def read_recorded(path: str) -> Iterator[dict]:
+    # записанный поток: по апдейту (JSON Bot API) в строке; update_id перенумеровывается
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                update = json.loads(line)
+                update.pop("update_id", None)
+                yield update
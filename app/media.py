@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from typing import Dict, Optional, Tuple
+
+from telebot.types import Message
+
+from .engine import API_ERRORS, Engine
+
+# Кэш загруженных медиа: после первой отправки файла храним file_id от Telegram
+# и дальше шлём его вместо повторной multipart-загрузки.
+# Ключ = путь + sha256 содержимого + mtime, так что замена файла сама инвалидирует запись.
+# Маппинг сохраняется в JSON и переживает рестарт.
+
+
+class MediaCache:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._ids: Dict[str, str] = {}
+        # (abspath) -> (mtime_ns, size, key): чтобы не хешировать файл на каждый запрос
+        self._stat_memo: Dict[str, Tuple[int, int, str]] = {}
+        self._load()
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                self._ids = {str(k): str(v) for k, v in data.items()}
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"[media] cache {self.path} is unreadable, starting empty: {e!r}")
+
+    def _save(self) -> None:
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # свой временный файл у каждого процесса/экземпляра: воркеры шарда пишут один и тот же кэш
+        fd, tmp = tempfile.mkstemp(prefix=os.path.basename(self.path) + ".", suffix=".tmp",
+                                   dir=os.path.dirname(self.path) or ".")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self._ids, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def key_for(self, file_path: str) -> str:
+        abspath = os.path.abspath(file_path)
+        st = os.stat(abspath)
+        memo = self._stat_memo.get(abspath)
+        if memo and memo[0] == st.st_mtime_ns and memo[1] == st.st_size:
+            return memo[2]
+        h = hashlib.sha256()
+        with open(abspath, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 16), b""):
+                h.update(chunk)
+        key = f"{abspath}|{h.hexdigest()}|{st.st_mtime_ns}"
+        self._stat_memo[abspath] = (st.st_mtime_ns, st.st_size, key)
+        return key
+
+    def get(self, file_path: str) -> Optional[str]:
+        return self._ids.get(self.key_for(file_path))
+
+    def put(self, file_path: str, file_id: str) -> None:
+        key = self.key_for(file_path)
+        prefix = key.split("|", 1)[0] + "|"
+        with self._lock:
+            # старые версии того же файла больше не нужны
+            for k in [k for k in self._ids if k.startswith(prefix) and k != key]:
+                del self._ids[k]
+            self._ids[key] = file_id
+            self._save()
+
+    def drop(self, file_path: str) -> None:
+        key = self.key_for(file_path)
+        with self._lock:
+            if self._ids.pop(key, None) is not None:
+                self._save()
+
+    async def send_photo(self, bot: Engine, chat_id: int, file_path: str, **kwargs) -> Message:
+        file_id = self.get(file_path)
+        if file_id:
+            try:
+                return await bot.send_photo(chat_id, photo=file_id, **kwargs)
+            except API_ERRORS as e:
+                # устаревший/чужой file_id — забываем и грузим заново
+                if e.error_code != 400 or "file" not in (e.description or "").lower():
+                    raise
+                self.drop(file_path)
+
+        with open(file_path, "rb") as f:
+            msg = await bot.send_photo(chat_id, photo=f, **kwargs)
+        if msg and msg.photo:
+            # самый большой размер — последний
+            self.put(file_path, msg.photo[-1].file_id)
+        return msg
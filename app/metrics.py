@@ -0,0 +1,342 @@
+import contextvars
+import functools
+import heapq
+import sys
+import threading
+import time
+import traceback
+from bisect import bisect_left
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# Метрики горячего пути без внешних зависимостей:
+# - гистограммы задержек хендлеров (по хендлеру/маршруту) и вызовов бота (по методу);
+# - счётчики ошибок, апдейтов по типам, число выполняющихся хендлеров;
+# - внешние источники (очередь отправки, антифлуд) подключаются collect-функциями и читаются
+#   только при выдаче метрик.
+# Выдача — текст в формате Prometheus (локальный HTTP /metrics) и сводка для админской /stats.
+# Замер — два perf_counter и инкремент под локом гистограммы, порядка микросекунды на вызов.
+# Опционально — сэмплирующий профайлер: поток раз в interval снимает стеки потоков, занятых
+# хендлерами, и сохраняет стеки самых медленных вызовов (включается админом, по умолчанию выключен).
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Sample = Tuple[str, Dict[str, str], float]  # (имя, метки, значение)
+
+# текущий вызов хендлера в этом потоке/задаче — чтобы отличить вложенный (маршрут внутри роутера)
+_current: "contextvars.ContextVar[Optional[_Invocation]]" = contextvars.ContextVar("handler", default=None)
+
+
+_UPDATE_TYPES = (
+    "message", "callback_query", "inline_query", "edited_message", "chosen_inline_result",
+    "my_chat_member", "pre_checkout_query", "shipping_query", "poll_answer", "chat_member",
+)
+
+
+def update_type(update) -> str:
+    for kind in _UPDATE_TYPES:
+        if getattr(update, kind, None) is not None:
+            return kind
+    return "other"
+
+
+class Histogram:
+    __slots__ = ("counts", "total", "count", "in_flight", "_lock")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.in_flight = 0  # для хендлеров: начатые, но не завершённые вызовы
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, finished: bool = False) -> None:
+        i = bisect_left(BUCKETS, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.total += value
+            self.count += 1
+            if finished:
+                self.in_flight -= 1
+
+    def quantile(self, q: float) -> float:
+        # верхняя граница бакета, в который попадает квантиль
+        with self._lock:
+            counts, count = list(self.counts), self.count
+        if not count:
+            return 0.0
+        rank, seen = q * count, 0
+        for i, c in enumerate(counts):
+            seen += c
+            if seen >= rank:
+                return BUCKETS[i] if i < len(BUCKETS) else float("inf")
+        return float("inf")
+
+
+class _Invocation:
+    __slots__ = ("name", "started", "stacks")
+
+    def __init__(self, name: str, started: float):
+        self.name = name
+        self.started = started
+        self.stacks: Optional[Counter] = None
+
+
+class Profiler:
+    def __init__(self, metrics: "Metrics", threshold: float = 0.2, interval: float = 0.005, keep: int = 10):
+        self.metrics = metrics
+        self.threshold = threshold
+        self.interval = interval
+        self.keep = keep
+        self.slowest: List[Tuple[float, int, str, Counter]] = []  # min-куча (длительность, seq, хендлер, стеки)
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="profiler", daemon=True)
+        self._thread.start()
+
+    def _loop(self) -> None:
+        while not self._stopped.wait(self.interval):
+            running = dict(self.metrics._running)
+            if not running:
+                continue
+            frames = sys._current_frames()
+            for thread_id, inv in running.items():
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                stack = tuple(f"{fs.filename}:{fs.lineno} {fs.name}" for fs in traceback.extract_stack(frame, limit=25))
+                if inv.stacks is None:
+                    inv.stacks = Counter()
+                inv.stacks[stack] += 1
+
+    def record(self, inv: _Invocation, duration: float) -> None:
+        if duration < self.threshold:
+            return
+        with self._lock:
+            self._seq += 1
+            item = (duration, self._seq, inv.name, inv.stacks or Counter())
+            if len(self.slowest) < self.keep:
+                heapq.heappush(self.slowest, item)
+            elif duration > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, item)
+
+    def dump(self) -> str:
+        with self._lock:
+            items = sorted(self.slowest, reverse=True)
+        if not items:
+            return f"Нет вызовов дольше {self.threshold * 1000:.0f} мс."
+        out = []
+        for duration, _, name, stacks in items:
+            out.append(f"=== {name}: {duration * 1000:.1f} ms, samples: {sum(stacks.values())}")
+            for stack, n in stacks.most_common(3):
+                out.append(f"--- {n} samples")
+                out.extend("  " + line for line in stack)
+        return "\n".join(out)
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join(timeout=1)
+
+
+class Metrics:
+    def __init__(self):
+        self.started = time.time()
+        self._hists: Dict[Tuple[str, str, str], Histogram] = {}
+        self._counters: Dict[Tuple[str, str, str], float] = {}
+        # поток -> текущий хендлер (для профайлера); в async-движке все хендлеры делят поток loop'а,
+        # поэтому там стеки приписываются приблизительно
+        self._running: Dict[int, _Invocation] = {}
+        self._collectors: Dict[str, Callable[[], Iterable[Sample]]] = {}
+        self._lock = threading.Lock()
+        self.profiler: Optional[Profiler] = None
+
+    # --- запись ---
+
+    def histogram(self, name: str, label: str, value: str) -> Histogram:
+        key = (name, label, value)
+        h = self._hists.get(key)
+        if h is None:
+            with self._lock:
+                h = self._hists.setdefault(key, Histogram())
+        return h
+
+    def inc(self, name: str, label: str, value: str, amount: float = 1) -> None:
+        key = (name, label, value)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def add_collector(self, key: str, collect: Callable[[], Iterable[Sample]]) -> None:
+        # повторная регистрация с тем же ключом заменяет прежний источник
+        self._collectors[key] = collect
+
+    def instrument(self, fn: Callable, name: str) -> Callable:
+        # обёртка async-хендлера: задержка, ошибки, число выполняющихся;
+        # учёт вызовов для профайлера — только пока он включён
+        hist = self.histogram("bot_handler_seconds", "handler", name)
+
+        @functools.wraps(fn)
+        async def handler(*args, **kwargs):
+            started = time.perf_counter()
+            with hist._lock:
+                hist.in_flight += 1
+            token = inv = None
+            if self.profiler is not None:
+                outer = _current.get()
+                if outer is None:
+                    inv = _Invocation(name, started)
+                    token = _current.set(inv)
+                    self._running[threading.get_ident()] = inv
+                else:
+                    outer.name = name  # вложенный вызов (маршрут роутера) информативнее обёртки
+            try:
+                return await fn(*args, **kwargs)
+            except Exception:
+                self.inc("bot_handler_errors_total", "handler", name)
+                raise
+            finally:
+                duration = time.perf_counter() - started
+                hist.observe(duration, finished=True)
+                if token is not None:
+                    _current.reset(token)
+                    thread_id = threading.get_ident()
+                    if self._running.get(thread_id) is inv:
+                        del self._running[thread_id]
+                    profiler = self.profiler
+                    if profiler is not None:
+                        profiler.record(inv, duration)
+
+        return handler
+
+    def timed_call(self, method: str, call: Callable[[], Any]) -> Any:
+        started = time.perf_counter()
+        try:
+            return call()
+        except Exception:
+            self.inc("bot_method_errors_total", "method", method)
+            raise
+        finally:
+            self.histogram("bot_method_seconds", "method", method).observe(time.perf_counter() - started)
+
+    async def timed_await(self, method: str, awaitable) -> Any:
+        started = time.perf_counter()
+        try:
+            return await awaitable
+        except Exception:
+            self.inc("bot_method_errors_total", "method", method)
+            raise
+        finally:
+            self.histogram("bot_method_seconds", "method", method).observe(time.perf_counter() - started)
+
+    # --- профайлер ---
+
+    def start_profiler(self, threshold: float = 0.2) -> Profiler:
+        self.stop_profiler()
+        self.profiler = Profiler(self, threshold=threshold)
+        return self.profiler
+
+    def stop_profiler(self) -> Optional[Profiler]:
+        profiler, self.profiler = self.profiler, None
+        if profiler is not None:
+            profiler.stop()
+        return profiler
+
+    # --- выдача ---
+
+    def render(self) -> str:
+        out: List[str] = []
+        with self._lock:
+            hists = sorted(self._hists.items())
+            counters = sorted(self._counters.items())
+        typed = set()
+
+        def header(name: str, kind: str):
+            if name not in typed:
+                typed.add(name)
+                out.append(f"# TYPE {name} {kind}")
+
+        out.append("# TYPE bot_uptime_seconds gauge")
+        out.append(f"bot_uptime_seconds {time.time() - self.started:.0f}")
+        for (name, label, value), h in hists:
+            header(name, "histogram")
+            with h._lock:
+                counts, total, count = list(h.counts), h.total, h.count
+            cumulative = 0
+            for bound, c in zip(BUCKETS + (float("inf"),), counts):
+                cumulative += c
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                out.append(f'{name}_bucket{{{label}="{value}",le="{le}"}} {cumulative}')
+            out.append(f'{name}_sum{{{label}="{value}"}} {total:.6f}')
+            out.append(f'{name}_count{{{label}="{value}"}} {count}')
+        for (name, label, value), n in counters:
+            header(name, "counter")
+            out.append(f'{name}{{{label}="{value}"}} {n:g}')
+        for (name, label, value), h in hists:
+            if name == "bot_handler_seconds":
+                header("bot_handler_in_flight", "gauge")
+                out.append(f'bot_handler_in_flight{{handler="{value}"}} {h.in_flight}')
+        for collect in list(self._collectors.values()):
+            for name, labels, value in collect():
+                header(name, "gauge")
+                rendered = ",".join(f'{k}="{v}"' for k, v in labels.items())
+                out.append(f"{name}{{{rendered}}} {value:g}" if rendered else f"{name} {value:g}")
+        return "\n".join(out) + "\n"
+
+    def summary(self, top: int = 8) -> str:
+        # короткая сводка для /stats
+        with self._lock:
+            hists = list(self._hists.items())
+            counters = dict(self._counters)
+        busy = sum(h.in_flight for (name, _, _), h in hists if name == "bot_handler_seconds")
+        uptime = time.time() - self.started
+        updates = sum(v for (name, _, _), v in counters.items() if name == "bot_updates_total")
+        lines = [
+            f"⏱ Аптайм: {uptime / 3600:.1f} ч, апдейтов: {updates:g} ({updates / max(uptime, 1):.2f}/с), "
+            f"выполняется хендлеров: {busy}",
+        ]
+        for title, metric, label in (("Хендлеры", "bot_handler_seconds", "handler"),
+                                     ("Вызовы API", "bot_method_seconds", "method")):
+            rows = sorted(((h.total, value, h) for (name, _, value), h in hists if name == metric and h.count),
+                          key=lambda r: r[0], reverse=True)[:top]
+            if not rows:
+                continue
+            lines.append(f"\n{title} (по суммарному времени): вызовов / avg / p95 / ошибок")
+            errors_name = "bot_handler_errors_total" if label == "handler" else "bot_method_errors_total"
+            for total, value, h in rows:
+                errors = counters.get((errors_name, label, value), 0)
+                lines.append(f"{value}: {h.count} / {total / h.count * 1000:.1f} мс / "
+                             f"≤{h.quantile(0.95) * 1000:g} мс / {errors:g}")
+        extra = [f"{name}{labels or ''} = {value:g}"
+                 for collect in list(self._collectors.values()) for name, labels, value in collect()]
+        if extra:
+            lines.append("\n" + "\n".join(extra))
+        return "\n".join(lines)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(metrics: "Metrics", host: str, port: int) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    server.metrics = metrics
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+# общий реестр процесса
+METRICS = Metrics()
@@ -8,10 +8,35 @@ class User:
     is_seller: bool = False
     seller_verified_phone: bool = False
     balance: int = 0  # внутренняя валюта (заглушка)
+    is_blocked: bool = False  # бот заблокирован пользователем / аккаунт удалён — не слать рассылки
 
-@dataclass
+@dataclass(slots=True)  # заказов в памяти миллионы
 class Order:
     order_id: int
     buyer_id: int
     seller_id: int
-    status: str  # created / paid / delivered / confirmed / dispute
+    status: str  # created / paid / delivered / confirmed / dispute / refunded / cancelled
+    amount: int = 0  # сумма в эскроу, во внутренней валюте
+    created_at: float = 0.0
+    updated_at: float = 0.0  # время последней смены статуса, от него считаются таймеры
+    escalated: bool = False  # таймер эскалации сработал в текущем статусе
+    version: int = 0  # растёт с каждым изменением: переход пишется в БД, только если версия не сменилась
+
+@dataclass
+class Product:
+    product_id: int
+    seller_id: int
+    category: str  # код из keyboards.CATEGORIES
+    title: str
+    price: int  # во внутренней валюте, как User.balance
+    description: str = ""
+
+@dataclass
+class LedgerEntry:
+    user_id: int
+    seq: int  # порядковый номер операции пользователя, 1, 2, ...
+    op_id: str  # ключ идемпотентности: повтор с тем же op_id не создаёт новую запись
+    delta: int
+    balance_after: int
+    kind: str  # topup / withdraw / adjust / order / ...
+    created_at: float
@@ -0,0 +1,422 @@
+import heapq
+import itertools
+import threading
+import time
+from bisect import bisect_left, insort
+from dataclasses import replace
+from itertools import islice
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .models import Order
+from .storage import apply_transfers, post_balance
+from .storage.backends import MemoryBackend, StorageBackend, Transfer
+
+# Заказы и их жизненный цикл (эскроу):
+#   created --pay--> paid --delivered--> delivered --confirm--> confirmed
+#   created --cancel--> cancelled
+#   paid/delivered --dispute--> dispute --refund--> refunded (деньги покупателю) | --release--> confirmed
+# Кто может сделать переход, задаёт TRANSITIONS; всё остальное — OrderError.
+# Источник правды — таблица orders в БД (backend): каждый заказ пишется при создании, каждый переход —
+# условным UPDATE по версии, вместе с выплатой/возвратом в таблицу transfers (одна транзакция), так что
+# деньги в эскроу не теряются при рестарте, а одновременные переходы из разных процессов не проходят оба.
+# В памяти — копия всех заказов (загружается при open) и индексы, чтобы экраны "мои заказы" и панель
+# продавца не ходили в БД:
+# - покупатель / продавец -> список order_id по возрастанию;
+# - статус и (продавец, статус) -> упорядоченное множество order_id (dict без значений).
+# При SHARD_WORKERS>1 (shared) покупатель и продавец заказа живут в разных процессах: перед переходом заказ
+# перечитывается из БД, а изменения других процессов подтягиваются раз в sync_interval.
+# Таймеры — куча (deadline, seq, order_id): доставленный заказ подтверждается автоматически,
+# зависший без доставки или спор эскалируется. Таймеры заказа ведёт процесс покупателя (owns).
+# Перенос/отмена таймера не трогает кучу: устаревшие записи отбрасываются при срабатывании (сверка seq).
+
+CREATED = "created"
+PAID = "paid"
+DELIVERED = "delivered"
+CONFIRMED = "confirmed"
+DISPUTE = "dispute"
+REFUNDED = "refunded"
+CANCELLED = "cancelled"
+
+BUYER = "buyer"
+SELLER = "seller"
+SYSTEM = "system"
+ADMIN = "admin"
+
+# (статус, действие) -> (новый статус, кто может)
+TRANSITIONS: Dict[Tuple[str, str], Tuple[str, frozenset]] = {
+    (CREATED, "pay"): (PAID, frozenset({BUYER})),
+    # отмена только покупателем: созданный заказ меняет один процесс, оплата не гонится с отменой
+    (CREATED, "cancel"): (CANCELLED, frozenset({BUYER})),
+    (PAID, "delivered"): (DELIVERED, frozenset({SELLER})),
+    (DELIVERED, "confirm"): (CONFIRMED, frozenset({BUYER, SYSTEM})),
+    (PAID, "dispute"): (DISPUTE, frozenset({BUYER, SELLER})),
+    (DELIVERED, "dispute"): (DISPUTE, frozenset({BUYER, SELLER})),
+    (DISPUTE, "refund"): (REFUNDED, frozenset({ADMIN})),
+    (DISPUTE, "release"): (CONFIRMED, frozenset({ADMIN})),
+}
+
+AUTO_CONFIRMED = "auto_confirmed"
+ESCALATED = "escalated"
+
+RETRY_DELAY = 60.0
+LOAD_BATCH = 10_000
+SYNC_OVERLAP = 5.0  # перечитываем изменения с запасом: updated_at пишут разные процессы
+
+
+class OrderError(ValueError):
+    pass
+
+
+class OrderBook:
+    def __init__(self, backend: Optional[StorageBackend] = None,
+                 confirm_timeout: float = 72 * 3600, escalate_timeout: float = 24 * 3600,
+                 stripes: int = 64,
+                 on_transition: Optional[Callable[[Order, str], None]] = None,
+                 payouts: Optional[Callable[[Order], List[Transfer]]] = None,
+                 on_payout: Optional[Callable[[], None]] = None,
+                 on_event: Optional[Callable[[Order, str], None]] = None,
+                 clock: Callable[[], float] = time.time, sync_interval: float = 1.0):
+        self.backend = backend or MemoryBackend()
+        self.confirm_timeout = confirm_timeout
+        self.escalate_timeout = escalate_timeout
+        # on_transition(order, new_status) — до записи перехода (списание в эскроу), исключение его отменяет;
+        # payouts(order) — зачисления для нового статуса, пишутся в transfers вместе с переходом;
+        # on_payout() — после записи перехода с зачислениями (провести их сразу);
+        # on_event(order, event) — после срабатывания таймера (уведомления)
+        self.on_transition = on_transition
+        self.payouts = payouts
+        self.on_payout = on_payout
+        self.on_event = on_event
+        self._clock = clock
+        # shared — БД общая для нескольких процессов; owns(user_id) — пользователь этого процесса
+        self.shared = False
+        self.owns: Optional[Callable[[int], bool]] = None
+        self.sync_interval = sync_interval
+        self._synced_at = 0.0
+        self._next_sync = 0.0
+        self._orders: Dict[int, Order] = {}
+        self._by_buyer: Dict[int, List[int]] = {}
+        self._by_seller: Dict[int, List[int]] = {}
+        self._by_status: Dict[str, Dict[int, None]] = {}
+        self._by_seller_status: Dict[Tuple[int, str], Dict[int, None]] = {}
+        self._stripes = [threading.Lock() for _ in range(stripes)]
+        self._lock = threading.Lock()  # индексы и таймеры
+        self._timers: List[Tuple[float, int, int]] = []
+        self._timer_seq: Dict[int, int] = {}  # order_id -> seq действующего таймера
+        self._seq = itertools.count()
+        self._wakeup = threading.Condition(self._lock)
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+
+    def __len__(self) -> int:
+        return len(self._orders)
+
+    def open(self, backend: StorageBackend, shared: bool = False,
+             owns: Optional[Callable[[int], bool]] = None) -> int:
+        # переключение на backend из init_storage и загрузка его заказов; возвращает их число
+        with self._lock:
+            self.backend = backend
+            self.shared = shared
+            self.owns = owns
+            self._orders.clear()
+            self._by_buyer.clear()
+            self._by_seller.clear()
+            self._by_status.clear()
+            self._by_seller_status.clear()
+            self._timers.clear()
+            self._timer_seq.clear()
+            self._stopped = False
+        started = self._clock()
+        loaded = after = 0
+        while True:
+            batch = backend.load_orders(after, LOAD_BATCH)
+            if not batch:
+                break
+            with self._lock:
+                for order in batch:
+                    self._apply_locked(order)
+            after = batch[-1].order_id
+            loaded += len(batch)
+        with self._lock:
+            self._synced_at = started
+            self._next_sync = started + self.sync_interval
+            if shared:
+                self._ensure_thread_locked()
+        return loaded
+
+    def get(self, order_id: int) -> Optional[Order]:
+        order = self._orders.get(order_id)
+        if order is None and self.shared:
+            order = self._refresh(order_id)  # создан другим процессом после последней синхронизации
+        return order
+
+    # --- запись ---
+
+    def create(self, buyer_id: int, seller_id: int, amount: int) -> Order:
+        if buyer_id == seller_id:
+            raise OrderError("buyer and seller must differ")
+        if amount <= 0:
+            raise OrderError("amount must be positive")
+        now = self._clock()
+        order = Order(0, buyer_id, seller_id, CREATED, amount=amount, created_at=now, updated_at=now)
+        order.order_id = self.backend.create_order(order)
+        with self._lock:
+            return self._apply_locked(order)
+
+    def role_of(self, order: Order, user_id: int) -> Optional[str]:
+        if user_id == order.buyer_id:
+            return BUYER
+        if user_id == order.seller_id:
+            return SELLER
+        return None
+
+    def transition(self, order_id: int, action: str, user_id: Optional[int] = None, admin: bool = False) -> Order:
+        # user_id=None — системный переход (таймер); admin — действие админа (разбор спора)
+        with self._stripes[order_id % len(self._stripes)]:
+            order = self._refresh(order_id) if self.shared else self._orders.get(order_id)
+            if order is None:
+                raise OrderError(f"order {order_id} not found")
+            rule = TRANSITIONS.get((order.status, action))
+            if rule is None:
+                raise OrderError(f"cannot {action} order in status {order.status}")
+            new_status, roles = rule
+            role = SYSTEM if user_id is None else self.role_of(order, user_id)
+            if admin and ADMIN in roles:
+                role = ADMIN
+            if role not in roles:
+                raise OrderError(f"{role or 'stranger'} cannot {action} this order")
+            if self.on_transition is not None:
+                self.on_transition(order, new_status)
+            updated = replace(order, status=new_status, updated_at=self._clock(), escalated=False,
+                              version=order.version + 1)
+            transfers = self.payouts(updated) if self.payouts is not None else []
+            if not self.backend.update_order(updated, transfers):
+                self._refresh(order_id)
+                raise OrderError(f"order {order_id} was changed concurrently")
+            with self._lock:
+                order = self._apply_locked(updated)
+        if transfers and self.on_payout is not None:
+            self.on_payout()
+        return order
+
+    def _refresh(self, order_id: int) -> Optional[Order]:
+        stored = self.backend.load_order(order_id)
+        if stored is None:
+            return self._orders.get(order_id)
+        with self._lock:
+            return self._apply_locked(stored)
+
+    def _apply_locked(self, order: Order) -> Order:
+        # заказ из БД или после перехода; копия в памяти обновляется на месте (её держат хендлеры)
+        cur = self._orders.get(order.order_id)
+        if cur is None:
+            self._orders[order.order_id] = cur = order
+            _add_id(self._by_buyer.setdefault(order.buyer_id, []), order.order_id)
+            _add_id(self._by_seller.setdefault(order.seller_id, []), order.order_id)
+        elif order.version > cur.version:
+            self._unindex_status(cur)
+            cur.status = order.status
+            cur.updated_at = order.updated_at
+            cur.escalated = order.escalated
+            cur.version = order.version
+        else:
+            return cur
+        self._index_status(cur)
+        if self.owns is None or self.owns(cur.buyer_id):
+            self._schedule_locked(cur)
+        return cur
+
+    def sync(self) -> int:
+        # подтянуть заказы, созданные и изменённые другими процессами
+        started = self._clock()
+        changed = self.backend.load_orders_updated(self._synced_at - SYNC_OVERLAP)
+        with self._lock:
+            for order in changed:
+                self._apply_locked(order)
+            self._synced_at = started
+        return len(changed)
+
+    def _index_status(self, order: Order) -> None:
+        self._by_status.setdefault(order.status, {})[order.order_id] = None
+        self._by_seller_status.setdefault((order.seller_id, order.status), {})[order.order_id] = None
+
+    def _unindex_status(self, order: Order) -> None:
+        for index, key in ((self._by_status, order.status),
+                           (self._by_seller_status, (order.seller_id, order.status))):
+            ids = index.get(key)
+            if ids is not None:
+                ids.pop(order.order_id, None)
+                if not ids:
+                    del index[key]
+
+    # --- чтение ---
+
+    def for_buyer(self, buyer_id: int, before_id: Optional[int] = None, limit: int = 10) -> List[Order]:
+        return self._page(self._by_buyer.get(buyer_id, []), before_id, limit)
+
+    def for_seller(self, seller_id: int, before_id: Optional[int] = None, limit: int = 10) -> List[Order]:
+        return self._page(self._by_seller.get(seller_id, []), before_id, limit)
+
+    def _page(self, ids: List[int], before_id: Optional[int], limit: int) -> List[Order]:
+        # от новых к старым, курсор — order_id последнего показанного
+        with self._lock:
+            end = bisect_left(ids, before_id) if before_id is not None else len(ids)
+            return [self._orders[i] for i in reversed(ids[max(0, end - limit):end])]
+
+    def with_status(self, status: str, limit: int = 10, seller_id: Optional[int] = None) -> List[Order]:
+        # в порядке перехода в статус: самые давние первыми
+        with self._lock:
+            ids = (self._by_status.get(status) if seller_id is None
+                   else self._by_seller_status.get((seller_id, status)))
+            return [self._orders[i] for i in islice(ids or (), limit)]
+
+    def count(self, status: str, seller_id: Optional[int] = None) -> int:
+        ids = (self._by_status.get(status) if seller_id is None
+               else self._by_seller_status.get((seller_id, status)))
+        return len(ids) if ids else 0
+
+    # --- таймеры ---
+
+    def _deadline_of(self, order: Order) -> Optional[float]:
+        if order.status == DELIVERED:
+            return order.updated_at + self.confirm_timeout
+        if order.status in (PAID, DISPUTE) and not order.escalated:
+            return order.updated_at + self.escalate_timeout
+        return None
+
+    def _schedule_locked(self, order: Order, deadline: Optional[float] = None) -> None:
+        if deadline is None:
+            deadline = self._deadline_of(order)
+        if deadline is None:
+            self._timer_seq.pop(order.order_id, None)
+            return
+        seq = next(self._seq)
+        self._timer_seq[order.order_id] = seq
+        heapq.heappush(self._timers, (deadline, seq, order.order_id))
+        # куча не чистится при переносах — пересобираем, когда устаревших записей слишком много
+        if len(self._timers) > 2 * len(self._timer_seq) + 1024:
+            self._timers = [t for t in self._timers if self._timer_seq.get(t[2]) == t[1]]
+            heapq.heapify(self._timers)
+        if not self._ensure_thread_locked() and self._timers[0][1] == seq:
+            self._wakeup.notify()
+
+    def _ensure_thread_locked(self) -> bool:
+        # True — поток только что запущен
+        if self._thread is not None or self._stopped:
+            return False
+        self._thread = threading.Thread(target=self._timer_loop, name="order-timers", daemon=True)
+        self._thread.start()
+        return True
+
+    def _pop_due(self, now: float) -> List[int]:
+        due = []
+        with self._lock:
+            while self._timers and self._timers[0][0] <= now:
+                _, seq, order_id = heapq.heappop(self._timers)
+                if self._timer_seq.get(order_id) == seq:
+                    del self._timer_seq[order_id]
+                    due.append(order_id)
+        return due
+
+    def _escalate(self, order_id: int) -> Optional[Order]:
+        with self._stripes[order_id % len(self._stripes)]:
+            order = self._refresh(order_id) if self.shared else self._orders.get(order_id)
+            if order is None or order.status not in (PAID, DISPUTE) or order.escalated:
+                return None
+            updated = replace(order, escalated=True, version=order.version + 1)
+            if not self.backend.update_order(updated):
+                self._refresh(order_id)  # изменён другим процессом, таймер переставится по новой версии
+                return None
+            with self._lock:
+                return self._apply_locked(updated)
+
+    def run_due(self, now: Optional[float] = None) -> int:
+        # срабатывание просроченных таймеров; вызывается потоком таймеров (и вручную в скриптах)
+        fired = 0
+        for order_id in self._pop_due(self._clock() if now is None else now):
+            order = self._orders[order_id]
+            try:
+                if order.status == DELIVERED:
+                    try:
+                        order = self.transition(order_id, "confirm")
+                    except OrderError:
+                        if order.status != DELIVERED:
+                            continue  # статус успел смениться, таймер уже не нужен
+                        raise
+                    event = AUTO_CONFIRMED
+                else:
+                    order = self._escalate(order_id)
+                    if order is None:
+                        continue
+                    event = ESCALATED
+            except Exception as e:
+                print(f"[orders] timer for order {order_id} failed: {e!r}")
+                with self._lock:
+                    if order_id not in self._timer_seq:
+                        self._schedule_locked(order, self._clock() + RETRY_DELAY)
+                continue
+            fired += 1
+            if self.on_event is not None:
+                try:
+                    self.on_event(order, event)
+                except Exception as e:
+                    print(f"[orders] {event} handler for order {order_id} failed: {e!r}")
+        return fired
+
+    def _timer_loop(self) -> None:
+        while True:
+            with self._lock:
+                while not self._stopped:
+                    now = self._clock()
+                    delay = self._timers[0][0] - now if self._timers else None
+                    if self.shared:
+                        delay = min(delay, self._next_sync - now) if delay is not None else self._next_sync - now
+                    if delay is not None and delay <= 0:
+                        break
+                    self._wakeup.wait(delay)
+                if self._stopped:
+                    return
+                sync = self.shared and self._clock() >= self._next_sync
+                if sync:
+                    self._next_sync = self._clock() + self.sync_interval
+            if sync:
+                try:
+                    self.sync()
+                except Exception as e:
+                    print(f"[orders] sync failed: {e!r}")
+            self.run_due()
+
+    def close(self) -> None:
+        with self._lock:
+            self._stopped = True
+            self._wakeup.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+def _add_id(ids: List[int], order_id: int) -> None:
+    # id растут, свои заказы приходят по порядку; заказы других процессов — как получится
+    if not ids or ids[-1] < order_id:
+        ids.append(order_id)
+    elif ids[bisect_left(ids, order_id)] != order_id:
+        insort(ids, order_id)
+
+
+def hold(order: Order, new_status: str) -> None:
+    # оплата списывает сумму с покупателя в эскроу; op_id от заказа — повтор не спишет дважды
+    if new_status == PAID:
+        post_balance(order.buyer_id, -order.amount, f"order:{order.order_id}:pay", "order")
+
+
+def payouts(order: Order) -> List[Transfer]:
+    # из эскроу: продавцу при подтверждении, покупателю при возврате по спору
+    if order.status == CONFIRMED:
+        return [(f"order:{order.order_id}:payout", order.seller_id, order.amount, "order")]
+    if order.status == REFUNDED:
+        return [(f"order:{order.order_id}:refund", order.buyer_id, order.amount, "refund")]
+    return []
+
+
+# общий реестр заказов процесса; init_storage-backend подключается через ORDERS.open
+ORDERS = OrderBook(on_transition=hold, payouts=payouts, on_payout=apply_transfers)
@@ -0,0 +1,365 @@
+import functools
+import heapq
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import CancelledError, Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Планировщик исходящих вызовов Bot API.
+# - token bucket на чат и глобальный bucket (лимиты Telegram ~1 msg/s в чат и ~30 msg/s всего);
+# - приоритеты: интерактивные ответы хендлеров идут раньше массовых рассылок;
+# - на 429 ждём retry_after из ответа и повторяем (до max_retries); файлы загрузок перематываются к месту,
+#   с которого их читала первая попытка, а неперематываемые потоки не повторяются (тело было бы пустым);
+# - edit_* одного и того же сообщения, ещё не ушедшие в сеть, схлопываются — уходит только последний;
+#   повтор edit'а, который уже обогнал более новый edit того же сообщения, не отправляется.
+# Исполнение — фиксированный набор потоков-отправителей; вызывающий получает Future.
+# nonblocking=True: call не ждёт ответа, а возвращает Future (запрос идёт в event loop async-движка) —
+# поток-отправитель только планирует, и число запросов в полёте не ограничено числом потоков.
+# call() (ответы хендлеров sync-движка, поток ждёт результат) не ждёт bucket своего чата: токен списывается
+# в долг, и паузу отрабатывают рассылки и submit() в этот чат. Глобальный bucket и 429 соблюдаются всегда;
+# от заспамивших чатов защищает FloodGuard до хендлеров.
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+
+# метод -> (позиция chat_id, позиция message_id) в позиционных аргументах; None — нет такого аргумента
+SCHEDULED_METHODS: Dict[str, Tuple[int, Optional[int]]] = {
+    "send_message": (0, None),
+    "send_photo": (0, None),
+    "send_document": (0, None),
+    "copy_message": (0, None),
+    "forward_message": (0, None),
+    "edit_message_text": (1, 2),
+    "edit_message_caption": (1, 2),
+    "edit_message_reply_markup": (0, 1),
+}
+COALESCED_METHODS = ("edit_message_text", "edit_message_caption", "edit_message_reply_markup")
+
+_CHAT_BUCKETS_SOFT_LIMIT = 10_000
+
+
+def _arg(args: tuple, kwargs: dict, name: str, pos: Optional[int]):
+    if name in kwargs:
+        return kwargs[name]
+    if pos is not None and len(args) > pos:
+        return args[pos]
+    return None
+
+
+def _streams(args: tuple, kwargs: dict) -> List[Tuple[Any, Optional[int]]]:
+    # файловые аргументы загрузок и позиция, с которой их начнёт читать запрос (None — не перемотать)
+    streams = []
+    for value in itertools.chain(args, kwargs.values()):
+        if not hasattr(value, "read"):
+            continue
+        try:
+            pos = value.tell() if value.seekable() else None
+        except (AttributeError, OSError, ValueError):
+            pos = None
+        streams.append((value, pos))
+    return streams
+
+
+def retry_after_of(exc: BaseException) -> Optional[float]:
+    if getattr(exc, "error_code", None) != 429:
+        return None
+    params = (getattr(exc, "result_json", None) or {}).get("parameters") or {}
+    return float(params.get("retry_after") or 1)
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated", "blocked_until")
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+        self.blocked_until = 0.0  # до этого момента Telegram ответил 429 — ждут все, включая call()
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def delay(self, now: float) -> float:
+        # сколько ждать до свободного токена (0 — можно сейчас)
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+
+    def block(self, now: float, seconds: float) -> None:
+        self._refill(now)
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+        self.blocked_until = max(self.blocked_until, now + seconds)
+
+    def idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.burst
+
+
+class _Job:
+    __slots__ = ("method", "args", "kwargs", "chat_id", "priority", "seq", "futures",
+                 "coalesce_key", "attempts", "enqueued", "not_before", "paced", "streams")
+
+    def __init__(self, method, args, kwargs, chat_id, priority, seq, coalesce_key, now, paced=True):
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.chat_id = chat_id
+        self.priority = priority
+        self.seq = seq
+        self.futures: List[Future] = [Future()]
+        self.coalesce_key = coalesce_key
+        self.attempts = 0
+        self.enqueued = now
+        self.not_before = now
+        self.paced = paced  # False — не ждать bucket чата (call), см. заголовок модуля
+        self.streams = _streams(args, kwargs)
+
+    def rewind(self) -> bool:
+        # вернуть файлы загрузки к исходной позиции перед повтором; False — повторить нельзя
+        for stream, pos in self.streams:
+            if pos is None:
+                return False
+            try:
+                stream.seek(pos)
+            except (OSError, ValueError):
+                return False
+        return True
+
+
+class OutboundScheduler:
+    def __init__(self, call: Callable[[str, tuple, dict], Any], *,
+                 global_rate: float = 30.0, chat_rate: float = 1.0, chat_burst: float = 3.0,
+                 workers: int = 8, max_retries: int = 3, clock: Callable[[], float] = time.monotonic,
+                 nonblocking: bool = False):
+        self._call = call
+        self.nonblocking = nonblocking
+        self._clock = clock
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, max(1.0, global_rate), clock())
+        self._chats: "OrderedDict[Any, TokenBucket]" = OrderedDict()  # от давно не использованных к свежим
+        self._ready: List[Tuple[int, int, _Job]] = []  # (priority, seq, job)
+        self._delayed: List[Tuple[float, int, _Job]] = []  # (not_before, seq, job)
+        self._pending_edits: Dict[tuple, _Job] = {}  # ещё не отправленные edit'ы — в них схлопываются новые
+        self._latest_edits: Dict[tuple, _Job] = {}  # последний edit сообщения, пока он не завершён
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self.counters = {
+            "submitted": 0, "sent": 0, "failed": 0, "retried_429": 0, "coalesced": 0,
+            "in_flight": 0, "queue_wait_total": 0.0, "queue_wait_max": 0.0,
+            "latency_total": 0.0, "latency_max": 0.0,
+        }
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"outbound-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for t in self._threads:
+            t.start()
+
+    # --- постановка в очередь ---
+
+    def submit(self, method: str, args: tuple = (), kwargs: Optional[dict] = None,
+               priority: int = PRIORITY_INTERACTIVE, paced: bool = True) -> Future:
+        kwargs = kwargs or {}
+        chat_pos, msg_pos = SCHEDULED_METHODS.get(method, (0, None))
+        chat_id = _arg(args, kwargs, "chat_id", chat_pos)
+        key = None
+        if method in COALESCED_METHODS:
+            message_id = _arg(args, kwargs, "message_id", msg_pos)
+            if message_id is not None:
+                key = (method, chat_id, message_id)
+
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError("outbound scheduler is stopped")
+            self.counters["submitted"] += 1
+            if key is not None:
+                job = self._pending_edits.get(key)
+                if job is not None:
+                    # старый edit ещё не отправлен — подменяем содержимое, ответ получат все ожидающие
+                    job.args, job.kwargs = args, kwargs
+                    job.priority = min(job.priority, priority)
+                    fut: Future = Future()
+                    job.futures.append(fut)
+                    self.counters["coalesced"] += 1
+                    return fut
+            now = self._clock()
+            job = _Job(method, args, kwargs, chat_id, priority, next(self._seq), key, now, paced)
+            if key is not None:
+                self._pending_edits[key] = job
+                self._latest_edits[key] = job
+            heapq.heappush(self._ready, (job.priority, job.seq, job))
+            self._cond.notify()
+            return job.futures[0]
+
+    def call(self, method: str, *args, **kwargs) -> Any:
+        # вызывающий поток ждёт результат — не держим его паузой bucket'а чата
+        return self.submit(method, args, kwargs, paced=False).result()
+
+    # --- отправка ---
+
+    def _chat_bucket(self, chat_id, now: float) -> TokenBucket:
+        b = self._chats.get(chat_id)
+        if b is not None:
+            self._chats.move_to_end(chat_id)
+            return b
+        # полные (давно неактивные) bucket'ы ничего не ограничивают — выкидываем с давнего конца,
+        # пока попадаются такие: в среднем O(1) на новый чат, без обхода всех под блокировкой
+        while len(self._chats) >= _CHAT_BUCKETS_SOFT_LIMIT:
+            oldest = next(iter(self._chats.values()))
+            if not oldest.idle(now):
+                break
+            self._chats.popitem(last=False)
+        b = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst, now)
+        return b
+
+    def _next_job(self) -> Optional[_Job]:
+        with self._cond:
+            while True:
+                now = self._clock()
+                while self._delayed and self._delayed[0][0] <= now:
+                    _, _, job = heapq.heappop(self._delayed)
+                    heapq.heappush(self._ready, (job.priority, job.seq, job))
+                if not self._ready:
+                    if self._stopped and not self._delayed:
+                        return None
+                    timeout = self._delayed[0][0] - now if self._delayed else None
+                    self._cond.wait(timeout)
+                    continue
+
+                _, _, job = self._ready[0]
+                chat = self._chat_bucket(job.chat_id, now) if job.chat_id is not None else None
+                chat_wait = 0.0
+                if chat is not None:
+                    chat_wait = chat.delay(now) if job.paced else max(0.0, chat.blocked_until - now)
+                if chat_wait > 0:
+                    # этот чат пока занят — откладываем, остальные чаты идут дальше
+                    heapq.heappop(self._ready)
+                    job.not_before = now + chat_wait
+                    heapq.heappush(self._delayed, (job.not_before, job.seq, job))
+                    continue
+                global_wait = self._global.delay(now)
+                if global_wait > 0:
+                    self._cond.wait(global_wait)
+                    continue
+
+                heapq.heappop(self._ready)
+                self._global.consume(now)
+                if chat:
+                    chat.consume(now)
+                if job.coalesce_key is not None and self._pending_edits.get(job.coalesce_key) is job:
+                    del self._pending_edits[job.coalesce_key]
+                self.counters["in_flight"] += 1
+                if job.attempts == 0:
+                    wait = now - job.enqueued
+                    self.counters["queue_wait_total"] += wait
+                    self.counters["queue_wait_max"] = max(self.counters["queue_wait_max"], wait)
+                return job
+
+    def _worker(self) -> None:
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            try:
+                result = self._call(job.method, job.args, job.kwargs)
+            except BaseException as e:
+                self._on_error(job, e)
+            else:
+                if self.nonblocking:
+                    result.add_done_callback(functools.partial(self._settle, job))
+                else:
+                    self._finish(job, result=result)
+
+    def _settle(self, job: _Job, fut: Future) -> None:
+        # завершение запроса в режиме nonblocking (вызывается из event loop)
+        exc = fut.exception() if not fut.cancelled() else CancelledError()
+        if exc is not None:
+            self._on_error(job, exc)
+        else:
+            self._finish(job, result=fut.result())
+
+    def _on_error(self, job: _Job, exc: BaseException) -> None:
+        retry_after = retry_after_of(exc)
+        if retry_after is None or job.attempts >= self.max_retries or not job.rewind():
+            self._finish(job, exc=exc)
+            return
+        key = job.coalesce_key
+        with self._cond:
+            now = self._clock()
+            if key is not None and self._latest_edits.get(key) is not job:
+                # пока ждали, сообщение отредактировали заново — старое содержимое не досылаем
+                newer = self._latest_edits.get(key)
+                self.counters["in_flight"] -= 1
+                self.counters["coalesced"] += 1
+                if newer is not None:
+                    newer.futures.extend(job.futures)  # ответ получат вместе с новым edit'ом
+                    return
+            else:
+                job.attempts += 1
+                job.not_before = now + retry_after
+                if job.chat_id is not None:
+                    self._chat_bucket(job.chat_id, now).block(now, retry_after)
+                if key is not None:
+                    # новые edit'ы этого сообщения снова схлопываются в повтор
+                    self._pending_edits[key] = job
+                self.counters["retried_429"] += 1
+                self.counters["in_flight"] -= 1
+                heapq.heappush(self._delayed, (job.not_before, job.seq, job))
+                self._cond.notify()
+                return
+        # более новый edit уже завершён — его результата нет, ждущим отдаём ошибку старой попытки
+        for fut in job.futures:
+            fut.set_exception(exc)
+
+    def _finish(self, job: _Job, result: Any = None, exc: Optional[BaseException] = None) -> None:
+        with self._cond:
+            latency = self._clock() - job.enqueued
+            c = self.counters
+            c["in_flight"] -= 1
+            c["failed" if exc is not None else "sent"] += 1
+            c["latency_total"] += latency
+            c["latency_max"] = max(c["latency_max"], latency)
+            if job.coalesce_key is not None and self._latest_edits.get(job.coalesce_key) is job:
+                del self._latest_edits[job.coalesce_key]
+            futures = list(job.futures)  # после снятия с _latest_edits к job больше не добавят ожидающих
+        for fut in futures:
+            if exc is not None:
+                fut.set_exception(exc)
+            else:
+                fut.set_result(result)
+
+    # --- наблюдаемость и остановка ---
+
+    def queue_depth(self) -> int:
+        with self._cond:
+            return len(self._ready) + len(self._delayed)
+
+    def stats(self) -> dict:
+        with self._cond:
+            s = dict(self.counters)
+            s["queue_depth"] = len(self._ready) + len(self._delayed)
+            s["chat_buckets"] = len(self._chats)
+        done = s["sent"] + s["failed"]
+        s["latency_avg"] = s["latency_total"] / done if done else 0.0
+        return s
+
+    def stop(self, timeout: float = 10.0) -> None:
+        # дослать то, что уже в очереди, и остановить потоки
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        for t in self._threads:
+            t.join(timeout=timeout)
@@ -0,0 +1,145 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+from .storage.chatlog import RoomKey
+
+# Таблица маршрутизации чата покупатель <-> продавец, целиком в памяти:
+# - комната (buyer, seller, order) -> Room, в порядке активности (LRU);
+# - user_id -> комната, куда уходят его сообщения в режиме чата (последняя открытая/активная);
+# - (chat_id, message_id) копии у получателя -> комната: ответ реплаем уходит обратно по ней.
+# Ключ комнаты сам содержит обоих участников, поэтому вытесненная по простою комната
+# восстанавливается из ключа без обращения к хранилищу. История пишется отдельно (ChatLog).
+# Маршрут ответа, которого нет в памяти (копию доставил другой шард, процесс перезапущен),
+# ищется через resolve_reply — в общей истории чатов (диск). Промахи тоже запоминаются на miss_ttl секунд:
+# реплай на обычное сообщение бота не должен каждый раз читать сегменты. Маршруты и промахи —
+# LRU не больше max_reply_routes каждый.
+
+
+class Room:
+    __slots__ = ("key", "last_active")
+
+    def __init__(self, key: RoomKey, now: float):
+        self.key = key
+        self.last_active = now
+
+    @property
+    def buyer_id(self) -> int:
+        return self.key[0]
+
+    @property
+    def seller_id(self) -> int:
+        return self.key[1]
+
+    @property
+    def order_id(self) -> Optional[int]:
+        return self.key[2] or None
+
+    def peer(self, user_id: int) -> int:
+        return self.key[1] if user_id == self.key[0] else self.key[0]
+
+
+class Relay:
+    def __init__(self, idle_ttl: float = 1800, max_rooms: int = 50_000, max_reply_routes: int = 200_000,
+                 miss_ttl: float = 60.0, clock: Callable[[], float] = time.time):
+        self.idle_ttl = idle_ttl
+        self.max_rooms = max_rooms
+        self.max_reply_routes = max_reply_routes
+        self.miss_ttl = miss_ttl
+        self._clock = clock
+        self._rooms: "OrderedDict[RoomKey, Room]" = OrderedDict()
+        self._active: Dict[int, RoomKey] = {}
+        self._replies: "OrderedDict[Tuple[int, int], RoomKey]" = OrderedDict()
+        self._misses: "OrderedDict[Tuple[int, int], float]" = OrderedDict()  # -> когда не нашли
+        self._lock = threading.Lock()
+        self.resolve_reply: Optional[Callable[[int, int], Optional[RoomKey]]] = None
+
+    def __len__(self) -> int:
+        return len(self._rooms)
+
+    def _room(self, key: RoomKey, now: float) -> Room:
+        room = self._rooms.get(key)
+        if room is None:
+            room = self._rooms[key] = Room(key, now)
+        else:
+            room.last_active = now
+            self._rooms.move_to_end(key)
+        self._evict(now)
+        return room
+
+    def _evict(self, now: float) -> None:
+        while self._rooms:
+            key, room = next(iter(self._rooms.items()))
+            if len(self._rooms) <= self.max_rooms and now - room.last_active < self.idle_ttl:
+                break
+            del self._rooms[key]
+            for uid in key[:2]:
+                if self._active.get(uid) == key:
+                    del self._active[uid]
+
+    def open(self, user_id: int, buyer_id: int, seller_id: int, order_id: Optional[int] = None) -> Room:
+        key = (buyer_id, seller_id, order_id or 0)
+        with self._lock:
+            room = self._room(key, self._clock())
+            self._active[user_id] = key
+            return room
+
+    def room_of(self, user_id: int) -> Optional[Room]:
+        with self._lock:
+            key = self._active.get(user_id)
+            return self._room(key, self._clock()) if key is not None else None
+
+    def _remember_reply(self, msg: Tuple[int, int], key: RoomKey) -> None:
+        # под _lock
+        self._replies[msg] = key
+        self._replies.move_to_end(msg)
+        self._misses.pop(msg, None)
+        if len(self._replies) > self.max_reply_routes:
+            self._replies.popitem(last=False)
+
+    def _missed(self, msg: Tuple[int, int], now: float) -> bool:
+        # под _lock
+        at = self._misses.get(msg)
+        return at is not None and now - at < self.miss_ttl
+
+    def known_reply(self, chat_id: int, message_id: int) -> bool:
+        # for_reply ответит из памяти, не читая историю с диска
+        msg = (chat_id, message_id)
+        with self._lock:
+            return msg in self._replies or self._missed(msg, self._clock())
+
+    def for_reply(self, chat_id: int, message_id: int) -> Optional[Room]:
+        msg = (chat_id, message_id)
+        with self._lock:
+            key = self._replies.get(msg)
+            if key is not None:
+                return self._room(key, self._clock())
+            if self._missed(msg, self._clock()):
+                return None
+        key = self.resolve_reply(chat_id, message_id) if self.resolve_reply is not None else None
+        with self._lock:
+            if key is None:
+                self._misses[msg] = self._clock()
+                self._misses.move_to_end(msg)
+                if len(self._misses) > self.max_reply_routes:
+                    self._misses.popitem(last=False)
+                return None
+            self._remember_reply(msg, key)
+            return self._room(key, self._clock())
+
+    def delivered(self, room: Room, chat_id: int, message_id: int) -> None:
+        # копия у получателя: на неё можно ответить, и комната становится для него текущей
+        with self._lock:
+            self._remember_reply((chat_id, message_id), room.key)
+            self._active[chat_id] = room.key
+
+    def evict_idle(self) -> int:
+        with self._lock:
+            before = len(self._rooms)
+            self._evict(self._clock())
+            return before - len(self._rooms)
+
+
+# общая таблица комнат процесса
+RELAY = Relay()
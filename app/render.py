@@ -0,0 +1,119 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional, Tuple
+
+from telebot.types import CallbackQuery
+
+from .engine import API_ERRORS, Engine
+from .metrics import METRICS
+
+# Кэш отрисованных экранов: для (chat_id, message_id) помним хеш последней подписи и разметки,
+# которые ушли в Telegram. Повторное нажатие той же кнопки (профиль, кошелёк, "домой") даёт тот же
+# экран — правку не отправляем, только отвечаем на callback. Хешируется сам отрисованный текст, поэтому
+# изменение полей User (баланс, статус продавца и т.п.) меняет хеш, и правка уходит как обычно.
+# Записи вытесняются по LRU (max_entries) и по возрасту (ttl). Ответ "message is not modified"
+# (кэш пуст после рестарта, два одновременных нажатия) — тоже успех.
+
+ScreenKey = Tuple[int, int]
+
+
+def _not_modified(exc: BaseException) -> bool:
+    return getattr(exc, "error_code", None) == 400 and "message is not modified" in str(
+        getattr(exc, "description", "") or exc
+    )
+
+
+class RenderCache:
+    def __init__(self, max_entries: int = 100_000, ttl: float = 3600.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        # key -> (хеш подписи или None, если неизвестна; хеш разметки; время записи)
+        self._entries: "OrderedDict[ScreenKey, Tuple[Optional[int], int, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"skipped": 0, "edited": 0}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def unchanged(self, key: ScreenKey, caption_hash: Optional[int], markup_hash: int) -> bool:
+        # caption_hash=None — правится только разметка
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False
+            if self._clock() - entry[2] > self.ttl:
+                del self._entries[key]
+                return False
+            same = entry[1] == markup_hash and (caption_hash is None or entry[0] == caption_hash)
+            if same:
+                self._entries.move_to_end(key)
+                self.counters["skipped"] += 1
+            return same
+
+    def remember(self, key: ScreenKey, caption_hash: Optional[int], markup_hash: int) -> None:
+        with self._lock:
+            if caption_hash is None:
+                entry = self._entries.get(key)
+                caption_hash = entry[0] if entry is not None else None
+            self._entries[key] = (caption_hash, markup_hash, self._clock())
+            self._entries.move_to_end(key)
+            self.counters["edited"] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def forget(self, key: ScreenKey) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self.counters, entries=len(self._entries))
+
+
+# общий кэш экранов процесса
+RENDERS = RenderCache()
+METRICS.add_collector("render", lambda: [
+    ("bot_screen_edits", {"result": k}, v) for k, v in RENDERS.stats().items() if k != "entries"
+] + [("bot_screen_cache_entries", {}, len(RENDERS))])
+
+
+async def _edit(key: ScreenKey, caption_hash: Optional[int], markup_hash: int,
+                send: Callable[[], Awaitable]) -> None:
+    if RENDERS.unchanged(key, caption_hash, markup_hash):
+        return
+    try:
+        await send()
+    except API_ERRORS as e:
+        if not _not_modified(e):
+            RENDERS.forget(key)
+            raise
+    RENDERS.remember(key, caption_hash, markup_hash)
+
+
+async def show_screen(bot: Engine, c: CallbackQuery, caption: str, reply_markup, parse_mode: Optional[str] = None):
+    # подменить подпись и кнопки сообщения, на котором нажата кнопка, и ответить на callback
+    key = (c.message.chat.id, c.message.message_id)
+    await _edit(
+        key, hash((caption, parse_mode)), hash(reply_markup.to_json()),
+        lambda: bot.edit_message_caption(
+            caption=caption,
+            chat_id=key[0],
+            message_id=key[1],
+            reply_markup=reply_markup,
+            parse_mode=parse_mode,
+        ),
+    )
+    await bot.answer_callback_query(c.id)
+
+
+async def show_markup(bot: Engine, c: CallbackQuery, reply_markup):
+    # то же для одних кнопок (листание меню)
+    key = (c.message.chat.id, c.message.message_id)
+    await _edit(
+        key, None, hash(reply_markup.to_json()),
+        lambda: bot.edit_message_reply_markup(chat_id=key[0], message_id=key[1], reply_markup=reply_markup),
+    )
+    await bot.answer_callback_query(c.id)
@@ -0,0 +1,97 @@
+from typing import Awaitable, Callable, Dict, Optional, Sequence, Tuple
+
+from telebot.types import CallbackQuery
+
+from .callbacks import unpack
+from .engine import Engine
+from .metrics import METRICS
+
+# Центральный роутер callback_query вместо цепочки startswith()-лямбд в каждом модуле.
+# Маршрут = (action, sub). Разбор callback_data делается один раз, аргументы декодируются по типам.
+# Поиск: сначала точный (action, sub), затем "любой sub" (action, None). Порядок регистрации не важен,
+# дубли ловятся сразу при регистрации.
+
+Handler = Callable[..., Awaitable[None]]
+
+
+class RouteConflict(ValueError):
+    pass
+
+
+def _name(fn: Handler) -> str:
+    return f"{getattr(fn, '__module__', '?')}.{getattr(fn, '__qualname__', repr(fn))}"
+
+
+class _Route:
+    __slots__ = ("handler", "arg_types", "passthrough")
+
+    def __init__(self, handler: Handler, arg_types: Sequence[type], passthrough: bool):
+        self.handler = handler
+        self.arg_types = tuple(arg_types)
+        # без типов: wildcard-маршрут получает сырые части, точный — ничего
+        self.passthrough = passthrough
+
+    def decode(self, raw: Sequence[str]) -> Optional[tuple]:
+        if not self.arg_types:
+            return tuple(raw) if self.passthrough else ()
+        if len(raw) != len(self.arg_types):
+            return None
+        try:
+            return tuple(t(v) for t, v in zip(self.arg_types, raw))
+        except (TypeError, ValueError):
+            return None
+
+
+class CallbackRouter:
+    def __init__(self):
+        self._routes: Dict[Tuple[str, Optional[str]], _Route] = {}
+
+    def route(self, action: str, sub: Optional[str] = None, args: Sequence[type] = ()):
+        # sub=None — маршрут для всех sub этого action, sub передаётся хендлеру первым аргументом
+        key = (action, sub)
+
+        def decorator(fn: Handler) -> Handler:
+            if key in self._routes:
+                raise RouteConflict(
+                    f"callback route {action}:{sub or '*'} registered twice: "
+                    f"{_name(self._routes[key].handler)} and {_name(fn)}"
+                )
+            # метрики по маршруту, а не по общему хендлеру роутера
+            handler = METRICS.instrument(fn, f"{action}:{sub or '*'}")
+            self._routes[key] = _Route(handler, args, passthrough=sub is None)
+            return fn
+
+        return decorator
+
+    def resolve(self, data: str) -> Optional[Tuple[Handler, tuple]]:
+        parts = unpack(data)
+        if not parts:
+            return None
+        action = parts[0]
+        sub = parts[1] if len(parts) > 1 else None
+        r = self._routes.get((action, sub)) if sub is not None else None
+        if r is not None:
+            args = r.decode(parts[2:])
+        else:
+            r = self._routes.get((action, None))
+            if r is None:
+                return None
+            args = r.decode(parts[1:])
+        if args is None:
+            return None
+        return r.handler, args
+
+    async def dispatch(self, bot: Engine, c: CallbackQuery) -> bool:
+        resolved = self.resolve(c.data or "")
+        if resolved is None:
+            # неизвестная/битая кнопка: просто гасим "часики"
+            await bot.answer_callback_query(c.id)
+            return False
+        handler, args = resolved
+        await handler(c, *args)
+        return True
+
+    def install(self, bot: Engine) -> None:
+        @bot.callback_query_handler(func=lambda c: True)
+        async def _route_callback(c: CallbackQuery):
+            await self.dispatch(bot, c)
@@ -0,0 +1,340 @@
+import dataclasses
+import multiprocessing as mp
+import queue
+import signal
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from multiprocessing.connection import Connection, wait
+
+from telebot import apihelper
+from telebot.types import Update
+
+from .config import Config
+from .ingest import NEW, UpdateCheckpoint, shard_of, update_date, user_key
+
+# Шардинг обработки апдейтов по процессам.
+# Ingest-процесс забирает апдейты (getUpdates) и отправляет каждый в воркер shard_of(user_id),
+# так что апдейты одного пользователя всегда обрабатываются одним процессом и по порядку,
+# а его User/FSM-состояние остаётся локальным для этого процесса.
+# Внутри воркера апдейты раскладываются по "дорожкам" (потокам) тем же ключом — порядок на
+# пользователя сохраняется, а блокирующие вызовы API разных пользователей идут параллельно.
+# Очереди дорожек ограничены (lane_queue_size): если дорожка не успевает, воркер перестаёт читать
+# inbox, inbox заполняется, и ingest притормаживает (put с ожиданием) — память не растёт.
+# Heartbeat пишет каждая дорожка (после апдейта и раз в секунду простоя): зависший хендлер виден,
+# даже если остальные дорожки и диспетчер живы.
+# Ingest следит за воркерами: упавший или зависший (нет heartbeat хоть одной дорожки) перезапускается.
+# Воркер подтверждает каждый обработанный апдейт через свой pipe acks; неподтверждённые апдейты
+# перезапущенного воркера отдаются новому процессу заново (не больше max_redeliveries раз — апдейт,
+# на котором воркер виснет каждый раз, отбрасывается).
+# По SIGTERM/Ctrl+C ingest перестаёт забирать апдейты, воркеры дорабатывают очередь и выходят.
+# С чекпоинтом (см. ingest.py) ingest после рестарта продолжает с сохранённого offset, а не пропускает
+# накопившееся; апдейт считается обработанным, когда воркер его подтвердил: всё, что было в очередях
+# или в работе у упавшего процесса, после рестарта ingest обрабатывается заново.
+
+def _worker_main(index: int, cfg: Config, inbox: "mp.Queue", acks: Connection, heartbeat, lanes: int,
+                 lane_queue_size: int = 100) -> None:
+    from .bot import build_bot
+    from .storage import close_storage, init_storage
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # останавливает ingest через sentinel
+    init_storage(cfg, shard=index)
+    bot = build_bot(cfg, threaded=False)
+    if cfg.metrics_port:
+        from .metrics import METRICS, serve_metrics
+        serve_metrics(METRICS, cfg.metrics_listen, cfg.metrics_port + 1 + index)
+    from .broadcast import BROADCASTS
+    # кампания продолжается тем воркером, где её запустили (туда же попадает админ, shard_of)
+    BROADCASTS.owner = index
+    BROADCASTS.resume()
+    try:
+        serve(index, inbox, acks, heartbeat, lanes, lane_queue_size,
+              lambda raw: bot.bot.process_new_updates([Update.de_json(raw)]))
+    finally:
+        BROADCASTS.stop()
+        bot.stop()
+        close_storage()
+
+
+def serve(index: int, inbox: "mp.Queue", acks: Connection, heartbeat, lanes: int, lane_queue_size: int,
+          process: Callable[[dict], None]) -> None:
+    # цикл воркера: inbox -> дорожки -> process(raw) -> acks; до sentinel None в inbox
+    lane_queues: List["queue.Queue[Optional[dict]]"] = [queue.Queue(maxsize=lane_queue_size) for _ in range(lanes)]
+    ack_lock = threading.Lock()
+
+    def lane(n: int, q: "queue.Queue[Optional[dict]]"):
+        slot = index * lanes + n
+        while True:
+            heartbeat[slot] = time.time()
+            try:
+                raw = q.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            if raw is None:
+                return
+            try:
+                process(raw)
+            except Exception as e:
+                print(f"[shard {index}] update {raw.get('update_id')} failed: {e!r}")
+            with ack_lock:
+                acks.send(raw["update_id"])
+
+    threads = [threading.Thread(target=lane, args=(n, q), daemon=True) for n, q in enumerate(lane_queues)]
+    for t in threads:
+        t.start()
+    try:
+        while True:
+            try:
+                raw = inbox.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            if raw is None:
+                break
+            # блокирующий put: занятая дорожка задерживает чтение inbox (backpressure до ingest)
+            lane_queues[shard_of(user_key(raw), lanes)].put(raw)
+    finally:
+        for q in lane_queues:
+            q.put(None)
+        for t in threads:
+            t.join()
+
+
+class ShardedRunner:
+    def __init__(self, cfg: Config, workers: int, lanes: int = 4, queue_size: int = 1000,
+                 lane_queue_size: int = 100, health_timeout: float = 30.0, max_redeliveries: int = 2,
+                 on_done: Optional[Callable[[int], None]] = None, worker: Callable[..., None] = _worker_main):
+        self.workers = workers
+        self.lanes = lanes
+        self.queue_size = queue_size
+        self.lane_queue_size = lane_queue_size
+        self.health_timeout = health_timeout
+        self.max_redeliveries = max_redeliveries
+        # on_done(update_id) — воркер обработал апдейт (или он отброшен после повторов)
+        self.on_done = on_done
+        # worker(index, cfg, inbox, acks, heartbeat, lanes, lane_queue_size) — тело процесса (в тестах — без бота)
+        self.worker = worker
+        # глобальный лимит исходящих делится между воркерами
+        self.cfg = dataclasses.replace(cfg, out_global_rate=cfg.out_global_rate / workers)
+        self._ctx = mp.get_context("spawn")
+        self.inboxes = [self._ctx.Queue(maxsize=queue_size) for _ in range(workers)]
+        # у каждого процесса свой pipe подтверждений: убитый посреди записи воркер не заблокирует остальных
+        self._ack_readers: Set[Connection] = set()
+        self.heartbeat = self._ctx.Array("d", workers * lanes, lock=False)
+        self.procs: List[Optional[mp.Process]] = [None] * workers
+        self.restarts = [0] * workers  # растёт при перезапуске воркера
+        # отданные воркеру и не подтверждённые: update_id -> (воркер, апдейт)
+        self._in_flight: Dict[int, Tuple[int, dict]] = {}
+        self._attempts: Dict[int, int] = {}
+        self._resend: List[Deque[dict]] = [deque() for _ in range(workers)]
+        self._lock = threading.Lock()
+        self._acker: Optional[threading.Thread] = None
+        self._acks_closed = threading.Event()
+        self._stopping = threading.Event()
+
+    def _spawn(self, i: int) -> None:
+        now = time.time()
+        for slot in range(i * self.lanes, (i + 1) * self.lanes):
+            self.heartbeat[slot] = now
+        reader, writer = self._ctx.Pipe(duplex=False)
+        p = self._ctx.Process(
+            target=self.worker,
+            args=(i, self.cfg, self.inboxes[i], writer, self.heartbeat, self.lanes, self.lane_queue_size),
+            name=f"shard-{i}",
+            daemon=False,
+        )
+        p.start()
+        writer.close()  # у ingest только читающий конец: EOF, когда процесс умер
+        with self._lock:
+            self._ack_readers.add(reader)
+        self.procs[i] = p
+
+    def start(self) -> None:
+        for i in range(self.workers):
+            self._spawn(i)
+        self._acker = threading.Thread(target=self._ack_loop, name="shard-acks", daemon=True)
+        self._acker.start()
+
+    def _ack_loop(self) -> None:
+        while True:
+            with self._lock:
+                readers = list(self._ack_readers)
+            if not readers and self._acks_closed.is_set():
+                return
+            for r in wait(readers, timeout=0.2):
+                try:
+                    update_id = r.recv()
+                except (EOFError, OSError):
+                    # процесс завершился (или убит посреди записи) — его неподтверждённые передоставит рестарт
+                    with self._lock:
+                        self._ack_readers.discard(r)
+                    r.close()
+                    continue
+                self._done(update_id)
+
+    def _done(self, update_id: int) -> None:
+        with self._lock:
+            if self._in_flight.pop(update_id, None) is None:
+                return  # повторное подтверждение после передоставки
+            self._attempts.pop(update_id, None)
+        if self.on_done is not None:
+            self.on_done(update_id)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._in_flight)
+
+    def check_health(self) -> None:
+        now = time.time()
+        for i, p in enumerate(self.procs):
+            if p is None:
+                continue
+            beat = min(self.heartbeat[i * self.lanes:(i + 1) * self.lanes])
+            if not p.is_alive():
+                print(f"[shard {i}] exited with code {p.exitcode}, restarting")
+            elif now - beat > self.health_timeout:
+                print(f"[shard {i}] no heartbeat for {now - beat:.0f}s, restarting")
+                p.terminate()
+                p.join(5)
+            else:
+                continue
+            self.restarts[i] += 1
+            self._restart(i)
+
+    def _restart(self, i: int) -> None:
+        # очередь убитого процесса могла остаться в неконсистентном состоянии — новому воркеру новая,
+        # а всё неподтверждённое уходит в неё заново, по порядку update_id
+        old = self.inboxes[i]
+        old.cancel_join_thread()  # её уже никто не прочитает — не ждать отправки при выходе
+        old.close()
+        self.inboxes[i] = self._ctx.Queue(maxsize=self.queue_size)
+        dropped = []
+        with self._lock:
+            resend = []
+            for update_id in sorted(u for u, (w, _) in self._in_flight.items() if w == i):
+                attempts = self._attempts.get(update_id, 0) + 1
+                if attempts > self.max_redeliveries:
+                    dropped.append(update_id)
+                    continue
+                self._attempts[update_id] = attempts
+                resend.append(self._in_flight[update_id][1])
+            self._resend[i] = deque(resend)
+        for update_id in dropped:
+            print(f"[shard {i}] update {update_id} dropped after {self.max_redeliveries} redeliveries")
+            self._done(update_id)
+        self._spawn(i)
+
+    def _put(self, i: int, raw: dict) -> bool:
+        restarts = self.restarts[i]
+        while not self._stopping.is_set():
+            try:
+                # ограниченная очередь: если воркер не успевает, ingest притормаживает
+                self.inboxes[i].put(raw, timeout=1.0)
+                return True
+            except queue.Full:
+                self.check_health()
+                if self.restarts[i] != restarts:
+                    return True  # воркер перезапущен: апдейт уже в очереди передоставки
+        return False
+
+    def _flush_resend(self, i: int) -> bool:
+        pending = self._resend[i]
+        while pending:
+            raw = pending[0]
+            if not self._put(i, raw):
+                return False
+            if pending is self._resend[i] and pending and pending[0] is raw:
+                pending.popleft()
+            pending = self._resend[i]  # воркер мог снова перезапуститься — очередь пересобрана
+        return True
+
+    def dispatch(self, raw: dict) -> bool:
+        i = shard_of(user_key(raw), self.workers)
+        # передоставка после рестарта идёт раньше новых апдейтов: порядок на пользователя сохраняется
+        if not self._flush_resend(i):
+            return False
+        with self._lock:
+            self._in_flight[raw["update_id"]] = (i, raw)
+        return self._put(i, raw)
+
+    def drain(self, timeout: float = 30.0) -> None:
+        for q in self.inboxes:
+            q.put(None)
+        deadline = time.time() + timeout
+        for p in self.procs:
+            if p is not None:
+                p.join(max(0.0, deadline - time.time()))
+                if p.is_alive():
+                    p.terminate()
+        if self._acker is not None:
+            # pipe закрывается с выходом воркера, подтверждения до него дочитываются
+            self._acks_closed.set()
+            self._acker.join(timeout=5)
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+    def run_polling(self, skip_pending: bool = True, poll_timeout: int = 20,
+                    checkpoint: Optional[UpdateCheckpoint] = None, max_age: float = 0.0,
+                    batch: int = 100, max_pending: int = 5000) -> None:
+        # с checkpoint skip_pending не используется: продолжаем с сохранённого offset;
+        # апдейт завершается в чекпоинте, когда воркер подтвердил обработку (on_done), а не при отправке
+        token = self.cfg.bot_token
+        offset = None
+        if checkpoint is None and skip_pending:
+            last = apihelper.get_updates(token, offset=-1, limit=1, timeout=0)
+            offset = last[-1]["update_id"] + 1 if last else None
+        if checkpoint is not None:
+            self.on_done = checkpoint.finish
+
+        signal.signal(signal.SIGTERM, lambda *_: self.stop())
+        self.start()
+        next_check = time.time() + 1
+        try:
+            # взятые в обработку до остановки (уже в чекпоинте) — заново, раньше новых
+            updates = checkpoint.pending() if checkpoint is not None else []
+            resumed = len(updates)
+            while not self._stopping.is_set():
+                now = time.time()
+                for n, raw in enumerate(updates):
+                    update_id = raw["update_id"]
+                    if checkpoint is not None and n >= resumed and checkpoint.begin(raw) != NEW:
+                        continue  # уже обработан или ещё в работе у воркера
+                    date = update_date(raw)
+                    if max_age > 0 and date is not None and now - date > max_age:
+                        if checkpoint is not None:
+                            checkpoint.finish(update_id)
+                    elif not self.dispatch(raw):
+                        break  # останавливаемся: не отданное остаётся в чекпоинте
+                    offset = update_id + 1
+                resumed = 0
+                if time.time() >= next_check:
+                    self.check_health()
+                    for i in range(self.workers):
+                        self._flush_resend(i)
+                    next_check = time.time() + 1
+                if self._stopping.is_set():
+                    break
+                if checkpoint is not None and checkpoint.in_flight() + batch > max_pending:
+                    # воркеры не успевают: не берём новые, пока не подтвердят старые
+                    checkpoint.wait_progress(1.0)
+                    updates = []
+                    continue
+                try:
+                    if checkpoint is not None:
+                        offset = checkpoint.ack_offset()
+                    updates = apihelper.get_updates(token, offset=offset, limit=batch, timeout=poll_timeout + 10,
+                                                    long_polling_timeout=poll_timeout)
+                except Exception as e:
+                    print(f"[ingest] getUpdates failed: {e!r}")
+                    time.sleep(1)
+                    updates = []
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._stopping.set()
+            self.drain()
+            if checkpoint is not None:
+                # не подтверждённые воркерами остались в чекпоинте и обработаются после рестарта
+                checkpoint.close()
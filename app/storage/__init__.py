@@ -0,0 +1,167 @@
+import uuid
+
+from ..config import Config
+from ..ingest import shard_of
+from ..models import LedgerEntry, User
+from .chatlog import ChatLog, ChatRecord, RoomKey
+from .backends import MemoryBackend, PostgresBackend, SqliteBackend, StorageBackend
+from .fsm import SqliteStateStorage
+from .ledger import InsufficientFunds, Ledger
+from .repository import UserRepository
+
+# По умолчанию in-memory (как раньше). init_storage(cfg) переключает на SQLite/PostgreSQL.
+_repo = UserRepository(MemoryBackend(), flush_interval=0)
+_shard = (0, 1)  # (номер воркера, всего воркеров)
+
+
+def owns_user(user_id: int) -> bool:
+    # пользователь этого процесса: при SHARD_WORKERS>1 его апдейты и журнал кошелька — у одного воркера
+    index, shards = _shard
+    return shards <= 1 or shard_of(user_id, shards) == index
+
+
+def _make_ledger(repo: UserRepository, flush_interval: float, sharded: bool = False) -> Ledger:
+    # источник правды о балансе — журнал; User.balance — его зеркало для экранов
+    return Ledger(
+        repo.backend,
+        flush_interval=flush_interval,
+        initial_balance=lambda user_id: repo.get(user_id).balance,
+        on_balance=lambda user_id, balance: repo.update(user_id, lambda u: setattr(u, "balance", balance)),
+        owns=owns_user if sharded else None,
+    )
+
+
+_ledger = _make_ledger(_repo, flush_interval=0)
+_chat_log: ChatLog | None = None  # история чатов появляется после init_storage
+
+
+def make_backend(cfg: Config) -> StorageBackend:
+    kind = cfg.db_backend
+    if kind == "memory":
+        return MemoryBackend()
+    if kind == "sqlite":
+        return SqliteBackend(cfg.db_path, pool_size=cfg.db_pool_size)
+    if kind == "postgres":
+        return PostgresBackend(
+            cfg.db_host, cfg.db_port, cfg.db_name, cfg.db_user, cfg.db_password,
+            pool_size=cfg.db_pool_size,
+        )
+    raise RuntimeError(f"Unknown DB_BACKEND: {kind!r}")
+
+
+def init_storage(cfg: Config, shard: int = 0) -> UserRepository:
+    # shard — номер воркера при SHARD_WORKERS>1: у каждого процесса свой каталог сегментов чата
+    global _repo, _ledger, _chat_log, _shard
+    close_storage()
+    _shard = (shard, max(1, cfg.shard_workers))
+    _repo = UserRepository(
+        make_backend(cfg),
+        cache_size=cfg.db_cache_size,
+        flush_interval=cfg.db_flush_interval,
+    )
+    _ledger = _make_ledger(_repo, flush_interval=cfg.db_flush_interval, sharded=_shard[1] > 1)
+    _chat_log = ChatLog(cfg.chat_path, segment_size=cfg.chat_segment_size, writer=f"w{shard}")
+    return _repo
+
+
+def storage_backend() -> StorageBackend:
+    # общий backend процесса: заказы (orders.py) пишутся в ту же БД, что журнал и переводы
+    return _repo.backend
+
+
+def make_state_storage(cfg: Config) -> SqliteStateStorage | None:
+    # None — оставить движку его StateMemoryStorage
+    if cfg.fsm_backend == "sqlite":
+        return SqliteStateStorage(cfg.fsm_path, state_ttl=cfg.fsm_state_ttl, cache_ttl=cfg.fsm_cache_ttl)
+    return None
+
+
+def close_storage() -> None:
+    global _chat_log
+    _ledger.close()
+    _repo.close()
+    if _chat_log is not None:
+        _chat_log.close()
+        _chat_log = None
+
+
+def get_user(user_id: int, username: str | None = None) -> User:
+    return _repo.get(user_id, username)
+
+
+def touch_user(user_id: int, username: str | None = None) -> None:
+    # пользователь написал боту: заводим запись и снимаем пометку о блокировке. Пометку ставит и воркер
+    # рассылки, а не только владелец, — копия в кэше владельца может о ней не знать, поэтому снимаем в БД всегда
+    _repo.get(user_id, username)
+    set_blocked(user_id, False)
+
+
+def set_blocked(user_id: int, blocked: bool) -> None:
+    # вызывается и не владельцем пользователя (рассылка идёт с воркера админа) — только колонка is_blocked
+    _repo.set_blocked(user_id, blocked)
+
+
+def user_ids_after(after_id: int, limit: int) -> list[int]:
+    # получатели рассылок: незаблокированные пользователи с id > after_id, по возрастанию
+    return _repo.user_ids(after_id, limit)
+
+
+def get_balance(user_id: int) -> int:
+    return _ledger.balance(user_id)
+
+
+def post_balance(user_id: int, delta: int, op_id: str, kind: str, allow_negative: bool = False) -> LedgerEntry:
+    # InsufficientFunds, если списание уводит баланс в минус
+    return _ledger.post(user_id, delta, op_id, kind, allow_negative=allow_negative)
+
+
+def credit(user_id: int, delta: int, op_id: str, kind: str) -> None:
+    # зачисление любому пользователю (выплата продавцу, возврат): чужому шарду — через таблицу переводов,
+    # чтобы seq его журнала выдавал только владелец
+    if owns_user(user_id):
+        _ledger.post(user_id, delta, op_id, kind, allow_negative=True)
+    else:
+        _repo.backend.add_transfer(op_id, user_id, delta, kind)
+
+
+def apply_transfers() -> int:
+    # провести поставленные в transfers зачисления пользователям этого процесса (не дожидаясь фонового цикла)
+    try:
+        return _ledger.transfer_pump()
+    except Exception as e:
+        print(f"[ledger] transfers failed: {e!r}")
+        return 0
+
+
+def balance_history(user_id: int, before_seq: int | None = None, limit: int = 10) -> list[LedgerEntry]:
+    return _ledger.history(user_id, before_seq, limit)
+
+
+def set_balance(user_id: int, amount: int, op_id: str | None = None) -> None:
+    _ledger.set_balance(user_id, amount, op_id or f"adjust:{uuid.uuid4().hex}")
+
+
+def add_balance(user_id: int, delta: int, op_id: str | None = None, kind: str = "adjust") -> None:
+    _ledger.post(user_id, delta, op_id or f"{kind}:{uuid.uuid4().hex}", kind, allow_negative=True)
+
+
+def append_chat_message(room: RoomKey, sender_id: int, text: str, copy_message_id: int = 0) -> None:
+    if _chat_log is not None:
+        _chat_log.append(room, sender_id, text, copy_message_id=copy_message_id)
+
+
+def chat_reply_room(chat_id: int, message_id: int) -> RoomKey | None:
+    # комната, копию из которой получил chat_id (записана любым шардом)
+    return _chat_log.reply_room(chat_id, message_id) if _chat_log is not None else None
+
+
+def chat_history(room: RoomKey, limit: int = 20) -> list[ChatRecord]:
+    return _chat_log.history(room, limit) if _chat_log is not None else []
+
+
+def set_seller(user_id: int, is_seller: bool) -> None:
+    _repo.update(user_id, lambda u: setattr(u, "is_seller", is_seller))
+
+
+def set_seller_phone_verified(user_id: int, verified: bool) -> None:
+    _repo.update(user_id, lambda u: setattr(u, "seller_verified_phone", verified))
@@ -0,0 +1,615 @@
+import bisect
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import astuple, replace
+from itertools import islice
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from ..models import LedgerEntry, Order, Product, User
+from .pool import ConnectionPool
+
+# Движки хранения пользователей. Кэш и пакетная запись живут уровнем выше (repository.py),
+# здесь только "загрузить одного", "сохранить пачку одной транзакцией" и постраничный обход id.
+
+_USER_COLUMNS = ("user_id", "username", "is_seller", "seller_verified_phone", "balance", "is_blocked")
+_LEDGER_COLUMNS = ("user_id", "seq", "op_id", "delta", "balance_after", "kind", "created_at")
+_ORDER_COLUMNS = ("order_id", "buyer_id", "seller_id", "status", "amount", "created_at", "updated_at",
+                  "escalated", "version")
+_PRODUCT_COLUMNS = ("product_id", "seller_id", "category", "title", "price", "description")
+
+Transfer = Tuple[str, int, int, str]  # (op_id, user_id, delta, kind)
+
+
+def _row_to_user(row) -> User:
+    user_id, username, is_seller, verified, balance, blocked = row
+    return User(
+        user_id=int(user_id),
+        username=username,
+        is_seller=bool(is_seller),
+        seller_verified_phone=bool(verified),
+        balance=int(balance),
+        is_blocked=bool(blocked),
+    )
+
+
+def _row_to_entry(row) -> LedgerEntry:
+    user_id, seq, op_id, delta, balance_after, kind, created_at = row
+    return LedgerEntry(int(user_id), int(seq), op_id, int(delta), int(balance_after), kind, float(created_at))
+
+
+def _row_to_order(row) -> Order:
+    order_id, buyer_id, seller_id, status, amount, created_at, updated_at, escalated, version = row
+    return Order(int(order_id), int(buyer_id), int(seller_id), status, int(amount), float(created_at),
+                 float(updated_at), bool(escalated), int(version))
+
+
+def _row_to_product(row) -> Product:
+    product_id, seller_id, category, title, price, description = row
+    return Product(int(product_id), int(seller_id), category, title, int(price), description or "")
+
+
+class StorageBackend:
+    def load_user(self, user_id: int) -> Optional[User]:
+        raise NotImplementedError
+
+    def save_users(self, users: Iterable[User]) -> None:
+        raise NotImplementedError
+
+    def load_user_ids(self, after_id: int, limit: int) -> List[int]:
+        # id незаблокированных пользователей > after_id по возрастанию (keyset-пагинация для рассылок)
+        raise NotImplementedError
+
+    def set_blocked(self, user_ids: List[int], blocked: bool) -> None:
+        # только колонка is_blocked: save_users её у существующих строк не перезаписывает, поэтому пометку
+        # ставит и процесс, который пользователя не ведёт (рассылка с воркера админа), не затирая остальные поля
+        raise NotImplementedError
+
+    # --- журнал кошелька ---
+
+    def load_ledger_snapshot(self, user_id: int) -> Optional[Tuple[int, int]]:
+        # (balance, seq) последней записанной операции
+        raise NotImplementedError
+
+    def find_ledger_entry(self, user_id: int, op_id: str) -> Optional[LedgerEntry]:
+        raise NotImplementedError
+
+    def commit_ledger(self, entries: List[LedgerEntry]) -> None:
+        # записи + обновлённые снимки балансов одной транзакцией
+        raise NotImplementedError
+
+    def load_ledger_entries(self, user_id: int, before_seq: Optional[int], limit: int) -> List[LedgerEntry]:
+        # от новых к старым
+        raise NotImplementedError
+
+    # --- переводы в чужой шард: зачисление проводит журнал того процесса, чей это пользователь ---
+
+    def add_transfer(self, op_id: str, user_id: int, delta: int, kind: str) -> None:
+        # повтор с тем же op_id игнорируется
+        raise NotImplementedError
+
+    def load_transfers(self, limit: int) -> List[Transfer]:
+        # в порядке добавления
+        raise NotImplementedError
+
+    def delete_transfers(self, op_ids: List[str]) -> None:
+        raise NotImplementedError
+
+    # --- заказы ---
+
+    def create_order(self, order: Order) -> int:
+        # order_id выдаёт БД (общий счётчик для всех процессов)
+        raise NotImplementedError
+
+    def update_order(self, order: Order, transfers: List[Transfer] = ()) -> bool:
+        # order.version — новая версия; пишется, только если в БД version - 1 (иначе False).
+        # Переводы (выплата продавцу, возврат) ставятся той же транзакцией
+        raise NotImplementedError
+
+    def load_order(self, order_id: int) -> Optional[Order]:
+        raise NotImplementedError
+
+    def load_orders(self, after_id: int, limit: int) -> List[Order]:
+        # по возрастанию order_id, для загрузки при старте
+        raise NotImplementedError
+
+    def load_orders_updated(self, since: float) -> List[Order]:
+        # изменённые другими процессами (updated_at >= since)
+        raise NotImplementedError
+
+    # --- каталог ---
+
+    def save_products(self, products: Iterable[Product]) -> None:
+        raise NotImplementedError
+
+    def delete_product(self, product_id: int) -> None:
+        raise NotImplementedError
+
+    def load_products(self, after_id: int, limit: int) -> List[Product]:
+        # по возрастанию product_id, для загрузки каталога при старте
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryBackend(StorageBackend):
+    def __init__(self):
+        self._rows: Dict[int, tuple] = {}
+        self._ids: List[int] = []  # ключи _rows по возрастанию
+        self._ledger: Dict[int, List[LedgerEntry]] = {}
+        self._ops: Dict[Tuple[int, str], LedgerEntry] = {}
+        self._transfers: Dict[str, Transfer] = {}
+        self._orders: Dict[int, tuple] = {}
+        self._products: Dict[int, tuple] = {}
+        self._product_ids: List[int] = []  # ключи _products по возрастанию
+        self._lock = threading.Lock()
+
+    def load_user(self, user_id: int) -> Optional[User]:
+        row = self._rows.get(user_id)
+        return _row_to_user(row) if row else None
+
+    def save_users(self, users: Iterable[User]) -> None:
+        with self._lock:
+            for u in users:
+                row = self._rows.get(u.user_id)
+                if row is None:
+                    bisect.insort(self._ids, u.user_id)
+                    self._rows[u.user_id] = astuple(u)
+                else:
+                    self._rows[u.user_id] = astuple(u)[:-1] + row[-1:]
+
+    def set_blocked(self, user_ids: List[int], blocked: bool) -> None:
+        with self._lock:
+            for user_id in user_ids:
+                row = self._rows.get(user_id)
+                if row is not None:
+                    self._rows[user_id] = row[:-1] + (blocked,)
+
+    def load_user_ids(self, after_id: int, limit: int) -> List[int]:
+        with self._lock:
+            out = []
+            for i in range(bisect.bisect_right(self._ids, after_id), len(self._ids)):
+                user_id = self._ids[i]
+                if not self._rows[user_id][-1]:
+                    out.append(user_id)
+                    if len(out) >= limit:
+                        break
+            return out
+
+    def load_ledger_snapshot(self, user_id: int) -> Optional[Tuple[int, int]]:
+        entries = self._ledger.get(user_id)
+        return (entries[-1].balance_after, entries[-1].seq) if entries else None
+
+    def find_ledger_entry(self, user_id: int, op_id: str) -> Optional[LedgerEntry]:
+        return self._ops.get((user_id, op_id))
+
+    def commit_ledger(self, entries: List[LedgerEntry]) -> None:
+        with self._lock:
+            for e in entries:
+                self._ledger.setdefault(e.user_id, []).append(e)
+                self._ops[(e.user_id, e.op_id)] = e
+
+    def load_ledger_entries(self, user_id: int, before_seq: Optional[int], limit: int) -> List[LedgerEntry]:
+        entries = self._ledger.get(user_id, [])
+        # seq идут подряд с 1, поэтому позиция = seq - 1
+        end = len(entries) if before_seq is None else max(0, min(len(entries), before_seq - 1))
+        return list(reversed(entries[max(0, end - limit):end]))
+
+    def add_transfer(self, op_id: str, user_id: int, delta: int, kind: str) -> None:
+        with self._lock:
+            self._transfers.setdefault(op_id, (op_id, user_id, delta, kind))
+
+    def load_transfers(self, limit: int) -> List[Transfer]:
+        with self._lock:
+            return list(islice(self._transfers.values(), limit))
+
+    def delete_transfers(self, op_ids: List[str]) -> None:
+        with self._lock:
+            for op_id in op_ids:
+                self._transfers.pop(op_id, None)
+
+    def create_order(self, order: Order) -> int:
+        with self._lock:
+            order_id = len(self._orders) + 1
+            self._orders[order_id] = astuple(replace(order, order_id=order_id))
+            return order_id
+
+    def update_order(self, order: Order, transfers: List[Transfer] = ()) -> bool:
+        with self._lock:
+            row = self._orders.get(order.order_id)
+            if row is None or row[-1] != order.version - 1:
+                return False
+            self._orders[order.order_id] = astuple(order)
+            for t in transfers:
+                self._transfers.setdefault(t[0], t)
+            return True
+
+    def load_order(self, order_id: int) -> Optional[Order]:
+        row = self._orders.get(order_id)
+        return _row_to_order(row) if row else None
+
+    def load_orders(self, after_id: int, limit: int) -> List[Order]:
+        # id выдаются подряд с 1
+        with self._lock:
+            return [_row_to_order(self._orders[i])
+                    for i in range(after_id + 1, min(len(self._orders), after_id + limit) + 1)]
+
+    def load_orders_updated(self, since: float) -> List[Order]:
+        with self._lock:
+            return [_row_to_order(row) for row in self._orders.values() if row[6] >= since]
+
+    def save_products(self, products: Iterable[Product]) -> None:
+        with self._lock:
+            for p in products:
+                if p.product_id not in self._products:
+                    bisect.insort(self._product_ids, p.product_id)
+                self._products[p.product_id] = astuple(p)
+
+    def delete_product(self, product_id: int) -> None:
+        with self._lock:
+            if self._products.pop(product_id, None) is not None:
+                del self._product_ids[bisect.bisect_left(self._product_ids, product_id)]
+
+    def load_products(self, after_id: int, limit: int) -> List[Product]:
+        with self._lock:
+            start = bisect.bisect_right(self._product_ids, after_id)
+            return [_row_to_product(self._products[i]) for i in self._product_ids[start:start + limit]]
+
+
+class SqlBackend(StorageBackend):
+    # Общая часть для SQLite и PostgreSQL: отличаются плейсхолдер, автоинкремент и фабрика соединений.
+    placeholder = "?"
+    serial_key = "INTEGER PRIMARY KEY"
+
+    def __init__(self, pool: ConnectionPool):
+        self.pool = pool
+        self._init_schema()
+
+    def _init_schema(self) -> None:
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                "CREATE TABLE IF NOT EXISTS users ("
+                " user_id BIGINT PRIMARY KEY,"
+                " username TEXT,"
+                " is_seller BOOLEAN NOT NULL DEFAULT FALSE,"
+                " seller_verified_phone BOOLEAN NOT NULL DEFAULT FALSE,"
+                " balance BIGINT NOT NULL DEFAULT 0,"
+                " is_blocked BOOLEAN NOT NULL DEFAULT FALSE"
+                ")"
+            )
+            cur.execute(
+                "CREATE TABLE IF NOT EXISTS ledger ("
+                " user_id BIGINT NOT NULL,"
+                " seq BIGINT NOT NULL,"
+                " op_id TEXT NOT NULL,"
+                " delta BIGINT NOT NULL,"
+                " balance_after BIGINT NOT NULL,"
+                " kind TEXT NOT NULL,"
+                " created_at DOUBLE PRECISION NOT NULL,"
+                " PRIMARY KEY (user_id, seq),"
+                " UNIQUE (user_id, op_id)"
+                ")"
+            )
+            cur.execute(
+                "CREATE TABLE IF NOT EXISTS transfers ("
+                " op_id TEXT PRIMARY KEY,"
+                " user_id BIGINT NOT NULL,"
+                " delta BIGINT NOT NULL,"
+                " kind TEXT NOT NULL,"
+                " created_at DOUBLE PRECISION NOT NULL"
+                ")"
+            )
+            cur.execute(
+                "CREATE TABLE IF NOT EXISTS orders ("
+                f" order_id {self.serial_key},"
+                " buyer_id BIGINT NOT NULL,"
+                " seller_id BIGINT NOT NULL,"
+                " status TEXT NOT NULL,"
+                " amount BIGINT NOT NULL,"
+                " created_at DOUBLE PRECISION NOT NULL,"
+                " updated_at DOUBLE PRECISION NOT NULL,"
+                " escalated BOOLEAN NOT NULL DEFAULT FALSE,"
+                " version BIGINT NOT NULL DEFAULT 0"
+                ")"
+            )
+            cur.execute("CREATE INDEX IF NOT EXISTS orders_updated_at ON orders (updated_at)")
+            cur.execute(
+                "CREATE TABLE IF NOT EXISTS products ("
+                " product_id BIGINT PRIMARY KEY,"
+                " seller_id BIGINT NOT NULL,"
+                " category TEXT NOT NULL,"
+                " title TEXT NOT NULL,"
+                " price BIGINT NOT NULL,"
+                " description TEXT NOT NULL DEFAULT ''"
+                ")"
+            )
+            cur.execute(
+                "CREATE TABLE IF NOT EXISTS ledger_snapshots ("
+                " user_id BIGINT PRIMARY KEY,"
+                " balance BIGINT NOT NULL,"
+                " seq BIGINT NOT NULL"
+                ")"
+            )
+            conn.commit()
+            # базы, созданные до появления is_blocked
+            try:
+                cur.execute("SELECT is_blocked FROM users WHERE 1 = 0")
+            except Exception:
+                conn.rollback()
+                cur = conn.cursor()
+                cur.execute("ALTER TABLE users ADD COLUMN is_blocked BOOLEAN NOT NULL DEFAULT FALSE")
+            conn.commit()
+
+    def load_user(self, user_id: int) -> Optional[User]:
+        p = self.placeholder
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(f"SELECT {', '.join(_USER_COLUMNS)} FROM users WHERE user_id = {p}", (user_id,))
+            row = cur.fetchone()
+            conn.commit()
+        return _row_to_user(row) if row else None
+
+    def save_users(self, users: Iterable[User]) -> None:
+        rows = [
+            (u.user_id, u.username, bool(u.is_seller), bool(u.seller_verified_phone), u.balance, bool(u.is_blocked))
+            for u in users
+        ]
+        if not rows:
+            return
+        p = self.placeholder
+        sql = (
+            f"INSERT INTO users ({', '.join(_USER_COLUMNS)}) VALUES ({', '.join([p] * len(_USER_COLUMNS))}) "
+            "ON CONFLICT (user_id) DO UPDATE SET "
+            "username = excluded.username, is_seller = excluded.is_seller, "
+            "seller_verified_phone = excluded.seller_verified_phone, balance = excluded.balance"
+        )
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            cur.executemany(sql, rows)
+            conn.commit()
+
+    def load_user_ids(self, after_id: int, limit: int) -> List[int]:
+        p = self.placeholder
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                f"SELECT user_id FROM users WHERE user_id > {p} AND NOT is_blocked ORDER BY user_id LIMIT {int(limit)}",
+                (after_id,),
+            )
+            rows = cur.fetchall()
+            conn.commit()
+        return [int(r[0]) for r in rows]
+
+    def set_blocked(self, user_ids: List[int], blocked: bool) -> None:
+        if not user_ids:
+            return
+        p = self.placeholder
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            cur.executemany(f"UPDATE users SET is_blocked = {p} WHERE user_id = {p}",
+                            [(bool(blocked), user_id) for user_id in user_ids])
+            conn.commit()
+
+    def load_ledger_snapshot(self, user_id: int) -> Optional[Tuple[int, int]]:
+        p = self.placeholder
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(f"SELECT balance, seq FROM ledger_snapshots WHERE user_id = {p}", (user_id,))
+            row = cur.fetchone()
+            conn.commit()
+        return (int(row[0]), int(row[1])) if row else None
+
+    def find_ledger_entry(self, user_id: int, op_id: str) -> Optional[LedgerEntry]:
+        p = self.placeholder
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                f"SELECT {', '.join(_LEDGER_COLUMNS)} FROM ledger WHERE user_id = {p} AND op_id = {p}",
+                (user_id, op_id),
+            )
+            row = cur.fetchone()
+            conn.commit()
+        return _row_to_entry(row) if row else None
+
+    def commit_ledger(self, entries: List[LedgerEntry]) -> None:
+        if not entries:
+            return
+        p = self.placeholder
+        last: Dict[int, LedgerEntry] = {}
+        for e in entries:
+            last[e.user_id] = e
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            cur.executemany(
+                f"INSERT INTO ledger ({', '.join(_LEDGER_COLUMNS)}) VALUES ({', '.join([p] * len(_LEDGER_COLUMNS))})",
+                [(e.user_id, e.seq, e.op_id, e.delta, e.balance_after, e.kind, e.created_at) for e in entries],
+            )
+            cur.executemany(
+                f"INSERT INTO ledger_snapshots (user_id, balance, seq) VALUES ({p}, {p}, {p}) "
+                "ON CONFLICT (user_id) DO UPDATE SET balance = excluded.balance, seq = excluded.seq",
+                [(e.user_id, e.balance_after, e.seq) for e in last.values()],
+            )
+            conn.commit()
+
+    def load_ledger_entries(self, user_id: int, before_seq: Optional[int], limit: int) -> List[LedgerEntry]:
+        p = self.placeholder
+        sql = f"SELECT {', '.join(_LEDGER_COLUMNS)} FROM ledger WHERE user_id = {p}"
+        params: tuple = (user_id,)
+        if before_seq is not None:
+            sql += f" AND seq < {p}"
+            params += (before_seq,)
+        sql += f" ORDER BY seq DESC LIMIT {int(limit)}"
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(sql, params)
+            rows = cur.fetchall()
+            conn.commit()
+        return [_row_to_entry(r) for r in rows]
+
+    def add_transfer(self, op_id: str, user_id: int, delta: int, kind: str) -> None:
+        p = self.placeholder
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                f"INSERT INTO transfers (op_id, user_id, delta, kind, created_at) VALUES ({p}, {p}, {p}, {p}, {p}) "
+                "ON CONFLICT (op_id) DO NOTHING",
+                (op_id, user_id, delta, kind, time.time()),
+            )
+            conn.commit()
+
+    def load_transfers(self, limit: int) -> List[Transfer]:
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(f"SELECT op_id, user_id, delta, kind FROM transfers ORDER BY created_at LIMIT {int(limit)}")
+            rows = cur.fetchall()
+            conn.commit()
+        return [(r[0], int(r[1]), int(r[2]), r[3]) for r in rows]
+
+    def delete_transfers(self, op_ids: List[str]) -> None:
+        if not op_ids:
+            return
+        p = self.placeholder
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            cur.executemany(f"DELETE FROM transfers WHERE op_id = {p}", [(op_id,) for op_id in op_ids])
+            conn.commit()
+
+    def create_order(self, order: Order) -> int:
+        p = self.placeholder
+        columns = _ORDER_COLUMNS[1:]
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                f"INSERT INTO orders ({', '.join(columns)}) VALUES ({', '.join([p] * len(columns))}) "
+                "RETURNING order_id",
+                astuple(order)[1:],
+            )
+            order_id = int(cur.fetchone()[0])
+            conn.commit()
+        return order_id
+
+    def update_order(self, order: Order, transfers: List[Transfer] = ()) -> bool:
+        p = self.placeholder
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                f"UPDATE orders SET status = {p}, updated_at = {p}, escalated = {p}, version = {p} "
+                f"WHERE order_id = {p} AND version = {p}",
+                (order.status, order.updated_at, bool(order.escalated), order.version,
+                 order.order_id, order.version - 1),
+            )
+            if cur.rowcount != 1:
+                conn.rollback()
+                return False
+            cur.executemany(
+                f"INSERT INTO transfers (op_id, user_id, delta, kind, created_at) VALUES ({p}, {p}, {p}, {p}, {p}) "
+                "ON CONFLICT (op_id) DO NOTHING",
+                [(*t, order.updated_at) for t in transfers],
+            )
+            conn.commit()
+        return True
+
+    def load_order(self, order_id: int) -> Optional[Order]:
+        p = self.placeholder
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(f"SELECT {', '.join(_ORDER_COLUMNS)} FROM orders WHERE order_id = {p}", (order_id,))
+            row = cur.fetchone()
+            conn.commit()
+        return _row_to_order(row) if row else None
+
+    def load_orders(self, after_id: int, limit: int) -> List[Order]:
+        p = self.placeholder
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                f"SELECT {', '.join(_ORDER_COLUMNS)} FROM orders WHERE order_id > {p} "
+                f"ORDER BY order_id LIMIT {int(limit)}",
+                (after_id,),
+            )
+            rows = cur.fetchall()
+            conn.commit()
+        return [_row_to_order(r) for r in rows]
+
+    def load_orders_updated(self, since: float) -> List[Order]:
+        p = self.placeholder
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(f"SELECT {', '.join(_ORDER_COLUMNS)} FROM orders WHERE updated_at >= {p}", (since,))
+            rows = cur.fetchall()
+            conn.commit()
+        return [_row_to_order(r) for r in rows]
+
+    def save_products(self, products: Iterable[Product]) -> None:
+        rows = [astuple(p) for p in products]
+        if not rows:
+            return
+        p = self.placeholder
+        sql = (
+            f"INSERT INTO products ({', '.join(_PRODUCT_COLUMNS)}) VALUES ({', '.join([p] * len(_PRODUCT_COLUMNS))}) "
+            "ON CONFLICT (product_id) DO UPDATE SET "
+            "seller_id = excluded.seller_id, category = excluded.category, title = excluded.title, "
+            "price = excluded.price, description = excluded.description"
+        )
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            cur.executemany(sql, rows)
+            conn.commit()
+
+    def delete_product(self, product_id: int) -> None:
+        p = self.placeholder
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(f"DELETE FROM products WHERE product_id = {p}", (product_id,))
+            conn.commit()
+
+    def load_products(self, after_id: int, limit: int) -> List[Product]:
+        p = self.placeholder
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                f"SELECT {', '.join(_PRODUCT_COLUMNS)} FROM products WHERE product_id > {p} "
+                f"ORDER BY product_id LIMIT {int(limit)}",
+                (after_id,),
+            )
+            rows = cur.fetchall()
+            conn.commit()
+        return [_row_to_product(r) for r in rows]
+
+    def close(self) -> None:
+        self.pool.close()
+
+
+class SqliteBackend(SqlBackend):
+    placeholder = "?"
+
+    def __init__(self, path: str, pool_size: int = 4):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        def connect():
+            conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            return conn
+
+        super().__init__(ConnectionPool(connect, max_size=pool_size))
+
+
+class PostgresBackend(SqlBackend):
+    placeholder = "%s"
+    serial_key = "BIGSERIAL PRIMARY KEY"
+
+    def __init__(self, host: str, port: int, dbname: str, user: str, password: str, pool_size: int = 4):
+        try:
+            import psycopg2
+        except ImportError as e:
+            raise RuntimeError("DB_BACKEND=postgres требует пакет psycopg2 (pip install psycopg2-binary)") from e
+
+        def connect():
+            return psycopg2.connect(host=host, port=port, dbname=dbname, user=user, password=password)
+
+        super().__init__(ConnectionPool(connect, max_size=pool_size))
@@ -0,0 +1,222 @@
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+# История чатов в append-only сегментах: data/chat/<writer>/00000001.seg, 00000002.seg, ...
+# Каждый процесс (воркер шарда) пишет только в свой каталог writer, поэтому смещения и обрезка
+# недописанного хвоста касаются только своих файлов. Читать можно все каталоги: чужие сегменты
+# дочитываются с последней известной позиции перед выдачей истории (покупатель и продавец обычно
+# в разных шардах, и история комнаты складывается из записей нескольких писателей).
+# Запись: заголовок + текст в UTF-8. В заголовке — ключ комнаты, указатель на предыдущую запись той же
+# комнаты у того же писателя и message_id копии, доставленной собеседнику. В памяти на комнату хранится
+# только "голова" (сегмент, смещение) по каждому писателю, а история читается обходом цепочек назад
+# через mmap без сканирования файлов. По message_id копии строится таблица ответов: реплай собеседника
+# находит комнату в любом шарде и после рестарта.
+# Головы восстанавливаются одним последовательным проходом по сегментам при открытии; недописанный
+# хвост своего последнего сегмента (падение посреди записи) обрезается, чужой — просто не читается.
+# Сегменты в корне path — формат до разделения по писателям (без message_id), только для чтения.
+# fsync на каждое сообщение не делается: запись переживает падение процесса, но не питания.
+
+RoomKey = Tuple[int, int, int]  # (buyer_id, seller_id, order_id или 0)
+
+# buyer, seller, order, sender, ts, prev_seg, prev_off, length[, message_id копии]
+_HEADER_V1 = struct.Struct("<qqqqdIII")
+_HEADER = struct.Struct("<qqqqdIIIq")
+_NONE = 0xFFFFFFFF
+_SUFFIX = ".seg"
+_LEGACY = ""  # писатель для сегментов в корне path
+
+
+class ChatRecord(NamedTuple):
+    sender_id: int
+    ts: float
+    text: str
+
+
+class _Source:
+    # сегменты одного писателя и позиция, до которой они прочитаны
+    __slots__ = ("name", "dir", "header", "heads", "seg", "off")
+
+    def __init__(self, name: str, path: str):
+        self.name = name
+        self.dir = os.path.join(path, name) if name else path
+        self.header = _HEADER if name else _HEADER_V1
+        self.heads: Dict[RoomKey, Tuple[int, int]] = {}
+        self.seg = 0
+        self.off = 0
+
+    def file(self, seg: int) -> str:
+        return os.path.join(self.dir, f"{seg:08d}{_SUFFIX}")
+
+    def segments(self) -> List[int]:
+        try:
+            names = os.listdir(self.dir)
+        except FileNotFoundError:
+            return []
+        return sorted(int(n[:-len(_SUFFIX)]) for n in names if n.endswith(_SUFFIX) and n[:-len(_SUFFIX)].isdigit())
+
+
+class ChatLog:
+    def __init__(self, path: str, segment_size: int = 64 * 1024 * 1024, writer: str = "w0",
+                 max_reply_routes: int = 200_000):
+        self.path = path
+        self.segment_size = segment_size
+        self.max_reply_routes = max_reply_routes
+        self._sources: Dict[str, _Source] = {}
+        # (chat_id получателя, message_id копии) -> комната
+        self._replies: "OrderedDict[Tuple[int, int], RoomKey]" = OrderedDict()
+        self._maps: Dict[str, mmap.mmap] = {}
+        self._lock = threading.Lock()
+        self._scan_lock = threading.Lock()
+        self._own = _Source(writer, path)
+        self._sources[writer] = self._own
+        os.makedirs(self._own.dir, exist_ok=True)
+        segments = self._own.segments()
+        for seg in segments:
+            self._scan(self._own, seg, 0, truncate=True)
+        self._own.seg = segments[-1] if segments else 1
+        self._fd = os.open(self._own.file(self._own.seg), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._own.off = os.fstat(self._fd).st_size
+        self.refresh()
+
+    def _scan(self, src: _Source, seg: int, off: int, truncate: bool = False) -> int:
+        # разбирает целые записи сегмента начиная с off; возвращает позицию после последней
+        size = os.path.getsize(src.file(seg))
+        header = src.header
+        heads: Dict[RoomKey, Tuple[int, int]] = {}
+        replies: List[Tuple[Tuple[int, int], RoomKey]] = []
+        if size > off:
+            with open(src.file(seg), "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                while off + header.size <= size:
+                    fields = header.unpack_from(mm, off)
+                    buyer, seller, order, sender, _, _, _, length = fields[:8]
+                    end = off + header.size + length
+                    if end > size:
+                        break
+                    room = (buyer, seller, order)
+                    heads[room] = (seg, off)
+                    if len(fields) > 8 and fields[8]:
+                        replies.append(((seller if sender == buyer else buyer, fields[8]), room))
+                    off = end
+        with self._lock:
+            src.heads.update(heads)
+            for key, room in replies:
+                self._remember_reply(key, room)
+        if truncate and off < size:
+            print(f"[chatlog] truncating torn tail of segment {src.dir}/{seg}: {size - off} bytes")
+            os.truncate(src.file(seg), off)
+        return off
+
+    def refresh(self) -> None:
+        # дочитать записи других писателей
+        with self._scan_lock:
+            try:
+                names = [n for n in os.listdir(self.path) if os.path.isdir(os.path.join(self.path, n))]
+            except FileNotFoundError:
+                names = []
+            for name in [_LEGACY] + names:
+                if name == self._own.name:
+                    continue
+                src = self._sources.get(name)
+                if src is None:
+                    src = _Source(name, self.path)
+                segments = src.segments()
+                if not segments:
+                    continue
+                if name not in self._sources:
+                    src.seg = segments[0]
+                    with self._lock:
+                        self._sources[name] = src
+                for seg in segments:
+                    if seg < src.seg:
+                        continue
+                    src.off = self._scan(src, seg, src.off if seg == src.seg else 0)
+                    src.seg = seg
+
+    def _remember_reply(self, key: Tuple[int, int], room: RoomKey) -> None:
+        self._replies[key] = room
+        self._replies.move_to_end(key)
+        if len(self._replies) > self.max_reply_routes:
+            self._replies.popitem(last=False)
+
+    def _view(self, path: str, end: int) -> mmap.mmap:
+        # отображение сегмента, покрывающее [0, end); активный сегмент растёт — переотображаем
+        with self._lock:
+            mm = self._maps.get(path)
+            if mm is None or len(mm) < end:
+                with open(path, "rb") as f:
+                    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._maps[path] = mm
+            return mm
+
+    def append(self, room: RoomKey, sender_id: int, text: str, ts: Optional[float] = None,
+               copy_message_id: int = 0) -> None:
+        # copy_message_id — копия у собеседника: реплай на неё уйдёт в эту комнату
+        body = text.encode("utf-8")
+        own = self._own
+        with self._lock:
+            if own.off and own.off + _HEADER.size + len(body) > self.segment_size:
+                os.close(self._fd)
+                own.seg += 1
+                self._fd = os.open(own.file(own.seg), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                own.off = 0
+            prev_seg, prev_off = own.heads.get(room, (_NONE, _NONE))
+            header = _HEADER.pack(*room, sender_id, time.time() if ts is None else ts,
+                                  prev_seg, prev_off, len(body), copy_message_id)
+            os.write(self._fd, header + body)
+            own.heads[room] = (own.seg, own.off)
+            own.off += _HEADER.size + len(body)
+            if copy_message_id:
+                peer = room[1] if sender_id == room[0] else room[0]
+                self._remember_reply((peer, copy_message_id), room)
+
+    def reply_room(self, chat_id: int, message_id: int) -> Optional[RoomKey]:
+        with self._lock:
+            room = self._replies.get((chat_id, message_id))
+        if room is None:
+            self.refresh()
+            with self._lock:
+                room = self._replies.get((chat_id, message_id))
+        return room
+
+    def _chain(self, src: _Source, ptr: Optional[Tuple[int, int]], limit: int) -> List[ChatRecord]:
+        out: List[ChatRecord] = []
+        header = src.header
+        while ptr is not None and len(out) < limit:
+            seg, off = ptr
+            path = src.file(seg)
+            mm = self._view(path, off + header.size)
+            fields = header.unpack_from(mm, off)
+            sender, ts, prev_seg, prev_off, length = fields[3:8]
+            start = off + header.size
+            if len(mm) < start + length:
+                mm = self._view(path, start + length)
+            out.append(ChatRecord(sender, ts, mm[start:start + length].decode("utf-8", "replace")))
+            ptr = None if prev_seg == _NONE else (prev_seg, prev_off)
+        return out
+
+    def history(self, room: RoomKey, limit: int = 20) -> List[ChatRecord]:
+        # от новых к старым, записи всех писателей вперемешку по времени
+        self.refresh()
+        with self._lock:
+            ptrs = [(src, src.heads[room]) for src in self._sources.values() if room in src.heads]
+        out: List[ChatRecord] = []
+        for src, ptr in ptrs:
+            out.extend(self._chain(src, ptr, limit))
+        out.sort(key=lambda r: r.ts, reverse=True)
+        return out[:limit]
+
+    def rooms(self) -> int:
+        with self._lock:
+            return len({room for src in self._sources.values() for room in src.heads})
+
+    def close(self) -> None:
+        with self._lock:
+            os.close(self._fd)
+            for mm in self._maps.values():
+                mm.close()
+            self._maps.clear()
@@ -0,0 +1,262 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from telebot.storage import StateStorageBase
+from telebot.storage.base_storage import StateContext
+
+from .pool import ConnectionPool
+
+# Хранилище FSM-состояний (telebot StateStorageBase) в SQLite вместо StateMemoryStorage:
+# состояния переживают деплой и доступны нескольким процессам на одной машине.
+# - горячий LRU-кэш в процессе, включая "состояния нет" — StateFilter спрашивает get_state
+#   на каждое сообщение, и у большинства пользователей состояния нет;
+# - state_ttl: брошенные сценарии истекают (при чтении и фоновой чисткой при записи);
+# - cache_ttl: сколько доверять кэшу без перечитывания БД (по умолчанию 30 с — столько видна чужая запись,
+#   если состояние меняет другой процесс). При шардинге по user_id (один пользователь — один процесс)
+#   кэш когерентен и cache_ttl=0 снимает ограничение.
+# data хранится компактным JSON.
+
+_Key = Tuple[int, int]
+_MISSING = object()
+
+
+def _dumps(data: Dict[str, Any]) -> Optional[str]:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")) if data else None
+
+
+def _loads(raw: Optional[str]) -> Dict[str, Any]:
+    return json.loads(raw) if raw else {}
+
+
+class _Entry:
+    __slots__ = ("state", "data", "updated", "checked")
+
+    def __init__(self, state: Optional[str], data: Dict[str, Any], updated: float, checked: float):
+        self.state = state
+        self.data = data
+        self.updated = updated
+        self.checked = checked
+
+
+class SqliteStateStorage(StateStorageBase):
+    def __init__(self, path: str, state_ttl: float = 24 * 3600, cache_size: int = 50_000,
+                 cache_ttl: float = 30.0, pool_size: int = 4, clock: Callable[[], float] = time.time):
+        super().__init__()
+        self.state_ttl = state_ttl
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self._clock = clock
+        self._cache: "OrderedDict[_Key, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        def connect():
+            conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            return conn
+
+        self.pool = ConnectionPool(connect, max_size=pool_size)
+        with self.pool.connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS fsm_states ("
+                " chat_id INTEGER NOT NULL,"
+                " user_id INTEGER NOT NULL,"
+                " state TEXT,"
+                " data TEXT,"
+                " updated REAL NOT NULL,"
+                " PRIMARY KEY (chat_id, user_id)"
+                ") WITHOUT ROWID"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS fsm_states_updated ON fsm_states (updated)")
+            conn.commit()
+
+    # --- кэш ---
+
+    def _expired(self, e: _Entry, now: float) -> bool:
+        return e.state is not None and self.state_ttl > 0 and now - e.updated > self.state_ttl
+
+    def _remember(self, key: _Key, e: _Entry) -> None:
+        self._cache[key] = e
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _fresh(self, key: _Key, now: float) -> Optional[_Entry]:
+        # запись кэша, которой ещё можно доверять; вызывается под _lock
+        e = self._cache.get(key)
+        if e is None or (self.cache_ttl > 0 and now - e.checked >= self.cache_ttl):
+            return None
+        self._cache.move_to_end(key)
+        if self._expired(e, now):
+            e = _Entry(None, {}, now, now)
+            self._cache[key] = e
+        return e
+
+    def cached_state(self, chat_id: int, user_id: int) -> Any:
+        # состояние из кэша без обращения к БД; _MISSING — надо читать (см. make_async_state_storage)
+        with self._lock:
+            e = self._fresh((chat_id, user_id), self._clock())
+        return _MISSING if e is None else e.state
+
+    def _entry(self, chat_id: int, user_id: int) -> _Entry:
+        key = (chat_id, user_id)
+        now = self._clock()
+        with self._lock:
+            stale = self._cache.get(key)
+            e = self._fresh(key, now)
+            if e is not None:
+                return e
+
+        with self.pool.connection() as conn:
+            row = conn.execute(
+                "SELECT state, data, updated FROM fsm_states WHERE chat_id = ? AND user_id = ?",
+                (chat_id, user_id),
+            ).fetchone()
+        if row is None:
+            e = _Entry(None, {}, now, now)
+        else:
+            e = _Entry(row[0], _loads(row[1]), row[2], now)
+            if self._expired(e, now):
+                e = _Entry(None, {}, now, now)
+        with self._lock:
+            current = self._cache.get(key)
+            if current is not None and current is not stale:
+                # пока читали без блокировки, состояние записал другой поток — его запись свежее прочитанного
+                self._cache.move_to_end(key)
+                return current
+            self._remember(key, e)
+        return e
+
+    def _write(self, chat_id: int, user_id: int, state: Any, data: Any = _MISSING) -> None:
+        now = self._clock()
+        key = (chat_id, user_id)
+        if state is None:
+            with self.pool.connection() as conn:
+                conn.execute("DELETE FROM fsm_states WHERE chat_id = ? AND user_id = ?", (chat_id, user_id))
+                conn.commit()
+            with self._lock:
+                self._remember(key, _Entry(None, {}, now, now))
+            return
+
+        if data is _MISSING:
+            data = self._entry(chat_id, user_id).data
+        with self.pool.connection() as conn:
+            conn.execute(
+                "INSERT INTO fsm_states (chat_id, user_id, state, data, updated) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (chat_id, user_id) DO UPDATE SET "
+                "state = excluded.state, data = excluded.data, updated = excluded.updated",
+                (chat_id, user_id, state, _dumps(data), now),
+            )
+            conn.commit()
+        with self._lock:
+            self._remember(key, _Entry(state, data, now, now))
+            self._writes += 1
+            purge = self.state_ttl > 0 and self._writes % 1000 == 0
+        if purge:
+            self.purge_expired()
+
+    def purge_expired(self) -> int:
+        if self.state_ttl <= 0:
+            return 0
+        with self.pool.connection() as conn:
+            cur = conn.execute("DELETE FROM fsm_states WHERE updated < ?", (self._clock() - self.state_ttl,))
+            conn.commit()
+            return cur.rowcount
+
+    # --- StateStorageBase ---
+
+    def set_state(self, chat_id, user_id, state):
+        if hasattr(state, "name"):
+            state = state.name
+        self._write(chat_id, user_id, state)
+        return True
+
+    def delete_state(self, chat_id, user_id):
+        existed = self._entry(chat_id, user_id).state is not None
+        self._write(chat_id, user_id, None)
+        return existed
+
+    def get_state(self, chat_id, user_id):
+        return self._entry(chat_id, user_id).state
+
+    def get_data(self, chat_id, user_id):
+        e = self._entry(chat_id, user_id)
+        return e.data if e.state is not None else None
+
+    def reset_data(self, chat_id, user_id):
+        e = self._entry(chat_id, user_id)
+        if e.state is None:
+            return False
+        self._write(chat_id, user_id, e.state, {})
+        return True
+
+    def set_data(self, chat_id, user_id, key, value):
+        e = self._entry(chat_id, user_id)
+        if e.state is None:
+            raise RuntimeError("chat_id {} and user_id {} does not exist".format(chat_id, user_id))
+        data = dict(e.data)
+        data[key] = value
+        self._write(chat_id, user_id, e.state, data)
+        return True
+
+    def get_interactive_data(self, chat_id, user_id):
+        return StateContext(self, chat_id, user_id)
+
+    def save(self, chat_id, user_id, data):
+        e = self._entry(chat_id, user_id)
+        if e.state is not None:
+            self._write(chat_id, user_id, e.state, data or {})
+
+    def close(self) -> None:
+        self.pool.close()
+
+
+def make_async_state_storage(storage: SqliteStateStorage):
+    # для AsyncTeleBot: та же реализация за async-интерфейсом. Запросы к SQLite идут в пуле потоков,
+    # чтобы не останавливать event loop; get_state (StateFilter на каждое сообщение) при попадании в кэш — сразу
+    from asyncio import to_thread
+
+    from telebot.asyncio_storage import StateStorageBase as AsyncStateStorageBase
+    from telebot.asyncio_storage.base_storage import StateContext as AsyncStateContext
+
+    class AsyncSqliteStateStorage(AsyncStateStorageBase):
+        def __init__(self):
+            super().__init__()
+            self.sync = storage
+
+        async def set_state(self, chat_id, user_id, state):
+            return await to_thread(storage.set_state, chat_id, user_id, state)
+
+        async def delete_state(self, chat_id, user_id):
+            return await to_thread(storage.delete_state, chat_id, user_id)
+
+        async def get_state(self, chat_id, user_id):
+            state = storage.cached_state(chat_id, user_id)
+            if state is _MISSING:
+                state = await to_thread(storage.get_state, chat_id, user_id)
+            return state
+
+        async def get_data(self, chat_id, user_id):
+            return await to_thread(storage.get_data, chat_id, user_id)
+
+        async def reset_data(self, chat_id, user_id):
+            return await to_thread(storage.reset_data, chat_id, user_id)
+
+        async def set_data(self, chat_id, user_id, key, value):
+            return await to_thread(storage.set_data, chat_id, user_id, key, value)
+
+        def get_interactive_data(self, chat_id, user_id):
+            return AsyncStateContext(self, chat_id, user_id)
+
+        async def save(self, chat_id, user_id, data):
+            return await to_thread(storage.save, chat_id, user_id, data)
+
+    return AsyncSqliteStateStorage()
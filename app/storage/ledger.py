@@ -0,0 +1,199 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from ..models import LedgerEntry
+from .backends import StorageBackend
+
+# Журнал кошелька: баланс меняется только добавлением записи, без read-modify-write по общему User.
+# - идемпотентность: (user_id, op_id) записывается один раз, повтор возвращает прежнюю запись;
+# - блокировки полосами (lock striping): операции разных пользователей не ждут друг друга;
+# - снимок (balance, seq) на пользователя: чтение баланса O(1), без проигрывания истории;
+# - записи копятся и уходят в БД пачкой (записи + снимки одной транзакцией) раз в flush_interval;
+#   flush_interval <= 0 — запись сразу после каждой операции (очередь в памяти не растёт);
+# - seq пользователя выдаёт только процесс, которому он принадлежит (owns, при шардировании):
+#   зачисления чужим пользователям лежат в таблице transfers, и владелец проводит их своим журналом
+#   (transfer_pump: провести, записать, удалить; повтор после падения отсекается по op_id).
+
+TRANSFER_BATCH = 500
+
+
+class InsufficientFunds(ValueError):
+    pass
+
+
+class Ledger:
+    def __init__(self, backend: StorageBackend, stripes: int = 64, flush_interval: float = 0.2,
+                 snapshot_cache_size: int = 100_000,
+                 initial_balance: Optional[Callable[[int], int]] = None,
+                 on_balance: Optional[Callable[[int, int], None]] = None,
+                 owns: Optional[Callable[[int], bool]] = None, transfer_interval: float = 1.0):
+        self.backend = backend
+        self.flush_interval = flush_interval
+        # owns(user_id) — пользователь этого процесса; None — все свои, переводов нет
+        self.owns = owns
+        self.transfer_interval = transfer_interval
+        self.snapshot_cache_size = snapshot_cache_size
+        # баланс до появления журнала (User.balance) и колбэк для зеркалирования снимка в User
+        self._initial_balance = initial_balance or (lambda user_id: 0)
+        self._on_balance = on_balance
+        self._stripes = [threading.Lock() for _ in range(stripes)]
+        self._snapshots: "OrderedDict[int, Tuple[int, int]]" = OrderedDict()
+        self._snap_lock = threading.Lock()
+        self._pending: List[LedgerEntry] = []
+        self._pending_ops: Dict[Tuple[int, str], LedgerEntry] = {}
+        self._pending_users: Dict[int, List[LedgerEntry]] = {}  # неотправленные записи по пользователю
+        self._pending_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        if flush_interval > 0 or owns is not None:
+            self._flusher = threading.Thread(target=self._flush_loop, name="ledger-flusher", daemon=True)
+            self._flusher.start()
+
+    def _stripe(self, user_id: int) -> threading.Lock:
+        return self._stripes[hash(user_id) % len(self._stripes)]
+
+    # --- снимки ---
+
+    def _snapshot(self, user_id: int) -> Tuple[int, int]:
+        with self._snap_lock:
+            snap = self._snapshots.get(user_id)
+            if snap is not None:
+                self._snapshots.move_to_end(user_id)
+                return snap
+        snap = self.backend.load_ledger_snapshot(user_id)
+        if snap is None:
+            snap = (self._initial_balance(user_id), 0)
+        self._store_snapshot(user_id, snap)
+        return snap
+
+    def _store_snapshot(self, user_id: int, snap: Tuple[int, int]) -> None:
+        with self._snap_lock:
+            self._snapshots[user_id] = snap
+            self._snapshots.move_to_end(user_id)
+            for _ in range(len(self._snapshots) - self.snapshot_cache_size):
+                uid = next(iter(self._snapshots))
+                if uid in self._pending_users:
+                    # снимок ещё не записан в БД — вытеснять нельзя
+                    self._snapshots.move_to_end(uid)
+                else:
+                    del self._snapshots[uid]
+
+    # --- API ---
+
+    def balance(self, user_id: int) -> int:
+        with self._stripe(user_id):
+            return self._snapshot(user_id)[0]
+
+    def post(self, user_id: int, delta: int, op_id: str, kind: str, allow_negative: bool = False) -> LedgerEntry:
+        with self._stripe(user_id):
+            entry = self._post_locked(user_id, lambda balance: delta, op_id, kind, allow_negative)
+        self._write_through()
+        return entry
+
+    def set_balance(self, user_id: int, amount: int, op_id: str, kind: str = "adjust") -> LedgerEntry:
+        # корректировка до заданной суммы проводится разницей, чтобы история оставалась полной
+        with self._stripe(user_id):
+            entry = self._post_locked(user_id, lambda balance: amount - balance, op_id, kind, True)
+        self._write_through()
+        return entry
+
+    def _write_through(self) -> None:
+        if self.flush_interval > 0:
+            return
+        try:
+            self.flush()
+        except Exception as e:
+            # запись уже проведена в памяти и уйдёт со следующим flush
+            print(f"[ledger] flush failed: {e!r}")
+
+    def _post_locked(self, user_id: int, delta_of: Callable[[int], int], op_id: str, kind: str,
+                     allow_negative: bool) -> LedgerEntry:
+        key = (user_id, op_id)
+        with self._pending_lock:
+            done = self._pending_ops.get(key)
+        if done is None:
+            done = self.backend.find_ledger_entry(user_id, op_id)
+        if done is not None:
+            return done
+
+        balance, seq = self._snapshot(user_id)
+        delta = delta_of(balance)
+        new_balance = balance + delta
+        if new_balance < 0 and delta < 0 and not allow_negative:
+            raise InsufficientFunds(f"balance {balance} < {-delta}")
+        entry = LedgerEntry(user_id, seq + 1, op_id, delta, new_balance, kind, time.time())
+        with self._pending_lock:
+            self._pending.append(entry)
+            self._pending_ops[key] = entry
+            self._pending_users.setdefault(user_id, []).append(entry)
+        self._store_snapshot(user_id, (new_balance, entry.seq))
+        if self._on_balance is not None:
+            self._on_balance(user_id, new_balance)
+        return entry
+
+    def history(self, user_id: int, before_seq: Optional[int] = None, limit: int = 10) -> List[LedgerEntry]:
+        # от новых к старым; неотправленные записи берём из памяти, остальное — из БД
+        with self._pending_lock:
+            fresh = [e for e in reversed(self._pending_users.get(user_id, ()))
+                     if before_seq is None or e.seq < before_seq][:limit]
+        if len(fresh) >= limit:
+            return fresh
+        next_before = fresh[-1].seq if fresh else before_seq
+        return fresh + self.backend.load_ledger_entries(user_id, next_before, limit - len(fresh))
+
+    # --- пакетная запись ---
+
+    def flush(self) -> int:
+        with self._flush_lock:
+            # записи остаются в _pending до коммита, чтобы history() не терял их на время записи
+            with self._pending_lock:
+                batch = list(self._pending)
+            if not batch:
+                return 0
+            self.backend.commit_ledger(batch)
+            with self._pending_lock:
+                del self._pending[:len(batch)]
+                for e in batch:
+                    self._pending_ops.pop((e.user_id, e.op_id), None)
+                    # записи пользователя уходят в порядке seq — отправленные всегда в начале списка
+                    entries = self._pending_users[e.user_id]
+                    del entries[0]
+                    if not entries:
+                        del self._pending_users[e.user_id]
+            return len(batch)
+
+    # --- переводы между шардами ---
+
+    def transfer_pump(self) -> int:
+        # проводит зачисления, адресованные пользователям этого процесса
+        owns = self.owns or (lambda user_id: True)
+        transfers = [t for t in self.backend.load_transfers(TRANSFER_BATCH) if owns(t[1])]
+        if not transfers:
+            return 0
+        for op_id, user_id, delta, kind in transfers:
+            with self._stripe(user_id):
+                self._post_locked(user_id, lambda balance, delta=delta: delta, op_id, kind, True)
+        self.flush()
+        self.backend.delete_transfers([t[0] for t in transfers])
+        return len(transfers)
+
+    def _flush_loop(self) -> None:
+        interval = self.flush_interval if self.flush_interval > 0 else self.transfer_interval
+        last_pump = 0.0
+        while not self._stopped.wait(interval):
+            try:
+                if time.monotonic() - last_pump >= self.transfer_interval:
+                    last_pump = time.monotonic()
+                    self.transfer_pump()
+                self.flush()
+            except Exception as e:
+                print(f"[ledger] flush failed: {e!r}")
+
+    def close(self) -> None:
+        self._stopped.set()
+        if self._flusher is not None:
+            self._flusher.join(timeout=5)
+        self.flush()
@@ -0,0 +1,115 @@
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Iterator, List
+
+# Ограниченный пул соединений: не больше max_size открытых коннектов на процесс.
+# Потоки telebot берут соединение на время операции и возвращают обратно.
+
+
+class PoolTimeout(RuntimeError):
+    pass
+
+
+_CREATE = object()  # вместо соединения: ждущий открывает новое (сломанное закрыли, место в пуле свободно)
+
+
+class _Waiter:
+    __slots__ = ("event", "conn")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.conn: Any = None
+
+
+class ConnectionPool:
+    def __init__(self, factory: Callable[[], Any], max_size: int = 4, timeout: float = 10.0):
+        if max_size < 1:
+            raise ValueError("max_size must be >= 1")
+        self._factory = factory
+        self._max_size = max_size
+        self._timeout = timeout
+        self._idle: List[Any] = []  # LIFO: горячие соединения переиспользуются первыми
+        # ждущие по очереди: вернувшееся соединение передаётся первому из них, а не тому, кто успел взять
+        # его раньше, — иначе под нагрузкой фоновый flush мог не получить соединение за timeout
+        self._waiters: Deque[_Waiter] = deque()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _create(self) -> Any:
+        try:
+            return self._factory()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def _acquire(self) -> Any:
+        with self._lock:
+            if self._idle and not self._waiters:
+                return self._idle.pop()
+            create = self._created < self._max_size
+            if create:
+                self._created += 1
+            else:
+                waiter = _Waiter()
+                self._waiters.append(waiter)
+        if create:
+            return self._create()
+        if not waiter.event.wait(self._timeout):
+            with self._lock:
+                if waiter.conn is None:
+                    self._waiters.remove(waiter)
+                    raise PoolTimeout(f"no free connection in {self._timeout}s (pool size {self._max_size})")
+        return self._create() if waiter.conn is _CREATE else waiter.conn
+
+    def _release(self, conn: Any, broken: bool = False) -> None:
+        with self._lock:
+            if not broken and not self._closed:
+                if self._waiters:
+                    waiter = self._waiters.popleft()
+                    waiter.conn = conn
+                    waiter.event.set()
+                else:
+                    self._idle.append(conn)
+                return
+            if self._waiters and not self._closed:
+                waiter = self._waiters.popleft()
+                waiter.conn = _CREATE
+                waiter.event.set()
+            else:
+                self._created -= 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        if self._closed:
+            raise RuntimeError("pool is closed")
+        conn = self._acquire()
+        try:
+            yield conn
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                self._release(conn, broken=True)
+                raise
+            self._release(conn)
+            raise
+        else:
+            self._release(conn)
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._created -= len(idle)
+        for conn in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
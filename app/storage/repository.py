@@ -0,0 +1,145 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+from ..models import User
+from .backends import StorageBackend
+
+# Репозиторий пользователей поверх движка:
+# - read-through LRU-кэш горячих User (чтение из БД только при промахе и вне общей блокировки);
+# - write-behind: изменения копятся в _dirty и раз в flush_interval уходят одной транзакцией.
+# Записи с несохранёнными изменениями (_dirty и пачка, которая сейчас пишется, — _inflight) не вытесняются
+# из памяти и видны get(), пока запись не закоммичена, — иначе промах перечитал бы из БД старую строку.
+
+
+class UserRepository:
+    def __init__(self, backend: StorageBackend, cache_size: int = 10_000, flush_interval: float = 0.5):
+        self.backend = backend
+        self.cache_size = cache_size
+        self.flush_interval = flush_interval
+        self._cache: "OrderedDict[int, User]" = OrderedDict()
+        self._dirty: Dict[int, User] = {}
+        self._inflight: Dict[int, User] = {}
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        if flush_interval > 0:
+            self._flusher = threading.Thread(target=self._flush_loop, name="storage-flusher", daemon=True)
+            self._flusher.start()
+
+    # --- кэш ---
+
+    def _lookup(self, user_id: int) -> Optional[User]:
+        # только память; вызывается под _lock
+        u = self._cache.get(user_id)
+        if u is not None:
+            self._cache.move_to_end(user_id)
+            return u
+        u = self._dirty.get(user_id) or self._inflight.get(user_id)
+        if u is not None:
+            self._remember(u)
+        return u
+
+    def _remember(self, u: User) -> None:
+        self._cache[u.user_id] = u
+        self._cache.move_to_end(u.user_id)
+        # с несохранёнными изменениями не вытесняем — переставляем в конец; если такие все, кэш временно больше.
+        # Ждущие записи в лимит не считаются: иначе между flush'ами каждая вставка перебирала бы их все
+        pinned = len(self._dirty) + len(self._inflight)
+        for _ in range(len(self._cache) - self.cache_size - pinned):
+            user_id, old = self._cache.popitem(last=False)
+            if user_id in self._dirty or user_id in self._inflight:
+                self._cache[user_id] = old
+
+    def _load(self, user_id: int, username: str | None) -> User:
+        # промах: читаем БД без блокировки, параллельно с другими промахами (пул соединений)
+        loaded = self.backend.load_user(user_id)
+        with self._lock:
+            u = self._lookup(user_id)
+            if u is None:
+                # пока читали, запись мог завести другой поток — тогда берём его объект
+                u = loaded or User(user_id=user_id, username=username)
+                self._remember(u)
+                if loaded is None:
+                    self._dirty[user_id] = u
+            return u
+
+    # --- API ---
+
+    def get(self, user_id: int, username: str | None = None) -> User:
+        with self._lock:
+            u = self._lookup(user_id)
+        if u is None:
+            u = self._load(user_id, username)
+        if username and not u.username:
+            with self._lock:
+                u.username = username
+                self._dirty[user_id] = u
+        return u
+
+    def update(self, user_id: int, mutate: Callable[[User], None]) -> User:
+        while True:
+            self.get(user_id)
+            with self._lock:
+                # между get и блокировкой запись могла быть сброшена и вытеснена — тогда читаем заново
+                u = self._lookup(user_id)
+                if u is not None:
+                    mutate(u)
+                    self._dirty[user_id] = u
+                    return u
+
+    def set_blocked(self, user_id: int, blocked: bool) -> None:
+        # пометка пишется в БД сразу и только колонкой (см. StorageBackend.set_blocked);
+        # копия в памяти обновляется, но грязной не становится
+        with self._lock:
+            u = self._cache.get(user_id) or self._dirty.get(user_id) or self._inflight.get(user_id)
+            if u is not None:
+                u.is_blocked = blocked
+        self.backend.set_blocked([user_id], blocked)
+
+    def user_ids(self, after_id: int, limit: int) -> List[int]:
+        # обход идёт по движку, поэтому сначала сбрасываем новых/изменённых пользователей
+        self.flush()
+        return self.backend.load_user_ids(after_id, limit)
+
+    # --- write-behind ---
+
+    def flush(self) -> int:
+        with self._flush_lock:
+            with self._lock:
+                if not self._dirty:
+                    return 0
+                batch = self._inflight = self._dirty
+                self._dirty = {}
+                snapshot = [User(**vars(u)) for u in batch.values()]
+            try:
+                self.backend.save_users(snapshot)
+            except Exception:
+                # вернуть в очередь, не затирая более свежие изменения
+                with self._lock:
+                    for uid, u in batch.items():
+                        self._dirty.setdefault(uid, u)
+                    self._inflight = {}
+                raise
+            with self._lock:
+                self._inflight = {}
+            return len(snapshot)
+
+    def _flush_loop(self) -> None:
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[storage] flush failed: {e!r}")
+
+    def close(self) -> None:
+        self._stopped.set()
+        self._wakeup.set()
+        if self._flusher is not None:
+            self._flusher.join(timeout=5)
+        self.flush()
+        self.backend.close()
@@ -0,0 +1,133 @@
+import hmac
+import json
+import queue
+import threading
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional, Tuple
+
+from telebot import TeleBot
+from telebot.types import Update
+
+from .ingest import shard_of, user_key
+
+# Webhook-режим: локальный HTTP-эндпоинт принимает апдейты от Telegram (или от фейкового клиента),
+# проверяет X-Telegram-Bot-Api-Secret-Token и кладёт апдейты в ограниченные очереди воркеров.
+# Апдейты одного пользователя всегда попадают к одному воркеру (shard_of, как дорожки ingest.py) и
+# обрабатываются по порядку: многошаговые сценарии FSM не перемешиваются. Если очередь воркера полна —
+# отвечаем 503 с Retry-After, Telegram повторит доставку позже, а процесс не копит апдейты без ограничений.
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+MAX_BODY = 1 << 20
+
+
+class UpdateWorkerPool:
+    def __init__(self, bot: TeleBot, workers: int = 8, queue_size: int = 256):
+        self.bot = bot
+        workers = max(1, workers)
+        # общий лимит делится между дорожками: очередь каждого воркера ограничена отдельно
+        lane_size = max(1, queue_size // workers) if queue_size else 0
+        self._queues: "List[queue.Queue[Optional[Update]]]" = [queue.Queue(maxsize=lane_size) for _ in range(workers)]
+        self._submit_lock = threading.Lock()
+        self._threads = [
+            threading.Thread(target=self._run, args=(q,), name=f"webhook-worker-{i}", daemon=True)
+            for i, q in enumerate(self._queues)
+        ]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, updates: List[Tuple[int, Update]]) -> bool:
+        # updates — пары (user_key, апдейт); всё или ничего: частично принятый батч Telegram всё равно
+        # переотправит целиком
+        lanes = [self._queues[shard_of(key, len(self._queues))] for key, _ in updates]
+        with self._submit_lock:
+            wanted = {}
+            for q in lanes:
+                wanted[id(q)] = wanted.get(id(q), 0) + 1
+            for q in lanes:
+                if q.maxsize and q.qsize() + wanted[id(q)] > q.maxsize:
+                    return False
+            for q, (_, u) in zip(lanes, updates):
+                q.put_nowait(u)
+        return True
+
+    def _run(self, q: "queue.Queue[Optional[Update]]") -> None:
+        while True:
+            u = q.get()
+            try:
+                if u is None:
+                    return
+                self.bot.process_new_updates([u])
+            except Exception as e:
+                print(f"[webhook] update {getattr(u, 'update_id', '?')} failed: {e!r}")
+            finally:
+                q.task_done()
+
+    def depth(self) -> int:
+        return sum(q.qsize() for q in self._queues)
+
+    def stop(self, timeout: float = 10.0) -> None:
+        # дождаться разбора очередей, затем остановить воркеры
+        for q in self._queues:
+            q.put(None)
+        for t in self._threads:
+            t.join(timeout=timeout)
+
+
+class WebhookServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Telegram держит до max_connections соединений сразу; очередь accept по умолчанию (5) сбрасывала бы лишние
+    request_queue_size = 128
+
+    def __init__(self, bot: TeleBot, host: str, port: int, path: str, secret: str,
+                 workers: int = 8, queue_size: int = 256):
+        self.bot = bot
+        self.webhook_path = "/" + path.strip("/")
+        self.secret = secret
+        super().__init__((host, port), _WebhookHandler)
+        # воркеры — только после успешного bind: иначе их потоки остались бы без сервера
+        self.pool = UpdateWorkerPool(bot, workers=workers, queue_size=queue_size)
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+        self.pool.stop()
+
+
+class _WebhookHandler(BaseHTTPRequestHandler):
+    server: WebhookServer
+
+    def do_POST(self):
+        srv = self.server
+        if self.path != srv.webhook_path:
+            return self._reply(HTTPStatus.NOT_FOUND)
+        if srv.secret and not hmac.compare_digest(self.headers.get(SECRET_HEADER, ""), srv.secret):
+            return self._reply(HTTPStatus.FORBIDDEN)
+
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            return self._reply(HTTPStatus.BAD_REQUEST)
+        if length <= 0 or length > MAX_BODY:
+            return self._reply(HTTPStatus.REQUEST_ENTITY_TOO_LARGE if length > MAX_BODY else HTTPStatus.BAD_REQUEST)
+        try:
+            payload = json.loads(self.rfile.read(length))
+            raw = payload if isinstance(payload, list) else [payload]
+            updates = [(user_key(item), Update.de_json(item)) for item in raw]
+        except (ValueError, TypeError, KeyError, AttributeError):
+            return self._reply(HTTPStatus.BAD_REQUEST)
+
+        if not srv.pool.submit(updates):
+            return self._reply(HTTPStatus.SERVICE_UNAVAILABLE, retry_after=1)
+        return self._reply(HTTPStatus.OK)
+
+    def _reply(self, status: HTTPStatus, retry_after: int | None = None):
+        self.send_response(status)
+        if retry_after is not None:
+            self.send_header("Retry-After", str(retry_after))
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        # без построчного access-лога на горячем пути
+        pass
@@ -0,0 +1,44 @@
+import dataclasses
+
+from telebot import apihelper
+from telebot.types import Update
+
+from app.loadtest.fake_api import FakeBotApi
+
+
+def _command(user_id, text):
+    return Update.de_json({"update_id": 1, "message": {
+        "message_id": 1, "date": 0, "text": text,
+        "entities": [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}],
+        "from": {"id": user_id, "is_bot": False, "first_name": "u"},
+        "chat": {"id": user_id, "type": "private"},
+    }})
+
+
+def test_admin_commands_from_others_are_refused(monkeypatch):
+    from app.config import load_config
+    from app.engine import make_engine
+    from app.handlers import admin
+
+    sent = []
+    api = FakeBotApi(on_call=lambda method, params, t: sent.append((params.get("chat_id"), params.get("text"))))
+    api.start()
+    monkeypatch.setattr(apihelper, "API_URL", api.api_url)
+    monkeypatch.setenv("BOT_TOKEN", "123456:test")
+    cfg = dataclasses.replace(load_config(), bot_engine="sync", admin_ids=[1])
+    bot = make_engine(cfg, threaded=False)
+    fell_through = []
+    admin.register(bot, cfg)
+
+    @bot.message_handler(func=lambda m: True)
+    async def any_message(m):
+        fell_through.append(m.text)
+
+    try:
+        bot.bot.process_new_updates([_command(2, "/stats"), _command(2, "/broadcast hi"), _command(1, "/stats")])
+    finally:
+        bot.stop()
+        api.stop()
+    assert fell_through == []
+    assert sent[:2] == [("2", "⛔ Команда доступна только администраторам.")] * 2
+    assert sent[2][0] == "1" and "⛔" not in sent[2][1]
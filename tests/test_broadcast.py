@@ -0,0 +1,23 @@
+from concurrent.futures import Future
+
+from app.broadcast import DONE, Broadcaster
+
+
+class Engine:
+    def submit(self, method, *args, **kwargs):
+        fut = Future()
+        fut.set_result(None)
+        return fut
+
+
+def test_progress_message_is_saved_with_campaign(tmp_path):
+    seen = []
+    broadcasts = Broadcaster()
+    broadcasts.engine = Engine()
+    broadcasts.path = str(tmp_path)
+    broadcasts.on_progress = lambda c, rate: seen.append(c.progress_message_id)
+    c = broadcasts.start(1, text="hi", progress_message_id=42)
+    broadcasts.join(c.campaign_id, timeout=5)
+    assert seen == [42]
+    saved = broadcasts._load(c.campaign_id)
+    assert (saved.status, saved.progress_message_id) == (DONE, 42)
@@ -0,0 +1,53 @@
+from app.catalog import Catalog, import_csv
+from app.models import Product
+from app.storage.backends import MemoryBackend, SqliteBackend
+
+
+def _p(product_id, price, title="товар", category="ab", seller_id=7):
+    return Product(product_id, seller_id, category, title, price)
+
+
+def test_add_many_replaces_repeated_and_existing_products():
+    catalog = Catalog()
+    catalog.add_many([_p(1, 50, "старый"), _p(2, 10), _p(1, 70, "новый")])
+    assert catalog._by_price == [(10, 2), (70, 1)]
+    assert catalog._by_category["ab"] == [(10, 2), (70, 1)]
+    assert catalog.search("старый") == []
+    assert [p.product_id for p in catalog.search("нов")] == [1]
+
+    catalog.add_many([_p(2, 90), _p(3, 5)])
+    assert catalog._by_price == [(5, 3), (70, 1), (90, 2)]
+    items, cursor = catalog.browse("ab", limit=2)
+    assert [p.product_id for p in items] == [3, 1] and cursor
+    assert [p.product_id for p in catalog.browse("ab", cursor, limit=2)[0]] == [2]
+
+
+def test_catalog_is_loaded_from_database(tmp_path):
+    path = tmp_path / "products.csv"
+    path.write_text("product_id,seller_id,category,title,price\n1,7,ab,Ключ Steam,100\n2,8,cd,Аккаунт,50\n",
+                    encoding="utf-8")
+    backend = SqliteBackend(str(tmp_path / "bot.db"))
+    assert import_csv(str(path), backend) == 2
+
+    catalog = Catalog()
+    assert catalog.open(backend) == 2
+    catalog.add(_p(3, 20, "Подписка", "cd"))
+    catalog.remove(1)
+
+    restarted = Catalog()
+    assert restarted.open(backend) == 2
+    assert [p.product_id for p in restarted.browse("cd")[0]] == [3, 2]
+    assert restarted.get(1) is None
+    backend.close()
+
+
+def test_open_loads_in_batches(monkeypatch):
+    import app.catalog
+
+    monkeypatch.setattr(app.catalog, "LOAD_BATCH", 3)
+    backend = MemoryBackend()
+    backend.save_products(_p(i, i % 4) for i in range(1, 11))
+    catalog = Catalog()
+    assert catalog.open(backend) == 10
+    assert catalog.count("ab") == 10
+    assert catalog._by_price == sorted((i % 4, i) for i in range(1, 11))
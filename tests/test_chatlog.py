@@ -0,0 +1,52 @@
+import os
+
+from app.storage.chatlog import _HEADER, ChatLog
+
+ROOM = (1, 2, 0)
+
+
+def test_writers_share_history_and_reply_routes(tmp_path):
+    # покупатель и продавец в разных шардах: каждый пишет в свой каталог, история общая
+    a = ChatLog(str(tmp_path), writer="w0")
+    b = ChatLog(str(tmp_path), writer="w1")
+    a.append(ROOM, 1, "привет", ts=1.0, copy_message_id=100)
+    b.append(ROOM, 2, "здравствуй", ts=2.0, copy_message_id=200)
+    a.append(ROOM, 1, "как дела", ts=3.0, copy_message_id=101)
+
+    assert [r.text for r in a.history(ROOM)] == ["как дела", "здравствуй", "привет"]
+    assert [r.text for r in b.history(ROOM, limit=2)] == ["как дела", "здравствуй"]
+    # реплай продавца на копию, доставленную шардом покупателя, и наоборот
+    assert b.reply_room(2, 101) == ROOM
+    assert a.reply_room(1, 200) == ROOM
+    assert a.reply_room(1, 999) is None
+    a.close()
+    b.close()
+
+
+def test_restart_truncates_only_own_torn_tail(tmp_path):
+    a = ChatLog(str(tmp_path), writer="w0")
+    b = ChatLog(str(tmp_path), writer="w1")
+    b.append(ROOM, 2, "раз", ts=1.0)
+    # w1 пишет запись прямо сейчас: в файле пока только заголовок
+    with open(os.path.join(str(tmp_path), "w1", "00000001.seg"), "ab") as f:
+        f.write(_HEADER.pack(*ROOM, 2, 2.0, 0xFFFFFFFF, 0xFFFFFFFF, 10, 0))
+    size = os.path.getsize(os.path.join(str(tmp_path), "w1", "00000001.seg"))
+    a.close()
+
+    a = ChatLog(str(tmp_path), writer="w0")  # перезапуск другого воркера
+    assert os.path.getsize(os.path.join(str(tmp_path), "w1", "00000001.seg")) == size
+    assert [r.text for r in a.history(ROOM)] == ["раз"]
+    a.close()
+    b.close()
+
+
+def test_reads_legacy_segments(tmp_path):
+    from app.storage.chatlog import _HEADER_V1
+
+    body = "старое".encode("utf-8")
+    with open(os.path.join(str(tmp_path), "00000001.seg"), "wb") as f:
+        f.write(_HEADER_V1.pack(*ROOM, 1, 1.0, 0xFFFFFFFF, 0xFFFFFFFF, len(body)) + body)
+    log = ChatLog(str(tmp_path))
+    log.append(ROOM, 2, "новое", ts=2.0)
+    assert [r.text for r in log.history(ROOM)] == ["новое", "старое"]
+    log.close()
@@ -0,0 +1,39 @@
+import dataclasses
+import threading
+import time
+
+import pytest
+
+from app.ingest import Ingestor, UpdateCheckpoint
+from app.loadtest.fake_api import FakeBotApi
+
+
+@pytest.mark.parametrize("ingest", [False, True])
+def test_async_stop_polling_interrupts_long_poll(tmp_path, monkeypatch, ingest):
+    from telebot import asyncio_helper
+
+    from app.config import load_config
+    from app.engine import make_engine
+
+    # getUpdates висит дольше, чем ждёт тест: остановка должна отменить ожидание, а не дождаться ответа
+    api = FakeBotApi(poll_wait=30).start()
+    monkeypatch.setattr(asyncio_helper, "API_URL", api.api_url)
+    monkeypatch.setenv("BOT_TOKEN", "123456:test")
+    cfg = dataclasses.replace(load_config(), bot_engine="async")
+    bot = make_engine(cfg)
+    if ingest:
+        ingestor = Ingestor(bot.bot, UpdateCheckpoint(str(tmp_path / "offset.json")), lanes=2)
+        poller = threading.Thread(target=bot.run_ingest, args=(ingestor,), daemon=True)
+    else:
+        poller = threading.Thread(target=bot.run_polling, kwargs={"skip_pending": False}, daemon=True)
+    poller.start()
+    try:
+        assert api.polling.wait(10)
+        started = time.monotonic()
+        bot.stop_polling()
+        poller.join(5)
+        assert not poller.is_alive()
+        assert time.monotonic() - started < 5
+    finally:
+        bot.stop()
+        api.stop()
@@ -0,0 +1,94 @@
+from telebot.types import Update
+
+from app.flood import MAX_MUTE, MUTED, THROTTLED, FloodGuard
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _message(user_id, text="hi"):
+    return Update.de_json({"update_id": 1, "message": {
+        "message_id": 1, "date": 0, "text": text,
+        "from": {"id": user_id, "is_bot": False, "first_name": "u"},
+        "chat": {"id": user_id, "type": "private"},
+    }})
+
+
+def _callback(user_id, data):
+    return Update.de_json({"update_id": 1, "callback_query": {
+        "id": "1", "chat_instance": "1", "data": data,
+        "from": {"id": user_id, "is_bot": False, "first_name": "u"},
+    }})
+
+
+def test_rate_limit_mutes_with_doubling():
+    clock = Clock()
+    notices = []
+    guard = FloodGuard(rate=5, window=10.0, mute=30.0, state_limits={},
+                       on_notice=lambda chat_id, kind, seconds: notices.append((chat_id, kind, seconds)), clock=clock)
+    assert all(guard.check(_message(1)) for _ in range(5))
+    assert not guard.check(_message(1))
+    assert notices == [(1, MUTED, 30.0)]
+    assert guard.check(_message(2))  # другие пользователи не задеты
+    clock.now += 29
+    assert not guard.check(_message(1))
+    clock.now += 20  # мьют кончился, окно сдвинулось
+    assert all(guard.check(_message(1)) for _ in range(5))
+    assert not guard.check(_message(1))
+    assert notices[-1] == (1, MUTED, 60.0)  # повторное нарушение — вдвое дольше
+    clock.now += 60 + MAX_MUTE + 1
+    for _ in range(6):
+        guard.check(_message(1))
+    assert notices[-1] == (1, MUTED, 30.0)  # давно не нарушал — снова короткий мьют
+    assert guard.stats()["muted"] == 1 and guard.stats()["rate"] == 3
+
+
+def test_repeated_callback_is_dropped_and_state_limit_throttles():
+    clock = Clock()
+    notices = []
+    guard = FloodGuard(rate=100, dup_window=1.0, state_limits={"support": (2, 60.0)},
+                       on_notice=lambda chat_id, kind, seconds: notices.append(kind), clock=clock)
+    assert guard.check(_callback(1, "NAV:home"))
+    assert not guard.check(_callback(1, "NAV:home"))
+    assert guard.check(_callback(1, "NAV:profile"))
+    clock.now += 1.5
+    assert guard.check(_callback(1, "NAV:profile"))
+    assert guard.needs_state(_message(1)) and not guard.needs_state(_callback(1, "x"))
+    assert guard.check(_message(1), "support") and guard.check(_message(1), "support")
+    assert not guard.check(_message(1), "support")
+    assert guard.check(_message(1), None)  # вне состояния — только общий лимит
+    assert notices == [THROTTLED]
+    assert guard.stats()["duplicate"] == 1 and guard.stats()["state"] == 1
+
+
+def test_tracked_users_are_bounded():
+    clock = Clock()
+    guard = FloodGuard(rate=1, window=60.0, mute=30.0, state_limits={}, max_users=100, clock=clock)
+    assert guard.check(_message(1))
+    assert not guard.check(_message(1))  # пользователь 1 в мьюте
+    for user_id in range(2, 302):
+        guard.check(_message(user_id))
+    assert guard.stats()["users"] == 100
+    # запись вытеснена (LRU) — мьют забыт; это цена ограничения памяти
+    assert guard.check(_message(1))
+
+
+def test_dropped_callbacks_are_answered_at_most_once_per_interval():
+    clock = Clock()
+    answered = []
+    guard = FloodGuard(rate=0, dup_window=1.0, answer_interval=1.0, state_limits={},
+                       on_dropped_callback=answered.append, clock=clock)
+    assert guard.check(_callback(1, "NAV:home"))
+    for _ in range(5):
+        clock.now += 0.1
+        assert not guard.check(_callback(1, "NAV:home"))
+    # первое отброшенное нажатие гасит "часики", остальные в пределах интервала — без вызова API
+    assert answered == ["1"]
+    clock.now += 0.7  # повтор всё ещё схлопывается, но интервал ответа прошёл
+    assert not guard.check(_callback(1, "NAV:home"))
+    assert answered == ["1", "1"]
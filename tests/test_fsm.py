@@ -0,0 +1,45 @@
+import threading
+from contextlib import contextmanager
+
+from app.storage.fsm import SqliteStateStorage
+
+
+def test_read_outside_lock_does_not_overwrite_newer_write(tmp_path):
+    storage = SqliteStateStorage(str(tmp_path / "fsm.sqlite3"), cache_ttl=3600)
+    read_done, write_done = threading.Event(), threading.Event()
+    connection = storage.pool.connection
+    calls = []
+
+    @contextmanager
+    def slow_read():
+        # первое чтение видит БД до записи, но кладёт результат в кэш уже после неё
+        with connection() as conn:
+            yield conn
+        calls.append(1)
+        if len(calls) == 1:
+            read_done.set()
+            write_done.wait(5)
+
+    storage.pool.connection = slow_read
+    reader = threading.Thread(target=storage.get_state, args=(1, 1))
+    reader.start()
+    assert read_done.wait(5)
+    storage.set_state(1, 1, "waiting_amount")
+    write_done.set()
+    reader.join(5)
+    assert storage.get_state(1, 1) == "waiting_amount"
+    storage.close()
+
+
+def test_cache_ttl_rereads_other_process_writes(tmp_path):
+    now = [1000.0]
+    path = str(tmp_path / "fsm.sqlite3")
+    mine = SqliteStateStorage(path, clock=lambda: now[0])
+    other = SqliteStateStorage(path, clock=lambda: now[0])
+    assert mine.get_state(1, 1) is None
+    other.set_state(1, 1, "waiting_amount")
+    assert mine.get_state(1, 1) is None  # кэш ещё доверяется
+    now[0] += mine.cache_ttl
+    assert mine.get_state(1, 1) == "waiting_amount"
+    mine.close()
+    other.close()
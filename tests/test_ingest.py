@@ -0,0 +1,66 @@
+import asyncio
+import json
+import os
+import threading
+
+import pytest
+
+from app.ingest import Ingestor, UpdateCheckpoint
+
+
+def _update(update_id: int, user_id: int = 1) -> dict:
+    return {"update_id": update_id, "callback_query": {"id": str(update_id), "data": "x", "chat_instance": "c",
+                                                        "from": {"id": user_id, "is_bot": False, "first_name": "u"}}}
+
+
+def test_failed_save_is_retried_before_offset_is_acked(tmp_path, monkeypatch):
+    path = str(tmp_path / "offset.json")
+    checkpoint = UpdateCheckpoint(path, flush_interval=60)
+    checkpoint.begin(_update(5))
+
+    def disk_full(src, dst):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(os, "replace", disk_full)
+    with pytest.raises(OSError):
+        checkpoint.ack_offset()
+    monkeypatch.undo()
+    # взятый апдейт должен оказаться на диске раньше, чем offset уйдёт в Telegram
+    assert checkpoint.ack_offset() == 6
+    with open(path, encoding="utf-8") as f:
+        assert [raw["update_id"] for raw in json.load(f)["pending"]] == [5]
+
+
+def test_async_lanes_save_checkpoint_off_the_event_loop(tmp_path, monkeypatch):
+    from telebot import asyncio_helper
+
+    checkpoint = UpdateCheckpoint(str(tmp_path / "offset.json"), flush_interval=0)
+    save = checkpoint.save
+    savers = []
+
+    def recording_save():
+        savers.append(threading.current_thread())
+        save()
+
+    monkeypatch.setattr(checkpoint, "save", recording_save)
+
+    class Bot:
+        token = "123456:test"
+
+        async def process_new_updates(self, updates):
+            pass
+
+    ingestor = Ingestor(Bot(), checkpoint, lanes=2, max_age=0)
+    batches = [[_update(i, user_id=i) for i in range(1, 21)]]
+
+    async def get_updates(token, offset=None, **kwargs):
+        if batches:
+            return batches.pop()
+        ingestor.stop()
+        return []
+
+    monkeypatch.setattr(asyncio_helper, "get_updates", get_updates)
+    asyncio.run(ingestor.run_async())
+    assert ingestor.stats()["processed"] == 20
+    assert checkpoint.offset == 21
+    assert savers and threading.main_thread() not in savers
@@ -0,0 +1,69 @@
+import threading
+
+from app.ingest import shard_of
+from app.storage.backends import MemoryBackend, SqliteBackend
+from app.storage.ledger import Ledger
+
+
+def _entries(backend, user_id):
+    return list(reversed(backend.load_ledger_entries(user_id, None, 1_000_000)))
+
+
+def test_concurrent_posts_keep_balances_and_seq():
+    backend = MemoryBackend()
+    ledger = Ledger(backend, stripes=4, flush_interval=0.01)
+    users, threads, ops = 10, 16, 200
+
+    def worker(t):
+        for i in range(ops):
+            user_id = (t + i) % users
+            ledger.post(user_id, 1, f"op:{t}:{i}", "test")
+            # повтор той же операции (ретрай хендлера) не проводится второй раз
+            ledger.post(user_id, 1, f"op:{t}:{i}", "test")
+
+    pool = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    ledger.close()
+
+    total = 0
+    for user_id in range(users):
+        entries = _entries(backend, user_id)
+        assert [e.seq for e in entries] == list(range(1, len(entries) + 1))
+        assert entries[-1].balance_after == len(entries) == ledger.balance(user_id)
+        total += len(entries)
+    assert total == threads * ops
+
+
+def test_write_through_without_flusher_keeps_nothing_pending():
+    backend = MemoryBackend()
+    ledger = Ledger(backend, flush_interval=0)
+    for i in range(100):
+        ledger.post(1, 1, f"op:{i}", "test")
+    assert not ledger._pending
+    assert [e.seq for e in ledger.history(1, limit=3)] == [100, 99, 98]
+
+
+def test_credits_to_other_shard_go_through_owner(tmp_path):
+    backend = SqliteBackend(str(tmp_path / "bot.db"))
+    shards = [Ledger(backend, flush_interval=0, owns=lambda uid, i=i: shard_of(uid, 2) == i) for i in range(2)]
+    seller = next(uid for uid in range(1, 100) if shard_of(uid, 2) == 1)
+    buyers = [uid for uid in range(1, 200) if shard_of(uid, 2) == 0][:20]
+
+    # выплаты продавцу из процесса покупателей, пока продавец сам проводит свои операции
+    for n, buyer in enumerate(buyers):
+        backend.add_transfer(f"order:{n}:payout", seller, 10, "order")
+        shards[1].post(seller, -1, f"fee:{n}", "fee", allow_negative=True)
+    backend.add_transfer("order:0:payout", seller, 10, "order")  # повторная постановка
+    assert shards[0].transfer_pump() == 0
+    assert shards[1].transfer_pump() == len(buyers)
+    assert backend.load_transfers(100) == []
+
+    entries = _entries(backend, seller)
+    assert [e.seq for e in entries] == list(range(1, 2 * len(buyers) + 1))
+    assert shards[1].balance(seller) == 9 * len(buyers)
+    for ledger in shards:
+        ledger.close()
+    backend.close()
@@ -0,0 +1,34 @@
+import json
+import threading
+
+from app.media import MediaCache
+
+
+def test_processes_sharing_cache_file_save_concurrently(tmp_path):
+    path = str(tmp_path / "media_cache.json")
+    photos = []
+    for i in range(4):
+        photo = tmp_path / f"{i}.jpg"
+        photo.write_bytes(bytes([i]) * 10)
+        photos.append(str(photo))
+    # отдельные экземпляры — как воркеры шарда: блокировка у каждого своя
+    caches = [MediaCache(path) for _ in range(4)]
+    errors = []
+
+    def work(i):
+        try:
+            for n in range(50):
+                caches[i].put(photos[i], f"file-{i}-{n}")
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=work, args=(i,)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    with open(path, encoding="utf-8") as f:
+        assert json.load(f)
+    assert [p.name for p in tmp_path.iterdir() if p.suffix == ".tmp"] == []
+    assert MediaCache(path).get(photos[0]) in (None, "file-0-49")
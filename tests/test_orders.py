@@ -0,0 +1,81 @@
+import pytest
+
+from app.orders import CONFIRMED, DISPUTE, PAID, REFUNDED, OrderBook, OrderError, payouts
+from app.storage.backends import MemoryBackend, SqliteBackend
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _book(backend, clock):
+    book = OrderBook(backend, confirm_timeout=100, escalate_timeout=50, payouts=payouts, clock=clock)
+    book.open(backend)
+    return book
+
+
+def test_orders_survive_restart(tmp_path):
+    clock = Clock()
+    backend = SqliteBackend(str(tmp_path / "bot.db"))
+    book = _book(backend, clock)
+    order = book.create(1, 2, 30)
+    book.transition(order.order_id, "pay", 1)
+    book.transition(order.order_id, "delivered", 2)
+    book.close()
+
+    restarted = OrderBook(backend, confirm_timeout=100, payouts=payouts, clock=clock)
+    assert restarted.open(backend) == 1
+    assert [o.order_id for o in restarted.for_buyer(1)] == [order.order_id]
+    assert restarted.count("delivered", seller_id=2) == 1
+    clock.now += 101  # таймер подтверждения восстановлен из БД
+    assert restarted.run_due() == 1
+    assert restarted.get(order.order_id).status == CONFIRMED
+    assert backend.load_transfers(10) == [(f"order:{order.order_id}:payout", 2, 30, "order")]
+    restarted.close()
+    backend.close()
+
+
+def test_dispute_is_resolved_by_admin_only():
+    clock = Clock()
+    backend = MemoryBackend()
+    book = _book(backend, clock)
+    order = book.create(1, 2, 30)
+    book.transition(order.order_id, "pay", 1)
+    book.transition(order.order_id, "dispute", 2)
+    with pytest.raises(OrderError):
+        book.transition(order.order_id, "refund", 1)
+    book.transition(order.order_id, "refund", 99, admin=True)
+    assert book.get(order.order_id).status == REFUNDED
+    assert backend.load_transfers(10) == [(f"order:{order.order_id}:refund", 1, 30, "refund")]
+    book.close()
+
+
+def test_processes_sharing_a_database_see_each_other(tmp_path):
+    clock = Clock()
+    backend = SqliteBackend(str(tmp_path / "bot.db"))
+    # синхронизация в фоне не успеет: проверяем переходы поверх устаревшей копии
+    buyer_side, seller_side = [OrderBook(backend, clock=clock, sync_interval=3600) for _ in range(2)]
+    for book in (buyer_side, seller_side):
+        book.open(backend, shared=True)
+    order = buyer_side.create(1, 2, 30)
+    buyer_side.transition(order.order_id, "pay", 1)
+
+    # продавец в другом процессе: заказ перечитывается из БД
+    assert seller_side.transition(order.order_id, "delivered", 2).status == "delivered"
+    # копия покупателя устарела, но переход сверяет версию в БД
+    assert buyer_side._orders[order.order_id].status == PAID
+    buyer_side.shared = False
+    with pytest.raises(OrderError):
+        buyer_side.transition(order.order_id, "dispute", 1)
+    buyer_side.shared = True
+    assert buyer_side.get(order.order_id).status == "delivered"
+    assert buyer_side.transition(order.order_id, "dispute", 1).status == DISPUTE
+    seller_side.sync()
+    assert seller_side.count(DISPUTE, seller_id=2) == 1
+    for book in (buyer_side, seller_side):
+        book.close()
+    backend.close()
@@ -0,0 +1,181 @@
+import io
+import threading
+import time
+
+import pytest
+from telebot import TeleBot, apihelper
+
+from app import outbound
+from app.loadtest.fake_api import FakeBotApi
+from app.outbound import PRIORITY_BULK, OutboundScheduler
+
+
+@pytest.fixture
+def api(monkeypatch):
+    server = FakeBotApi(seed=3).start()
+    monkeypatch.setattr(apihelper, "API_URL", server.api_url)
+    yield server
+    server.stop()
+
+
+def _scheduler(**kwargs):
+    bot = TeleBot("123456:test", threaded=False)
+    return OutboundScheduler(lambda method, args, kw: getattr(bot, method)(*args, **kw), **kwargs)
+
+
+def test_429_from_api_is_retried_after_retry_after(api):
+    api.rate_429 = 0.5
+    scheduler = _scheduler(global_rate=1000, chat_rate=1000, chat_burst=1000, max_retries=20)
+    futures = [scheduler.submit("send_message", (chat_id, "hi")) for chat_id in range(1, 21)]
+    messages = [f.result(timeout=60) for f in futures]
+    scheduler.stop()
+    assert [m.chat.id for m in messages] == list(range(1, 21))
+    stats = scheduler.stats()
+    assert api.injected_429 > 0
+    assert stats["retried_429"] == api.injected_429
+    assert (stats["sent"], stats["failed"]) == (20, 0)
+
+
+def test_429_after_max_retries_fails_the_call(api):
+    api.rate_429 = 1.0
+    scheduler = _scheduler(max_retries=1)
+    started = time.monotonic()
+    with pytest.raises(apihelper.ApiTelegramException) as err:
+        scheduler.call("send_message", 1, "hi")
+    scheduler.stop()
+    assert err.value.error_code == 429
+    assert api.injected_429 == 2
+    assert time.monotonic() - started >= api.retry_after
+
+
+def test_waiting_caller_is_not_held_by_chat_bucket(api):
+    scheduler = _scheduler(chat_rate=4.0, chat_burst=1.0)
+    bulk = [scheduler.submit("send_message", (1, f"bulk {i}"), priority=PRIORITY_BULK) for i in range(3)]
+    started = time.monotonic()
+    for i in range(3):
+        scheduler.call("send_message", 1, f"reply {i}")
+    # ответы хендлера не ждут паузы чата, рассылка в тот же чат — ждёт
+    assert time.monotonic() - started < 0.25
+    assert not bulk[-1].done()
+    for f in bulk:
+        f.result(timeout=30)
+    scheduler.stop()
+
+
+def test_idle_chat_buckets_are_evicted(monkeypatch):
+    monkeypatch.setattr(outbound, "_CHAT_BUCKETS_SOFT_LIMIT", 100)
+    now = [0.0]
+    scheduler = OutboundScheduler(lambda method, args, kw: None, chat_rate=1.0, chat_burst=1.0, workers=0,
+                                  clock=lambda: now[0])
+    for chat_id in range(1000):
+        now[0] += 0.01
+        scheduler._chat_bucket(chat_id, now[0]).consume(now[0])
+    # вытесняются только полные bucket'ы: за последнюю секунду (100 чатов) — ещё нет
+    assert 100 <= len(scheduler._chats) <= 200
+    assert all(chat_id in scheduler._chats for chat_id in range(900, 1000))
+
+
+def test_429_retry_resends_upload_from_the_start(api):
+    bodies = []
+    api.on_call = lambda method, params, t: bodies.append(params.get("document"))
+    api.rate_429 = 1.0
+    bot = TeleBot("123456:test", threaded=False)
+
+    def call(method, args, kw):
+        try:
+            return getattr(bot, method)(*args, **kw)
+        finally:
+            api.rate_429 = 0.0  # 429 только на первую попытку
+
+    scheduler = OutboundScheduler(call)
+    doc = io.BytesIO(b"slow handlers dump")
+    doc.name = "dump.txt"
+    scheduler.call("send_document", 1, doc)
+    scheduler.stop()
+    assert api.injected_429 == 1
+    assert bodies == ["slow handlers dump"]
+
+
+class _Limited(Exception):
+    error_code = 429
+    result_json = {"parameters": {"retry_after": 0.1}}
+
+
+def _edit_scheduler(on_call):
+    sent = []
+
+    def call(method, args, kw):
+        sent.append(args[0])
+        return on_call(args[0])
+
+    return OutboundScheduler(call, workers=1), sent
+
+
+def test_retried_edit_is_dropped_when_newer_edit_is_queued():
+    scheduler = None
+
+    def on_call(text):
+        if text == "old":
+            # пока старый edit в сети, хендлер уже поставил новый
+            scheduler.submit("edit_message_text", ("new", 1, 10))
+            raise _Limited()
+        return text
+
+    scheduler, sent = _edit_scheduler(on_call)
+    old = scheduler.submit("edit_message_text", ("old", 1, 10))
+    assert old.result(timeout=10) == "new"
+    scheduler.stop()
+    assert sent == ["old", "new"]
+
+
+def test_newer_edit_coalesces_into_pending_retry():
+    scheduler = None
+    retried = threading.Event()
+
+    def on_call(text):
+        if not retried.is_set():
+            retried.set()
+            raise _Limited()
+        return text
+
+    scheduler, sent = _edit_scheduler(on_call)
+    old = scheduler.submit("edit_message_text", ("old", 1, 10))
+    retried.wait(5)
+    time.sleep(0.02)
+    new = scheduler.submit("edit_message_text", ("new", 1, 10))
+    assert (old.result(timeout=10), new.result(timeout=10)) == ("new", "new")
+    scheduler.stop()
+    assert sent == ["old", "new"]
+    assert scheduler.stats()["coalesced"] == 1
+
+
+def test_nonblocking_call_keeps_more_requests_in_flight_than_workers():
+    from concurrent.futures import Future
+
+    requests = []
+    lock = threading.Lock()
+
+    def call(method, args, kw):
+        fut = Future()
+        with lock:
+            requests.append((args[0], fut))
+        return fut
+
+    scheduler = OutboundScheduler(call, workers=1, nonblocking=True)
+    futures = [scheduler.submit("send_message", (chat_id, "hi")) for chat_id in range(5)]
+    deadline = time.monotonic() + 5
+    while len(requests) < 5 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    # один поток-отправитель, а в полёте все пять
+    assert sorted(chat_id for chat_id, _ in requests) == list(range(5))
+    chat_id, first = requests[0]
+    first.set_exception(_Limited())
+    for _, fut in requests[1:]:
+        fut.set_result("ok")
+    while len(requests) < 6 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    requests[5][1].set_result("retried")
+    assert futures[chat_id].result(timeout=5) == "retried"
+    assert [f.result(timeout=5) for i, f in enumerate(futures) if i != chat_id] == ["ok"] * 4
+    scheduler.stop()
+    assert scheduler.stats()["retried_429"] == 1
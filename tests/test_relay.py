@@ -0,0 +1,25 @@
+from app.relay import Relay
+
+
+def test_reply_misses_are_cached_and_routes_are_bounded():
+    now = [0.0]
+    lookups = []
+    relay = Relay(max_reply_routes=3, miss_ttl=60, clock=lambda: now[0])
+
+    def resolve(chat_id, message_id):
+        lookups.append(message_id)
+        return (chat_id, 99, 0) if message_id >= 100 else None
+
+    relay.resolve_reply = resolve
+    # реплай на обычное сообщение бота: история читается один раз, дальше — из памяти
+    assert relay.for_reply(1, 5) is None
+    assert relay.known_reply(1, 5)
+    assert relay.for_reply(1, 5) is None
+    assert lookups == [5]
+    now[0] += 61
+    assert not relay.known_reply(1, 5)
+
+    for message_id in range(100, 110):
+        assert relay.for_reply(1, message_id).seller_id == 99
+    assert len(relay._replies) == 3
+    assert relay.known_reply(1, 109) and not relay.known_reply(1, 100)
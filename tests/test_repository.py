@@ -0,0 +1,141 @@
+import threading
+import time
+
+from app.storage.backends import MemoryBackend
+from app.storage.repository import UserRepository
+
+
+class SlowBackend(MemoryBackend):
+    def __init__(self):
+        super().__init__()
+        self.saving = threading.Event()
+        self.release = threading.Event()
+        self.loads = 0
+
+    def save_users(self, users):
+        users = list(users)
+        self.saving.set()
+        self.release.wait(5)
+        super().save_users(users)
+
+    def load_user(self, user_id):
+        self.loads += 1
+        return super().load_user(user_id)
+
+
+def test_change_in_flight_survives_eviction_and_reload():
+    backend = SlowBackend()
+    repo = UserRepository(backend, cache_size=1, flush_interval=0)
+    backend.release.set()
+    repo.get(1)
+    repo.flush()
+    backend.saving.clear()
+    backend.release.clear()
+
+    repo.update(1, lambda u: setattr(u, "is_seller", True))
+    flusher = threading.Thread(target=repo.flush)
+    flusher.start()
+    assert backend.saving.wait(5)
+    repo.get(2)  # вытеснил бы пользователя 1, пока его изменение пишется
+    assert repo.get(1).is_seller
+    repo.update(1, lambda u: setattr(u, "balance", 5))
+    backend.release.set()
+    flusher.join()
+    repo.flush()
+
+    stored = backend.load_user(1)
+    assert stored.is_seller and stored.balance == 5
+
+
+def test_dirty_users_are_not_evicted():
+    backend = MemoryBackend()
+    repo = UserRepository(backend, cache_size=2, flush_interval=0)
+    first = repo.update(1, lambda u: setattr(u, "balance", 7))
+    for uid in range(2, 10):
+        repo.get(uid)
+    assert repo.get(1) is first
+    repo.flush()
+    assert backend.load_user(1).balance == 7
+
+
+def test_cache_misses_do_not_hold_the_lock():
+    class Blocking(MemoryBackend):
+        gate = threading.Event()
+
+        def load_user(self, user_id):
+            if user_id == 1:
+                self.gate.wait(5)
+            return super().load_user(user_id)
+
+    backend = Blocking()
+    repo = UserRepository(backend, flush_interval=0)
+    slow = threading.Thread(target=repo.get, args=(1,))
+    slow.start()
+    time.sleep(0.05)
+    started = time.perf_counter()
+    repo.get(2)  # не ждёт медленный промах по другому пользователю
+    assert time.perf_counter() - started < 1
+    Blocking.gate.set()
+    slow.join()
+    assert repo.get(1) is repo.get(1)
+
+
+def test_blocked_flag_from_another_process_keeps_owner_fields(tmp_path):
+    from app.storage.backends import SqliteBackend
+
+    backend = SqliteBackend(str(tmp_path / "bot.db"))
+    owner = UserRepository(backend, flush_interval=0)
+    other = UserRepository(backend, flush_interval=0)  # воркер админа, ведущий рассылку
+    owner.update(1, lambda u: setattr(u, "balance", 50))
+    owner.flush()
+    other.get(1)
+
+    other.set_blocked(1, True)
+    other.flush()
+    assert backend.load_user(1).balance == 50
+    # запись владельца с устаревшей копией флага не снимает пометку
+    owner.update(1, lambda u: setattr(u, "balance", 70))
+    owner.flush()
+    stored = backend.load_user(1)
+    assert (stored.balance, stored.is_blocked) == (70, True)
+    assert backend.load_user_ids(0, 10) == []
+
+
+def test_start_clears_blocked_flag_set_by_another_worker(tmp_path, monkeypatch):
+    from app import storage
+    from app.storage.backends import SqliteBackend
+
+    backend = SqliteBackend(str(tmp_path / "bot.db"))
+    owner = UserRepository(backend, flush_interval=0)
+    broadcaster = UserRepository(backend, flush_interval=0)  # рассылка идёт с воркера админа
+    owner.get(1)
+    owner.flush()
+    broadcaster.set_blocked(1, True)
+    assert owner.get(1).is_blocked is False  # копия владельца о пометке не знает
+
+    monkeypatch.setattr(storage, "_repo", owner)
+    storage.touch_user(1)
+    assert backend.load_user(1).is_blocked is False
+    assert backend.load_user_ids(0, 10) == [1]
+
+
+def test_released_connection_goes_to_the_waiting_thread():
+    from app.storage.pool import ConnectionPool
+
+    pool = ConnectionPool(object, max_size=1, timeout=5)
+    order = []
+
+    def waiter():
+        with pool.connection():
+            order.append("waiter")
+            time.sleep(0.05)
+
+    with pool.connection():
+        t = threading.Thread(target=waiter)
+        t.start()
+        time.sleep(0.05)
+    # соединение только что вернули — но его уже ждут, вне очереди не берём
+    with pool.connection():
+        order.append("newcomer")
+    t.join()
+    assert order == ["waiter", "newcomer"]
@@ -0,0 +1,114 @@
+import threading
+import time
+from collections import Counter
+
+from app.loadtest.bench import make_runner
+
+
+def _message(update_id, user_id):
+    return {"update_id": update_id, "message": {"from": {"id": user_id}, "chat": {"id": user_id}}}
+
+
+def test_killed_worker_loses_no_updates():
+    done = Counter()
+    lock = threading.Lock()
+
+    def on_done(update_id):
+        with lock:
+            done[update_id] += 1
+
+    runner = make_runner(workers=2, lanes=2, lane_queue_size=5, delay=0.002, queue_size=20, on_done=on_done)
+    runner.start()
+    try:
+        peak = 0
+        for update_id in range(1, 601):
+            assert runner.dispatch(_message(update_id, update_id % 37))
+            peak = max(peak, runner.in_flight())
+            if update_id == 300:
+                runner.procs[0].kill()
+        deadline = time.time() + 60
+        while runner.in_flight() and time.time() < deadline:
+            runner.check_health()
+            for i in range(runner.workers):
+                runner._flush_resend(i)
+            time.sleep(0.05)
+    finally:
+        runner.stop()
+        runner.drain()
+    assert sum(runner.restarts) == 1
+    assert set(done) == set(range(1, 601))
+    assert max(done.values()) == 1
+    # inbox + очереди дорожек + по апдейту в работе на дорожку, на каждый воркер
+    assert peak <= 2 * (20 + 2 * 5 + 2) + 1
+
+
+def test_stuck_lane_restarts_worker_and_drops_poison_update():
+    done = []
+    runner = make_runner(workers=1, lanes=2, lane_queue_size=5, delay=30.0, health_timeout=1.0,
+                         on_done=done.append)
+    runner.max_redeliveries = 1
+    runner.start()
+    try:
+        runner.dispatch(_message(1, 1))
+        deadline = time.time() + 60
+        while runner.in_flight() and time.time() < deadline:
+            runner.check_health()
+            runner._flush_resend(0)
+            time.sleep(0.1)
+    finally:
+        runner.stop()
+        runner.drain(timeout=1)
+    # хендлер висит: heartbeat его дорожки устаревает, воркер перезапускается, после повтора апдейт отброшен
+    assert runner.restarts == [2]
+    assert done == [1]
+
+
+def _poll(runner, monkeypatch, updates, until):
+    # getUpdates отдаёт updates один раз, дальше пусто; останавливаем runner, когда until() истинно
+    from app import shard
+
+    batches = [updates]
+
+    def get_updates(token, offset=None, limit=None, timeout=None, long_polling_timeout=None):
+        if until():
+            runner.stop()
+        time.sleep(0.05)
+        return batches.pop() if batches else []
+
+    monkeypatch.setattr(shard.apihelper, "get_updates", get_updates)
+
+
+def test_checkpoint_waits_for_worker_acks(tmp_path, monkeypatch):
+    from app.ingest import UpdateCheckpoint
+
+    path = str(tmp_path / "offset.json")
+    crashed = make_runner(workers=1, lanes=2, lane_queue_size=5, delay=30.0)
+    started = time.time()
+
+    def crash():
+        if time.time() - started < 1:
+            return False
+        crashed.procs[0].kill()
+        return True
+
+    _poll(crashed, monkeypatch, [_message(i, i) for i in range(1, 4)], crash)
+    crashed.run_polling(checkpoint=UpdateCheckpoint(path), poll_timeout=0)
+    # воркер упал, не подтвердив ни одного апдейта: после рестарта все три обрабатываются заново
+    resumed = UpdateCheckpoint(path)
+    assert [raw["update_id"] for raw in resumed.pending()] == [1, 2, 3]
+
+    done = []
+    runner = make_runner(workers=1, lanes=2, lane_queue_size=5, delay=0.001)
+    _poll(runner, monkeypatch, [_message(i, i) for i in range(4, 6)], lambda: len(done) == 5)
+    checkpoint = UpdateCheckpoint(path)
+    finish = checkpoint.finish
+
+    def on_done(update_id):
+        finish(update_id)
+        done.append(update_id)
+
+    checkpoint.finish = on_done
+    runner.run_polling(checkpoint=checkpoint, poll_timeout=0)
+    assert sorted(done) == [1, 2, 3, 4, 5]
+    assert UpdateCheckpoint(path).pending() == []
+    assert UpdateCheckpoint(path).offset == 6
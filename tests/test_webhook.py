@@ -0,0 +1,106 @@
+import http.client
+import json
+import threading
+import time
+
+import pytest
+from telebot import TeleBot, apihelper
+
+from app.loadtest.fake_api import FakeBotApi
+from app.webhook import SECRET_HEADER, WebhookServer
+
+SECRET = "s3cret"
+
+
+@pytest.fixture
+def api(monkeypatch):
+    replies = []
+    server = FakeBotApi(on_call=lambda method, params, t: replies.append((int(params["chat_id"]), params["text"])))
+    server.start()
+    monkeypatch.setattr(apihelper, "API_URL", server.api_url)
+    yield replies
+    server.stop()
+
+
+def _serve(bot, **kwargs):
+    server = WebhookServer(bot, "127.0.0.1", 0, "/telegram", SECRET, **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _post(server, body: bytes, secret: str = SECRET, headers: dict = None):
+    conn = http.client.HTTPConnection(*server.server_address[:2], timeout=10)
+    conn.putrequest("POST", "/telegram")
+    for name, value in {SECRET_HEADER: secret, "Content-Length": str(len(body)), **(headers or {})}.items():
+        conn.putheader(name, value)
+    conn.endheaders(body)
+    resp = conn.getresponse()
+    resp.read()
+    conn.close()
+    return resp.status, resp.getheader("Retry-After")
+
+
+def _update(update_id: int, user_id: int, text: str) -> bytes:
+    return json.dumps({"update_id": update_id, "message": {
+        "message_id": update_id, "date": 0, "text": text,
+        "from": {"id": user_id, "is_bot": False, "first_name": "u"},
+        "chat": {"id": user_id, "type": "private"},
+    }}).encode()
+
+
+def _echo_bot(before_reply=lambda text: None):
+    bot = TeleBot("123456:test", threaded=False)
+
+    @bot.message_handler(func=lambda m: True)
+    def echo(m):
+        before_reply(m.text)
+        bot.send_message(m.chat.id, m.text)
+
+    return bot
+
+
+def _wait(predicate, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_updates_of_one_user_are_processed_in_order(api):
+    # первый шаг каждого пользователя медленный: без дорожек второй обогнал бы его в соседнем воркере
+    server = _serve(_echo_bot(lambda text: time.sleep(0.2) if text == "step 1" else None), workers=4)
+    update_id = 0
+    for step in (1, 2, 3):
+        for user_id in range(10, 16):
+            update_id += 1
+            assert _post(server, _update(update_id, user_id, f"step {step}"))[0] == 200
+    _wait(lambda: len(api) == update_id)
+    server.stop()
+    for user_id in range(10, 16):
+        assert [text for chat, text in api if chat == user_id] == ["step 1", "step 2", "step 3"]
+
+
+def test_wrong_secret_is_rejected(api):
+    server = _serve(_echo_bot())
+    assert _post(server, _update(1, 10, "hi"), secret="guess")[0] == 403
+    assert _post(server, _update(2, 10, "hi"), headers={"Content-Length": "many"})[0] == 400
+    server.stop()
+    assert api == []
+
+
+def test_full_queue_answers_503(api):
+    entered, release = threading.Event(), threading.Event()
+
+    def block(text):
+        entered.set()
+        release.wait(10)
+
+    server = _serve(_echo_bot(block), workers=1, queue_size=1)
+    assert _post(server, _update(1, 10, "busy"))[0] == 200
+    entered.wait(5)
+    assert _post(server, _update(2, 10, "queued"))[0] == 200
+    # очередь воркера полна — Telegram должен повторить доставку позже
+    assert _post(server, _update(3, 10, "rejected")) == (503, "1")
+    release.set()
+    _wait(lambda: len(api) == 2)
+    server.stop()
+    assert [text for _, text in api] == ["busy", "queued"]